@@ -0,0 +1,10 @@
+"""
+Benchmarks of the kernels, plots and animation pipeline.
+
+Benchmarks follow the conventions of asv (airspeed velocity): classes in
+``bench_*.py`` modules with ``time_*`` methods, optional ``setup`` and
+``teardown`` methods, and ``params`` with ``param_names``. A setup raising
+``NotImplementedError`` skips the benchmark. Run them with
+``python -m benchmarks`` (``make benchmark``), which appends the results to
+a JSON lines history and reports regressions from the previous run.
+"""
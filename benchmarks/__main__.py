@@ -0,0 +1,179 @@
+import importlib
+import inspect
+import itertools
+import json
+import platform
+import re
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import numba
+import numpy as np
+import typer
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+HISTORY_FILE = BENCHMARKS_DIR.joinpath("results", "history.jsonl")
+
+# Minimum duration of a timing sample, repeating fast calls to reach it
+SAMPLE_TIME = 0.1
+
+
+def _param_sets(cls) -> list:
+    params = getattr(cls, "params", [])
+
+    if not params:
+        return [()]
+
+    if len(getattr(cls, "param_names", [])) <= 1:
+        return [(value,) for value in params]
+
+    return list(itertools.product(*params))
+
+
+def _benchmarks(pattern: str) -> Iterator[Tuple[str, type, str, tuple]]:
+    for path in sorted(BENCHMARKS_DIR.glob("bench_*.py")):
+        module = importlib.import_module(f"benchmarks.{path.stem}")
+
+        for cls_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+
+            for method in sorted(dir(cls)):
+                if not method.startswith("time_"):
+                    continue
+
+                for params in _param_sets(cls):
+                    args = ", ".join(map(repr, params))
+                    name = f"{path.stem}.{cls_name}.{method}({args})"
+
+                    if re.search(pattern, name):
+                        yield name, cls, method, params
+
+
+def _time(cls, method: str, params: tuple, repeat: int) -> Optional[float]:
+    """Minimum time of a call, or None if the benchmark is skipped."""
+    benchmark = cls()
+
+    try:
+        if hasattr(benchmark, "setup"):
+            benchmark.setup(*params)
+    except NotImplementedError:
+        return None
+
+    function = getattr(benchmark, method)
+
+    try:
+        function(*params)  # Warm up, e.g. compile numba functions
+
+        number = 1
+        samples = []
+
+        while len(samples) < repeat:
+            start = time.perf_counter()
+
+            for _ in range(number):
+                function(*params)
+
+            elapsed = time.perf_counter() - start
+
+            if elapsed < SAMPLE_TIME and not samples:
+                number *= 2
+                continue
+
+            samples.append(elapsed / number)
+    finally:
+        if hasattr(benchmark, "teardown"):
+            benchmark.teardown(*params)
+
+    return min(samples)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=BENCHMARKS_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _previous(history: Path, machine: str) -> Dict[str, float]:
+    """Results of the last run on `machine`."""
+    results = {}
+
+    if history.exists():
+        for line in history.read_text().splitlines():
+            record = json.loads(line)
+
+            if record["machine"] == machine:
+                results = record["results"]
+
+    return results
+
+
+def main(
+    pattern: str = typer.Argument(
+        "", help="Regular expression filtering benchmark names"
+    ),
+    repeat: int = typer.Option(5, help="Number of timing samples"),
+    threshold: float = typer.Option(
+        1.25, help="Slowdown ratio from the previous run that is a regression"
+    ),
+    history: Path = typer.Option(HISTORY_FILE, help="JSON lines history"),
+    save: bool = typer.Option(True, help="Append the results to `history`"),
+):
+    """Run the benchmarks and compare them with the previous run."""
+    machine = platform.node()
+    previous = _previous(history, machine)
+    results, regressions = {}, []
+
+    for name, cls, method, params in _benchmarks(pattern):
+        seconds = _time(cls, method, params, repeat)
+
+        if seconds is None:
+            typer.echo(f"{name:<80} skipped")
+            continue
+
+        results[name] = seconds
+        line = f"{name:<80} {seconds * 1e3:10.3f} ms"
+
+        if name in previous:
+            ratio = seconds / previous[name]
+            line += f" {ratio:6.2f}x"
+
+            if ratio > threshold:
+                regressions.append(name)
+                line += " REGRESSION"
+
+        typer.echo(line)
+
+    if save and results:
+        record = {
+            "timestamp": time.time(),
+            "commit": _commit(),
+            "machine": machine,
+            "python": platform.python_version(),
+            "numba": numba.__version__,
+            "numpy": np.__version__,
+            "threads": numba.config.NUMBA_NUM_THREADS,
+            "results": results,
+        }
+
+        history.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(history, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    if regressions:
+        typer.echo(f"{len(regressions)} regressions above {threshold}x")
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,116 @@
+import importlib.util
+import shutil
+import tempfile
+from pathlib import Path
+
+import imageio
+import numpy as np
+
+from src import compute_mandelbrot
+from src.colorize import colorize, palette_index
+from src.gif import GIF_COLORS
+from src.png import write_png
+from src.utils import animate, cmap_lut, linear_cmap
+
+N_FRAMES = 60
+
+# Tools needed by `animate` for each output format
+ENCODERS = {".gif": "gifsicle", ".mp4": "ffmpeg"}
+
+
+def _has_encoder(suffix):
+    if suffix == ".mp4":
+        return importlib.util.find_spec("imageio_ffmpeg") is not None
+
+    return shutil.which(ENCODERS[suffix]) is not None
+
+
+class Colorize:
+    params = [400, 1200]
+    param_names = ["number_points"]
+
+    def setup(self, number_points):
+        self.lut = cmap_lut(linear_cmap("ultra", N=4096))
+        self.norm = np.empty((number_points, number_points))
+        self.count = compute_mandelbrot(
+            200, number_points=number_points, norm=self.norm
+        )
+
+    def time_colorize(self, number_points):
+        colorize(self.count, self.lut, norm=self.norm, max_iter=200)
+
+
+class Animate:
+    """Encoding of `N_FRAMES` frames, from arrays or from PNG files."""
+
+    params = (list(ENCODERS), ["arrays", "png"])
+    param_names = ["suffix", "source"]
+    timeout = 300
+
+    def setup(self, suffix, source):
+        if not _has_encoder(suffix):
+            raise NotImplementedError(f"{ENCODERS[suffix]} is not installed")
+
+        self.dir = Path(tempfile.mkdtemp())
+        self.output_file = self.dir.joinpath("animation").with_suffix(suffix)
+
+        lut = cmap_lut(linear_cmap("ultra", N=4096))
+        self.frames = [
+            colorize(
+                compute_mandelbrot(
+                    200, -1.4177, 1.025**i, number_points=400
+                ),
+                lut,
+            )
+            for i in range(N_FRAMES)
+        ]
+
+        for i, frame in enumerate(self.frames):
+            imageio.imwrite(self.dir.joinpath(f"{i:03}.png"), frame)
+
+    def teardown(self, suffix, source):
+        shutil.rmtree(self.dir)
+
+    def time_animate(self, suffix, source):
+        frames = self.dir if source == "png" else iter(self.frames)
+        animate(frames, self.output_file, pause=10)
+
+
+class AnimatePalette:
+    """
+    GIF of `N_FRAMES` frames of palette indices, written without
+    quantization nor gifsicle, from arrays or from indexed PNG files.
+    """
+
+    params = ["arrays", "png"]
+    param_names = ["source"]
+
+    def setup(self, source):
+        self.dir = Path(tempfile.mkdtemp())
+        self.output_file = self.dir.joinpath("animation.gif")
+
+        self.palette = cmap_lut(linear_cmap("ultra", N=GIF_COLORS))
+        self.frames = [
+            palette_index(
+                compute_mandelbrot(
+                    200, -1.4177, 1.025**i, number_points=400
+                ),
+                GIF_COLORS,
+            )
+            for i in range(N_FRAMES)
+        ]
+
+        for i, frame in enumerate(self.frames):
+            write_png(
+                self.dir.joinpath(f"{i:03}.png"),
+                [frame],
+                *frame.shape[::-1],
+                palette=self.palette,
+            )
+
+    def teardown(self, source):
+        shutil.rmtree(self.dir)
+
+    def time_animate(self, source):
+        frames = self.dir if source == "png" else iter(self.frames)
+        animate(frames, self.output_file, pause=10, palette=self.palette)
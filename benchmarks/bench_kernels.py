@@ -0,0 +1,203 @@
+import numba
+import numpy as np
+
+from src.compute import (
+    _apply_smoothing,
+    _create_grid,
+    _logistic_map,
+    _set_limits,
+    compute_julia,
+    compute_julia_batch,
+    compute_mandelbrot,
+)
+from src.formulas import FORMULAS
+from src.state import RenderState
+
+# Views whose points mostly stay bounded, mostly lie near the boundary, or
+# mostly escape within a few iterations
+VIEWS = {
+    "interior": (-0.1, 4),
+    "boundary": (-0.743643887037158 + 0.131825904205312j, 1000),
+    "exterior": (1.5 + 1.5j, 2),
+}
+
+
+class LogisticMap:
+    """Reference kernel, with and without the interior checks."""
+
+    params = (list(VIEWS), [200, 600], [100, 1000], [False, True])
+    param_names = ["view", "number_points", "max_iter", "interior_check"]
+
+    def setup(self, view, number_points, max_iter, interior_check):
+        center, zoom = VIEWS[view]
+        xlim, ylim = _set_limits(center, zoom)
+
+        self.c = _create_grid(xlim, ylim, number_points)
+        self.z = np.zeros_like(self.c)
+        self.count = np.zeros(self.c.shape, dtype=float)
+
+    def time_logistic_map(self, view, number_points, max_iter, interior_check):
+        self.z[:] = 0
+        self.count[:] = 0
+
+        _logistic_map(
+            self.z,
+            self.c,
+            self.count,
+            max_iter,
+            interior_check,
+            interior_check,
+        )
+
+
+class ComputeMandelbrot:
+    """Default engine of `compute_mandelbrot`."""
+
+    params = (list(VIEWS), [200, 600], [100, 1000], [False, True])
+    param_names = ["view", "number_points", "max_iter", "adaptive"]
+
+    def setup(self, view, number_points, max_iter, adaptive):
+        self.center, self.zoom = VIEWS[view]
+        self.out = np.empty((number_points, number_points))
+
+    def time_compute_mandelbrot(self, view, number_points, max_iter, adaptive):
+        compute_mandelbrot(
+            max_iter,
+            self.center,
+            self.zoom,
+            number_points,
+            adaptive=adaptive,
+            out=self.out,
+        )
+
+
+class Formulas:
+    """Registered formulas, over views of their whole sets."""
+
+    params = (list(FORMULAS), [200, 600])
+    param_names = ["formula", "number_points"]
+
+    def setup(self, formula, number_points):
+        self.out = np.empty((number_points, number_points))
+
+    def time_compute_mandelbrot(self, formula, number_points):
+        compute_mandelbrot(
+            200,
+            0,
+            0.75,
+            number_points,
+            formula=formula,
+            out=self.out,
+        )
+
+
+class JuliaBatch:
+    """Julia sets along a circle, one call each or in one batched call."""
+
+    params = ([16, 64], [100, 400])
+    param_names = ["batch", "number_points"]
+
+    def setup(self, batch, number_points):
+        self.c = 0.7885 * np.exp(1j * np.linspace(0, 2 * np.pi, batch))
+        self.out = np.empty((batch, number_points, number_points))
+
+    def time_compute_julia(self, batch, number_points):
+        for c, out in zip(self.c, self.out):
+            compute_julia(c, number_points=number_points, out=out)
+
+    def time_compute_julia_batch(self, batch, number_points):
+        compute_julia_batch(self.c, number_points=number_points, out=self.out)
+
+
+class ThreadScaling:
+    """Boundary view with a limited number of numba threads."""
+
+    params = [1, 2, 4, 8, 16]
+    param_names = ["threads"]
+
+    def setup(self, threads):
+        if threads > numba.config.NUMBA_NUM_THREADS:
+            raise NotImplementedError("Not enough threads")
+
+        self.default_threads = numba.get_num_threads()
+        numba.set_num_threads(threads)
+
+    def teardown(self, threads):
+        numba.set_num_threads(self.default_threads)
+
+    def time_compute_mandelbrot(self, threads):
+        compute_mandelbrot(1000, *VIEWS["boundary"], number_points=600)
+
+
+class Supersampling:
+    """Smoothed views with jittered samples of the pixels at edges."""
+
+    params = (list(VIEWS), [1, 4, 8])
+    param_names = ["view", "supersampling"]
+
+    def setup(self, view, supersampling):
+        self.center, self.zoom = VIEWS[view]
+        self.out = np.empty((600, 600))
+
+    def time_compute_mandelbrot(self, view, supersampling):
+        compute_mandelbrot(
+            1000,
+            self.center,
+            self.zoom,
+            600,
+            smoothing=True,
+            out=self.out,
+            supersampling=supersampling,
+        )
+
+
+class Resume:
+    """Boundary view rendered with 1000 iterations, then with `max_iter`."""
+
+    params = [2000, 10000]
+    param_names = ["max_iter"]
+
+    def setup(self, max_iter):
+        self.out = np.empty((600, 600))
+
+    def time_compute_mandelbrot(self, max_iter):
+        compute_mandelbrot(1000, *VIEWS["boundary"], 600, out=self.out)
+        compute_mandelbrot(max_iter, *VIEWS["boundary"], 600, out=self.out)
+
+    def time_render_state(self, max_iter):
+        state = RenderState(*VIEWS["boundary"], 600).iterate(1000)
+        state.iterate(max_iter).field()
+
+
+class Symmetry:
+    """
+    Views centered on the axis of symmetry of the sets, whose halves are
+    mirrored, and the same views a quarter of a pixel away, which are not.
+    """
+
+    params = ["centered", "shifted"]
+    param_names = ["view"]
+
+    def setup(self, view):
+        self.shift = 0 if view == "centered" else 0.75j / 599
+        self.out = np.empty((600, 600))
+
+    def time_compute_mandelbrot(self, view):
+        compute_mandelbrot(500, -0.5 + self.shift, 1, 600, out=self.out)
+
+    def time_compute_julia(self, view):
+        compute_julia(-0.8 + 0.156j, self.shift, 500, 1, 600, out=self.out)
+
+
+class Smoothing:
+    params = [200, 600, 1200]
+    param_names = ["number_points"]
+
+    def setup(self, number_points):
+        self.norm = np.empty((number_points, number_points))
+        self.count = compute_mandelbrot(
+            200, number_points=number_points, norm=self.norm
+        )
+
+    def time_apply_smoothing(self, number_points):
+        _apply_smoothing(self.count, self.norm, 200)
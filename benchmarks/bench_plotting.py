@@ -0,0 +1,25 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+from src import plot_julia, plot_mandelbrot  # noqa: E402
+
+
+class PlotSets:
+    """Plots end to end, from the computation to a drawn figure."""
+
+    params = ([200, 600], [False, True])
+    param_names = ["number_points", "smoothing"]
+
+    def teardown(self, number_points, smoothing):
+        plt.close("all")
+
+    def time_plot_mandelbrot(self, number_points, smoothing):
+        fig = plot_mandelbrot(number_points=number_points, smoothing=smoothing)
+        fig.canvas.draw()
+
+    def time_plot_julia(self, number_points, smoothing):
+        fig = plot_julia(-1, number_points=number_points, smoothing=smoothing)
+        fig.canvas.draw()
@@ -1,10 +1,526 @@
+import atexit
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from multiprocessing import cpu_count, get_context
+from multiprocessing.pool import Pool
 from pathlib import Path
+from threading import Event, Semaphore
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+import numpy as np
 import typer
 
+from cli import farm
+
 PROJECT_DIR = Path(__file__).resolve().parents[1]
 IMAGES_DIR = PROJECT_DIR.joinpath("images")
 STATIC_IMG_DIR = IMAGES_DIR.joinpath("static")
 ANIMATED_IMG_DIR = IMAGES_DIR.joinpath("animated")
 
-ARGS = {"multiprocess": typer.Option(True, help="Spawn parallel processes")}
+ARGS = {
+    "multiprocess": typer.Option(True, help="Spawn parallel processes"),
+    "processes": typer.Option(
+        None, help="Number of processes, by default one per core"
+    ),
+    "threads": typer.Option(
+        None, help="Number of numba threads per process, by default the rest"
+    ),
+    "resume": typer.Option(
+        True, help="Skip frames already saved with the same parameters"
+    ),
+    "farm": typer.Option(
+        None,
+        help="Shared directory to queue frames in, for `worker` processes "
+        "on this or other nodes",
+    ),
+    "force": typer.Option(
+        False,
+        help="With --farm, replace the previous job even if workers are "
+        "still rendering its frames",
+    ),
+    "keyframes": typer.Option(
+        False, help="Resample frames from keyframes rendered every 2x zoom"
+    ),
+    "stats": typer.Option(
+        None,
+        help="File to save per-frame render statistics to, as JSON or CSV "
+        "if it ends with .csv",
+    ),
+    "cmap": typer.Option("ultra", help="Colormap name in `src.utils.CMAPS`"),
+    "cache": typer.Option(
+        False,
+        help="Keep fields on disk, so that rendering again with another "
+        "--cmap recolors the frames without computing them",
+    ),
+    "cache_size": typer.Option(
+        None,
+        help="Maximum size of the field cache in GiB, by default enough for "
+        "all the fields of the animation",
+    ),
+    "fast": typer.Option(
+        False, help="Color frames directly to pixels, without plot axes"
+    ),
+    "supersampling": typer.Option(
+        1,
+        help="Number of jittered samples averaged for the pixels at the "
+        "edges of the set, to reduce aliasing",
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def setup_plot_style():
+    """Set the plot style of animation frames, once per process."""
+    from src.utils import set_plot_style
+
+    set_plot_style(font="Merriweather")
+
+
+def set_num_threads(threads: int):
+    """Set the number of numba threads, importing numba only to render."""
+    import numba
+
+    numba.set_num_threads(threads)
+
+
+def size_cache(cache_size: Optional[float], n_fields: int, number_points: int):
+    """
+    Set the size limit of the field cache of this process and of its pools
+    to `cache_size` GiB, or by default to the size of the `n_fields` fields
+    of an animation, so that none is evicted before it is recolored. Only
+    called when the cache is enabled, as it may take several GiB.
+    """
+    from src.cache import default_cache, set_cache_size
+
+    # Fields are stored with their norms, see `src.cache.FieldCache`
+    field_bytes = 2 * np.dtype(np.float64).itemsize * number_points**2
+    needed = n_fields * field_bytes
+
+    if cache_size is None:
+        max_bytes = max(needed, default_cache().max_bytes)
+    else:
+        max_bytes = int(cache_size * 2**30)
+
+    set_cache_size(max_bytes)
+
+    if needed > max_bytes:
+        typer.echo(
+            f"The {n_fields} fields take {needed / 2**30:.1f} GiB, more than "
+            "the field cache keeps, raise --cache-size to reuse them all"
+        )
+
+
+def plan_workers(
+    multiprocess: bool = True,
+    processes: Optional[int] = None,
+    threads: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Number of processes and of numba threads per process to render frames.
+
+    Unless given, frames are rendered by one single-threaded process per
+    core, as whole frames are cheaper to parallelize than their rows. When
+    only one of them is given, the other fills the remaining cores.
+    """
+    import numba
+
+    cores = cpu_count()
+
+    if not multiprocess:
+        processes = 1
+    elif processes is None:
+        processes = cores if threads is None else max(1, cores // threads)
+
+    if threads is None:
+        threads = max(1, cores // processes)
+
+    return processes, min(threads, numba.config.NUMBA_NUM_THREADS)
+
+
+class FrameManifest:
+    """
+    Record of the frames saved in a directory, to resume interrupted renders.
+
+    Frames are identified by a hash of their arguments and of the source of
+    the module rendering them, so that editing a script renders again.
+
+    Parameters
+    ----------
+    path : Path
+        JSON file of the record, e.g. ``png_dir.joinpath("manifest.json")``.
+    save_plot : callable
+        Function saving the frames.
+    reset : bool, default False
+        If True, forget the frames recorded before.
+    version : str, optional
+        Version of the code rendering the frames. By default, a hash of the
+        source of the module of `save_plot`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        save_plot: Callable,
+        reset: bool = False,
+        version: Optional[str] = None,
+    ):
+        self.path = path
+        self.frames = {}
+
+        if path.exists() and not reset:
+            self.frames = json.loads(path.read_text())
+
+        if version is None:
+            source = inspect.getsource(sys.modules[save_plot.__module__])
+            version = hashlib.sha1(source.encode()).hexdigest()
+
+        self._version = version
+
+    def key(self, args: tuple) -> str:
+        """Hash of the arguments of a frame."""
+        digest = hashlib.sha1(self._version.encode())
+
+        for arg in args:
+            if isinstance(arg, np.ndarray):
+                digest.update(np.ascontiguousarray(arg).tobytes())
+            else:
+                digest.update(repr(arg).encode())
+
+        return digest.hexdigest()
+
+    def is_saved(self, output: Path, key: str) -> bool:
+        """Whether `output` exists and was saved with `key`."""
+        return self.frames.get(output.name) == key and output.exists()
+
+    def add(self, output: Path, key: str):
+        self.frames[output.name] = key
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.frames, indent=0, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+
+def keyframe_key(args: tuple, field: int = 2) -> tuple:
+    """
+    Arguments of a frame resampled from keyframes identifying it in a
+    `FrameManifest`, with its field, at index `field`, replaced by a marker.
+    Frames are then matched before their keyframes are computed.
+    """
+    args = list(args)
+    args[field] = "keyframes"
+
+    return tuple(args)
+
+
+def resample_pending(
+    frame_args: Sequence[tuple],
+    manifest: FrameManifest,
+    resample: Callable[[List[int]], Iterator[np.ndarray]],
+    cost: Optional[Callable[..., float]] = None,
+    field: int = 2,
+    output: int = 1,
+) -> Iterator[tuple]:
+    """
+    Yield `frame_args` with the fields of the frames not saved in `manifest`
+    set at index `field`, resampled from keyframes, so that resumed renders
+    skip the saved frames without computing their keyframes.
+
+    Parameters
+    ----------
+    frame_args : sequence of tuple
+        Arguments of each frame, see `save_frames`.
+    manifest : FrameManifest
+        Record of the saved frames, keyed by `keyframe_key`.
+    resample : callable
+        Called with the indices of the frames to resample, it yields their
+        fields in this order, e.g. with `src.keyframes.keyframe_zoom`.
+    cost : callable, optional
+        Estimate of the time to save a frame, see `save_frames`. If given,
+        frames are yielded by decreasing cost, as `save_frames` would only
+        order them after computing all of their keyframes.
+    field, output : int
+        Index of the field and of the output path in the arguments.
+    """
+    order = range(len(frame_args))
+
+    if cost is not None:
+        order = sorted(order, key=lambda k: -cost(*frame_args[k]))
+
+    pending = [
+        k
+        for k in order
+        if not manifest.is_saved(
+            frame_args[k][output],
+            manifest.key(keyframe_key(frame_args[k], field)),
+        )
+    ]
+    fields = resample(pending)
+    pending = set(pending)
+
+    for k in order:
+        args = list(frame_args[k])
+
+        if k in pending:
+            args[field] = next(fields)
+
+        yield tuple(args)
+
+
+_pool = None
+_pool_workers = None
+
+
+def _close_pool(terminate=False):
+    global _pool, _pool_workers
+
+    if _pool is not None:
+        if terminate:
+            _pool.terminate()
+        else:
+            _pool.close()
+
+        _pool.join()
+
+    _pool, _pool_workers = None, None
+
+
+def get_pool(processes: int, threads: int) -> Pool:
+    """
+    Pool of `processes` workers with `threads` numba threads each.
+
+    The pool is reused by the following calls with the same workers, and
+    closed at exit.
+    """
+    global _pool, _pool_workers
+
+    if _pool_workers != (processes, threads):
+        _close_pool()
+
+        # Workers are spawned, as forking a process whose numba threads
+        # started (e.g. with TBB or OpenMP) is unsafe
+        _pool = get_context("spawn").Pool(
+            processes, initializer=set_num_threads, initargs=(threads,)
+        )
+        _pool_workers = (processes, threads)
+
+    return _pool
+
+
+atexit.register(_close_pool)
+
+
+def _bounded(tasks, semaphore, stop):
+    for task in tasks:
+        semaphore.acquire()
+
+        if stop.is_set():
+            return
+
+        yield task
+
+
+def _chunks(tasks, size=1, cost=None, target=None):
+    """
+    Group `tasks` into lists of `size` tasks or, with `cost`, into lists
+    whose frames cost at most `target` in total, or a single frame.
+    """
+    if cost is None:
+        cost, target = lambda *args: 1, size
+
+    chunk, total = [], 0
+
+    for task in tasks:
+        task_cost = cost(*task[1])
+
+        if chunk and total + task_cost > target:
+            yield chunk
+            chunk, total = [], 0
+
+        chunk.append(task)
+        total += task_cost
+
+    if chunk:
+        yield chunk
+
+
+def _run_chunk(chunk):
+    return [farm.run_task(task) for task in chunk]
+
+
+def save_frames(
+    save_plot: Callable,
+    frame_args: Iterable[tuple],
+    multiprocess: bool = True,
+    processes: Optional[int] = None,
+    threads: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    cost: Optional[Callable[..., float]] = None,
+    manifest: Optional[FrameManifest] = None,
+    output: int = 1,
+    key: Optional[Callable[[tuple], tuple]] = None,
+    queue: Optional[Path] = None,
+    force: bool = False,
+    stats: Optional[Path] = None,
+) -> None:
+    """
+    Call `save_plot` for each tuple of `frame_args` and report the frame rate.
+
+    Parameters
+    ----------
+    save_plot : callable
+        Module level function saving a frame.
+    frame_args : iterable of tuple
+        Positional arguments of each call. Without `cost`, it is consumed as
+        frames are done, so that frames computed in the main process (e.g.
+        by `src.keyframes.keyframe_zoom`) are not all held in memory.
+    multiprocess : bool, default True
+        If False, save frames in the main process.
+    processes, threads : int, optional
+        Number of processes and numba threads per process, see
+        `plan_workers`.
+    chunksize : int, optional
+        Number of frames sent to a process at once. Larger chunks suit
+        cheap frames. By default, frames are grouped by `cost` if given,
+        and sent one at a time otherwise.
+    cost : callable, optional
+        Estimate of the time to save a frame, called with its arguments.
+        If given, the most expensive frames are saved first, so that no
+        long frame is left running alone at the end. Unless `chunksize` is
+        given, frames are also sent to the processes in groups costing
+        about as much as the most expensive frame, so that cheap frames are
+        sent many at a time and expensive frames one at a time.
+    manifest : FrameManifest, optional
+        If given, skip the frames already saved with the same arguments,
+        and record each frame as it is saved.
+    output : int, default 1
+        Index of the output path in the arguments, for `manifest`.
+    key : callable, optional
+        Arguments identifying a frame in `manifest`, called with all of its
+        arguments. By default, all of them. Arguments derived from others,
+        e.g. precomputed fields, can be left out so that frames are matched
+        before they are computed.
+    queue : Path, optional
+        If given, queue the frames as a job in this directory and render
+        them along with the workers of `cli.farm.work`, e.g. on other nodes.
+        Returns once all frames are rendered.
+    force : bool, default False
+        With `queue`, replace the previous job even if workers hold leases
+        on its tasks, see `cli.farm.submit`.
+    stats : Path, optional
+        If given, save the `src.stats` record of each frame rendered to this
+        file, e.g. to find the slowest frames. See `src.stats.RenderStats`.
+    """
+    processes, threads = plan_workers(multiprocess, processes, threads)
+
+    target = None
+
+    if cost is not None:
+        frame_args = sorted(frame_args, key=lambda args: -cost(*args))
+
+        if chunksize is None and frame_args:
+            target = cost(*frame_args[0])
+
+    n_frames, n_skipped = 0, 0
+    records = []
+
+    def tasks():
+        nonlocal n_skipped
+
+        for args in frame_args:
+            token = None
+
+            if manifest is not None:
+                frame = args if key is None else key(args)
+                token = (args[output], manifest.key(frame))
+
+                if manifest.is_saved(*token):
+                    n_skipped += 1
+                    continue
+
+            label = None if stats is None else Path(args[output]).name
+
+            yield save_plot, args, token, label
+
+    def done(token, record):
+        nonlocal n_frames
+        n_frames += 1
+
+        if record is not None:
+            records.append(record)
+
+        if manifest is not None:
+            manifest.add(*token)
+            manifest.save()
+
+    start = time.perf_counter()
+
+    if queue is not None:
+        farm.submit(queue, tasks(), force)
+
+        if processes == 1:
+            set_num_threads(threads)
+            farm.work(queue)
+        else:
+            get_pool(processes, threads).map(farm.work, [queue] * processes)
+
+        for token, record in farm.collect(queue):
+            done(token, record)
+    elif processes == 1:
+        set_num_threads(threads)
+
+        for task in tasks():
+            done(*farm.run_task(task))
+    else:
+        if target is None:
+            chunks = _chunks(tasks(), chunksize or 1)
+        else:
+            chunks = _chunks(tasks(), cost=cost, target=target)
+
+        # Tasks are only read ahead by a few chunks per process
+        semaphore, stop = Semaphore(2 * processes), Event()
+        pool = get_pool(processes, threads)
+        results = pool.imap_unordered(
+            _run_chunk, _bounded(chunks, semaphore, stop)
+        )
+
+        try:
+            for chunk in results:
+                semaphore.release()
+
+                for token, record in chunk:
+                    done(token, record)
+        except BaseException:
+            # Unblock the task feeder thread, so that the pool can be closed
+            stop.set()
+            semaphore.release()
+            _close_pool(terminate=True)
+            raise
+
+    elapsed = time.perf_counter() - start
+    typer.echo(
+        f"{n_frames} frames in {elapsed:.1f} s with {processes} processes x "
+        f"{threads} threads ({n_frames / max(elapsed, 1e-9):.2f} frames/s)"
+        + (f", {n_skipped} already saved" if n_skipped else "")
+    )
+
+    if stats is not None:
+        from src.stats import save_records
+
+        save_records(
+            sorted(records, key=lambda record: record["frame"]), stats
+        )
+        typer.echo(f"Render statistics saved to {stats}")
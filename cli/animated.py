@@ -6,6 +6,7 @@ from cli.scripts import (
     julia_zoom,
     mandelbrot_deep_zoom,
     mandelbrot_zoom,
+    worker,
 )
 
 if not ANIMATED_IMG_DIR.exists():
@@ -22,6 +23,7 @@ mandelbrot_app.command("deep-zoom")(mandelbrot_deep_zoom)
 app = typer.Typer()
 app.add_typer(julia_app, name="julia")
 app.add_typer(mandelbrot_app, name="mandelbrot")
+app.command("worker")(worker)
 
 
 if __name__ == "__main__":
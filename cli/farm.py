@@ -0,0 +1,346 @@
+"""
+Frames queued in a shared directory, rendered by workers on any node.
+
+A job is a directory with one pickled task per frame, moved between the
+``todo``, ``running``, ``done`` and ``failed`` subdirectories. Workers claim
+a task by renaming it, which is atomic within a filesystem, so that any
+process seeing the directory (e.g. on NFS) can render frames. Task names
+sort in dispatch order, from the most expensive frame to the cheapest.
+Render statistics of done tasks, if requested, are saved next to them.
+
+Workers hold a lease on the tasks they run, by updating the modification
+time of their file every `LEASE` / 4 seconds. Tasks whose lease expired,
+e.g. of a killed worker or of a lost node, are moved back to ``todo`` by
+the other workers and by `collect`. The lease is longer than the attribute
+cache of NFS clients and than clock differences between nodes. A job is
+only submitted again over a previous one whose tasks have no lease left,
+unless forced.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import socket
+import time
+import traceback
+from pathlib import Path
+from threading import Event, Thread
+from typing import Iterable, List, Optional, Tuple
+
+import typer
+
+STATES = ("todo", "running", "done", "failed")
+
+# Seconds after which a running task whose lease was not renewed is queued
+# again
+LEASE = 300.0
+
+
+def _job_dirs(path: Path) -> List[Path]:
+    """Jobs of a farm directory, or `path` itself if it is a job."""
+    if path.joinpath("job.json").exists():
+        return [path]
+
+    return sorted(file.parent for file in path.glob("*/job.json"))
+
+
+def _leased(job_dir: Path) -> List[Path]:
+    """Running tasks of a job whose lease has not expired."""
+    leased = []
+
+    for path in job_dir.joinpath("running").glob("*.pkl"):
+        try:
+            if time.time() - path.stat().st_mtime < LEASE:
+                leased.append(path)
+        except FileNotFoundError:  # Finished or requeued meanwhile
+            continue
+
+    return leased
+
+
+def submit(job_dir: Path, tasks: Iterable[tuple], force: bool = False) -> int:
+    """
+    Queue tasks as a new job, replacing the tasks of a previous one.
+
+    Parameters
+    ----------
+    job_dir : Path
+        Directory of the job.
+    tasks : iterable of tuple
+        ``(save_plot, args, token, label)`` tuples, as made by
+        `save_frames`.
+        `save_plot` must be a module level function.
+    force : bool, default False
+        If True, replace the previous job even if workers still hold leases
+        on its tasks. The frames they are rendering are then not collected.
+
+    Returns
+    -------
+    int
+        Number of tasks queued.
+
+    Raises
+    ------
+    RuntimeError
+        If workers hold leases on tasks of the previous job, e.g. as it is
+        still running from another process, and `force` is False.
+    """
+    leased = [] if force else _leased(job_dir)
+
+    if leased:
+        raise RuntimeError(
+            f"{len(leased)} tasks of {job_dir} are being rendered, e.g. "
+            f"{leased[0].name}. Wait for the job to finish, or replace it "
+            "with --force"
+        )
+
+    for state in STATES:
+        shutil.rmtree(job_dir.joinpath(state), ignore_errors=True)
+        job_dir.joinpath(state).mkdir(parents=True)
+
+    n_tasks, function = 0, None
+
+    for n_tasks, task in enumerate(tasks, start=1):
+        function = f"{task[0].__module__}.{task[0].__qualname__}"
+        tmp_path = job_dir.joinpath(f"{n_tasks:06}.tmp")
+
+        with open(tmp_path, "wb") as file:
+            pickle.dump(task, file)
+
+        os.replace(tmp_path, job_dir.joinpath("todo", f"{n_tasks:06}.pkl"))
+
+    job = {"function": function, "frames": n_tasks, "submitted": time.time()}
+    job_dir.joinpath("job.json").write_text(json.dumps(job, indent=4))
+
+    return n_tasks
+
+
+def run_task(task: tuple) -> Tuple[object, Optional[dict]]:
+    """
+    Call `save_plot` with the arguments of a task.
+
+    Returns
+    -------
+    tuple
+        Token of the task, and its `src.stats` record labeled with ``frame``
+        if the label of the task is not None.
+    """
+    save_plot, args, token, label = task
+
+    if label is None:
+        save_plot(*args)
+
+        return token, None
+
+    from src.stats import render_stats
+
+    with render_stats() as stats, stats.frame(frame=label):
+        save_plot(*args)
+
+    return token, stats.records[0]
+
+
+def _claim(job_dirs: List[Path]) -> Optional[Path]:
+    for job_dir in job_dirs:
+        for path in sorted(job_dir.joinpath("todo").glob("*.pkl")):
+            claimed = job_dir.joinpath("running", path.name)
+
+            try:
+                os.rename(path, claimed)
+                os.utime(claimed)  # Start of the lease
+            except FileNotFoundError:  # Claimed by another worker
+                continue
+
+            return claimed
+
+    return None
+
+
+def _requeue(job_dirs: List[Path]) -> List[Path]:
+    """Move the running tasks whose lease expired back to ``todo``."""
+    requeued = []
+
+    for job_dir in job_dirs:
+        for path in job_dir.joinpath("running").glob("*.pkl"):
+            try:
+                if time.time() - path.stat().st_mtime < LEASE:
+                    continue
+
+                os.rename(path, job_dir.joinpath("todo", path.name))
+            except FileNotFoundError:  # Finished or requeued meanwhile
+                continue
+
+            requeued.append(path)
+
+    return requeued
+
+
+def _renew(path: Path, stop: Event, interval: float):
+    """Renew the lease of the task at `path` until `stop` is set."""
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # Requeued after its lease expired
+            return
+
+
+def _run(path: Path):
+    job_dir = path.parents[1]
+    stop = Event()
+    Thread(target=_renew, args=(path, stop, LEASE / 4), daemon=True).start()
+
+    try:
+        with open(path, "rb") as file:
+            _, record = run_task(pickle.load(file))
+    except Exception:
+        error = f"{socket.gethostname()}:{os.getpid()}\n"
+        error += traceback.format_exc()
+
+        job_dir.joinpath("failed", path.stem + ".txt").write_text(error)
+        _finish(path, job_dir.joinpath("failed", path.name))
+
+        return
+    finally:
+        stop.set()
+
+    if record is not None:
+        record_path = job_dir.joinpath("done", path.stem + ".json")
+        record_path.write_text(json.dumps(record))
+
+    _finish(path, job_dir.joinpath("done", path.name))
+
+
+def _finish(path: Path, target: Path):
+    try:
+        os.replace(path, target)
+    except FileNotFoundError:
+        # The lease expired, e.g. while the worker was suspended, and the
+        # task was queued again: it is recorded by the worker running it
+        pass
+
+
+def work(path: Path, wait: bool = False, poll: float = 1.0) -> int:
+    """
+    Render queued frames until none is left.
+
+    Parameters
+    ----------
+    path : Path
+        Job directory, or farm directory whose jobs are all served.
+    wait : bool, default False
+        If True, keep polling for new tasks instead of returning.
+    poll : float, default 1.0
+        Seconds between checks for new tasks.
+
+    Returns
+    -------
+    int
+        Number of tasks run.
+    """
+    n_tasks = 0
+
+    while True:
+        task = _claim(_job_dirs(path))
+
+        if task is not None:
+            _run(task)
+            n_tasks += 1
+        elif _requeue(_job_dirs(path)):
+            continue
+        elif wait:
+            time.sleep(poll)
+        else:
+            return n_tasks
+
+
+def pending(job_dir: Path) -> int:
+    """Number of tasks of a job waiting for or being rendered."""
+    return sum(
+        len(list(job_dir.joinpath(state).glob("*.pkl")))
+        for state in ("todo", "running")
+    )
+
+
+def collect(
+    job_dir: Path, poll: float = 1.0, timeout: Optional[float] = None
+) -> List[tuple]:
+    """
+    Wait for all the tasks of a job, e.g. rendered by other nodes.
+
+    Tasks whose lease expired are queued again, and rendered by this
+    process if no worker claims them.
+
+    Parameters
+    ----------
+    job_dir : Path
+        Directory of the job.
+    poll : float, default 1.0
+        Seconds between checks of the tasks.
+    timeout : float, optional
+        Seconds without any task finishing after which to stop waiting.
+        By default, wait as long as the tasks are running.
+
+    Returns
+    -------
+    list of tuple
+        Token and statistics record of the rendered tasks, as returned by
+        `run_task`.
+
+    Raises
+    ------
+    RuntimeError
+        If a task failed. Its traceback is saved next to it, in ``failed``.
+    TimeoutError
+        If no task finished for `timeout` seconds.
+    """
+    n_pending, last_change = pending(job_dir), time.monotonic()
+
+    while n_pending:
+        requeued = _requeue([job_dir])
+
+        if requeued:
+            typer.echo(
+                f"Queued again {len(requeued)} tasks whose worker stopped "
+                f"renewing its lease, e.g. {requeued[0].name}",
+                err=True,
+            )
+
+            # Frames are rendered here, as other workers may be gone
+            work(job_dir)
+
+        if pending(job_dir) != n_pending:
+            n_pending, last_change = pending(job_dir), time.monotonic()
+        elif timeout is not None and time.monotonic() - last_change > timeout:
+            running = sorted(job_dir.joinpath("running").glob("*.pkl"))
+            raise TimeoutError(
+                f"No task of {job_dir} finished for {timeout} s, "
+                f"{n_pending} pending, running: "
+                + ", ".join(path.name for path in running)
+            )
+        else:
+            time.sleep(poll)
+
+    failed = sorted(job_dir.joinpath("failed").glob("*.txt"))
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} frames failed, see {failed[0]}:\n"
+            + failed[0].read_text()
+        )
+
+    results = []
+
+    for path in sorted(job_dir.joinpath("done").glob("*.pkl")):
+        with open(path, "rb") as file:
+            token = pickle.load(file)[2]
+
+        record_path = path.with_suffix(".json")
+        record = None
+
+        if record_path.exists():
+            record = json.loads(record_path.read_text())
+
+        results.append((token, record))
+
+    return results
@@ -4,3 +4,4 @@ from cli.scripts.mandelbrot_deep_zoom import (  # noqa F401
     main as mandelbrot_deep_zoom,
 )
 from cli.scripts.mandelbrot_zoom import main as mandelbrot_zoom  # noqa F401
+from cli.scripts.worker import main as worker  # noqa F401
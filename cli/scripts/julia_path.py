@@ -1,18 +1,31 @@
+import atexit
 from enum import Enum
-from multiprocessing import Pool
+from itertools import repeat
+from pathlib import Path
+from typing import Iterator
 
-import matplotlib.pyplot as plt
 import numpy as np
 import typer
 
-from cli._utils import ANIMATED_IMG_DIR, ARGS
-from src import plot_julia, plot_mandelbrot
-from src.utils import animate, linear_cmap, set_plot_style
+from cli._utils import (
+    ANIMATED_IMG_DIR,
+    ARGS,
+    FrameManifest,
+    plan_workers,
+    save_frames,
+    set_num_threads,
+    setup_plot_style,
+)
 
 BACK_LOOP = {"circumference": False, "segment": True}
-CMAP = linear_cmap("ultra", N=4096)
 
-set_plot_style(font="Merriweather")
+# Number of Julia sets computed per kernel call
+BATCH = 32
+
+JULIA_ARGS = {
+    "number_points": 400,
+    "smoothing": True,
+}
 
 
 def get_line_path(line_path, n_images):
@@ -31,31 +44,103 @@ def plot_line_path(ax, line_path, color):
     ax.plot(z.real, z.imag, color=color, linestyle="dashed", zorder=1)
 
 
-def save_plot(c, line_path, png_path):
+def julia_fields(c_array: np.ndarray) -> Iterator[np.ndarray]:
+    """Julia sets of each `c` of `c_array`, computed `BATCH` at a time."""
+    from src import compute_julia_batch
+
+    for i in range(0, len(c_array), BATCH):
+        batch = c_array[i : i + BATCH]  # noqa: E203
+        yield from compute_julia_batch(batch, **JULIA_ARGS)
+
+
+def frame_key(args: tuple) -> tuple:
+    """Arguments of `save_plot` identifying a frame, without its field."""
+    c, line_path, png_path, count, cmap, cache = args
+    return c, line_path, png_path, cmap
+
+
+# Figure of the frames of this process, with its arguments, see
+# `setup_figure`
+_figure = None
+
+
+def close_figure():
+    """Close the figure of `setup_figure`, if any."""
+    global _figure
+
+    if _figure is not None:
+        import matplotlib.pyplot as plt
+
+        plt.close(_figure[1])
+        _figure = None
+
+
+# Workers of the pool close it as they exit
+atexit.register(close_figure)
+
+
+def setup_figure(line_path, cmap, cache):
+    """
+    Figure of the frames of a process, with the Mandelbrot set and the line
+    path drawn once. Frames only move the point of `c` and replace the
+    Julia set image. The figure is reused by the frames with the same
+    arguments, and replaced otherwise.
+    """
+    global _figure
+
+    key = (line_path, cmap, cache)
+
+    if _figure is not None and _figure[0] == key:
+        return _figure[1:]
+
+    close_figure()
+
+    import matplotlib.pyplot as plt
+
+    from src import plot_field, plot_mandelbrot
+    from src.utils import linear_cmap
+
+    setup_plot_style()
+
     fig, ax = plt.subplots(1, 2)
 
-    set_args = {
-        "number_points": 400,
-        "cmap": CMAP,
-        "smoothing": True,
-    }
+    cmap = linear_cmap(cmap, N=4096)
+    number_points = JULIA_ARGS["number_points"]
 
-    plot_mandelbrot(ax=ax[0], **set_args)
+    plot_mandelbrot(ax=ax[0], cmap=cmap, cache=cache, **JULIA_ARGS)
 
     plot_line_path(ax[0], line_path, color="#EB7667")
-    ax[0].scatter(x=c.real, y=c.imag, color="#C12D1A", zorder=2)
+    point = ax[0].scatter(x=0, y=0, color="#C12D1A", zorder=2)
 
-    plot_julia(c, ax=ax[1], vmin=0, vmax=200, **set_args)
+    empty = np.zeros((number_points, number_points))
+    plot_field(empty, ax=ax[1], cmap=cmap, vmin=0, vmax=200)
 
     ax[0].set(xlabel="Re(c)", ylabel="Im(c)")
     ax[1].set(xlabel="Re(z)", ylabel="Im(z)")
 
     fig.tight_layout()
 
-    dpi = set_args["number_points"] / 3.625
-    fig.savefig(png_path, dpi=dpi, bbox_inches="tight")
+    _figure = (key, fig, point, ax[1].images[-1])
+
+    return _figure[1:]
+
+
+def save_plot(c, line_path, png_path, count=None, cmap="ultra", cache=False):
+    from src import compute_julia
+    from src.stats import stage
+
+    fig, point, image = setup_figure(line_path, cmap, cache)
+
+    if count is None:
+        count = compute_julia(c, **JULIA_ARGS)
+
+    point.set_offsets([[c.real, c.imag]])
+    image.set_data(count)
+
+    dpi = JULIA_ARGS["number_points"] / 3.625
 
-    plt.close(fig)
+    with stage("savefig"):
+        fig.savefig(png_path, dpi=dpi, bbox_inches="tight")
 
 
 class LinePath(str, Enum):
@@ -66,8 +151,18 @@ class LinePath(str, Enum):
 def main(
     line_path: LinePath = typer.Argument(..., help="Type of line path"),
     multiprocess: bool = ARGS["multiprocess"],
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+    resume: bool = ARGS["resume"],
+    farm: Path = ARGS["farm"],
+    force: bool = ARGS["force"],
+    stats: Path = ARGS["stats"],
+    cmap: str = ARGS["cmap"],
+    cache: bool = ARGS["cache"],
 ):
     """Make animated GIF of Julia sets for `c` in a line path."""
+    from src.utils import animate
+
     name = f"julia-{line_path}"
     png_dir = ANIMATED_IMG_DIR.joinpath(name)
 
@@ -82,14 +177,53 @@ def main(
         png_dir.joinpath(f"{i:0{digits}}.png") for i in range(n_images)
     ]
 
-    if multiprocess:
-        pool = Pool()
-        pool.starmap(
-            save_plot, zip(c_array, [line_path] * n_images, png_paths)
-        )
-    else:
-        for c, png_path in zip(c_array, png_paths):
-            save_plot(c, line_path, png_path)
+    manifest = FrameManifest(
+        png_dir.joinpath("manifest.json"), save_plot, reset=not resume
+    )
+
+    # Julia sets are computed in batches by the main process, and frames are
+    # only drawn by the workers. As the batches are computed while the
+    # workers run, the main process gets the threads of one worker, so that
+    # the cores are not oversubscribed. Only the sets of the frames not saved
+    # yet are computed
+    processes, threads = plan_workers(multiprocess, processes, threads)
+    set_num_threads(threads)
+
+    keys = (
+        manifest.key(frame_key((c, line_path, png_path, None, cmap, cache)))
+        for c, png_path in zip(c_array, png_paths)
+    )
+    pending = np.array(
+        [not manifest.is_saved(*token) for token in zip(png_paths, keys)],
+        dtype=bool,
+    )
+    fields = julia_fields(c_array[pending])
+
+    frame_args = zip(
+        c_array,
+        repeat(line_path),
+        png_paths,
+        (next(fields) if is_pending else None for is_pending in pending),
+        repeat(cmap),
+        repeat(cache),
+    )
+
+    save_frames(
+        save_plot,
+        frame_args,
+        multiprocess,
+        processes,
+        threads,
+        manifest=manifest,
+        output=2,
+        key=frame_key,
+        queue=None if farm is None else farm.joinpath(name),
+        force=force,
+        stats=stats,
+    )
+
+    # Frames saved by this process, e.g. without --multiprocess
+    close_figure()
 
     output_file = png_dir.with_suffix(".gif")
 
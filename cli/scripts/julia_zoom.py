@@ -1,42 +1,131 @@
-from multiprocessing import Pool
+from itertools import repeat
 from pathlib import Path
+from typing import Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from cli._utils import ANIMATED_IMG_DIR, ARGS
-from src import plot_julia
-from src.utils import animate, linear_cmap, set_plot_style
+from cli._utils import (
+    ANIMATED_IMG_DIR,
+    ARGS,
+    FrameManifest,
+    keyframe_key,
+    resample_pending,
+    save_frames,
+    setup_plot_style,
+    size_cache,
+)
+
+zooming_rate = 1.05
+
+JULIA_ARGS = {
+    "c": -1,
+    "center": 1.61803398874989,
+    "max_iter": 100,
+    "number_points": 400,
+    "smoothing": True,
+}
+
+PLOT_ARGS = {
+    "axis_labels": True,
+}
+
+
+def compute_field(zoom: float, cache: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Number of iterations without smoothing and norm of the last iterate of
+    each point, smoothed while colored.
+    """
+    from src import compute_julia
+    from src.cache import cached_escape
+
+    params = {
+        **JULIA_ARGS,
+        "zoom": zoom,
+    }
+    del params["smoothing"]
 
-CMAP = linear_cmap("ultra", N=4096)
+    if cache:
+        return cached_escape("julia", **params)
 
-set_plot_style(font="Merriweather")
+    number_points = JULIA_ARGS["number_points"]
+    norm = np.empty((number_points, number_points))
 
+    return compute_julia(norm=norm, **params), norm
 
-def save_plot(i: int, image_path: Path):
-    zooming_rate = 1.05
 
-    julia_args = {
-        "c": -1,
-        "center": 1.61803398874989,
-        "zoom": zooming_rate**i,
-        "max_iter": 100,
-        "number_points": 400,
-        "smoothing": True,
-        "cmap": CMAP,
-        "axis_labels": True,
-    }
+def save_plot(
+    i: int,
+    image_path: Path,
+    count: np.ndarray = None,
+    cmap: str = "ultra",
+    cache: bool = False,
+    fast: bool = False,
+):
+    import matplotlib.pyplot as plt
+
+    from src import plot_field, plot_julia
+    from src.colorize import palette_index
+    from src.gif import GIF_COLORS
+    from src.png import write_png
+    from src.stats import stage
+    from src.utils import cmap_lut, linear_cmap
+
+    zoom = zooming_rate**i
+    plot_args = {**PLOT_ARGS, "cmap": linear_cmap(cmap, N=4096)}
+
+    if fast:
+        norm = None
+
+        if count is None:
+            count, norm = compute_field(zoom, cache)
+
+        # Frames are indices of the palette of the GIF, see `main`
+        with stage("colorize"):
+            index = palette_index(
+                count, GIF_COLORS, norm=norm, max_iter=JULIA_ARGS["max_iter"]
+            )
+
+        with stage("write"):
+            lut = cmap_lut(linear_cmap(cmap, N=GIF_COLORS))
+            write_png(image_path, [index], *index.shape[::-1], palette=lut)
+
+        return
+
+    setup_plot_style()
 
-    fig = plot_julia(**julia_args)
+    if count is None:
+        fig = plot_julia(zoom=zoom, cache=cache, **JULIA_ARGS, **plot_args)
+    else:
+        fig = plot_field(count, JULIA_ARGS["center"], zoom, **plot_args)
 
     # DPI ratio for `number of pixels = number_points`
-    dpi = julia_args["number_points"] / 3.625
-    fig.savefig(image_path, dpi=dpi, pad_inches=0)
+    dpi = JULIA_ARGS["number_points"] / 3.625
+
+    with stage("savefig"):
+        fig.savefig(image_path, dpi=dpi, pad_inches=0)
 
     plt.close(fig)
 
 
-def main(multiprocess: bool = ARGS["multiprocess"]):
+def main(
+    multiprocess: bool = ARGS["multiprocess"],
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+    resume: bool = ARGS["resume"],
+    farm: Path = ARGS["farm"],
+    force: bool = ARGS["force"],
+    stats: Path = ARGS["stats"],
+    keyframes: bool = ARGS["keyframes"],
+    cmap: str = ARGS["cmap"],
+    cache: bool = ARGS["cache"],
+    cache_size: float = ARGS["cache_size"],
+    fast: bool = ARGS["fast"],
+):
+    from src import compute_julia
+    from src.gif import GIF_COLORS
+    from src.keyframes import keyframe_zoom
+    from src.utils import animate, cmap_lut, linear_cmap
+
     name = "julia-zoom"
     png_dir = ANIMATED_IMG_DIR.joinpath(name)
 
@@ -47,12 +136,40 @@ def main(multiprocess: bool = ARGS["multiprocess"]):
 
     png_paths = [png_dir.joinpath(f"{i:03}.png") for i in n]
 
-    if multiprocess:
-        pool = Pool()
-        pool.starmap(save_plot, zip(n, png_paths))
-    else:
-        for i, png_path in zip(n, png_paths):
-            save_plot(i, png_path)
+    if cache:
+        size_cache(cache_size, n.size, JULIA_ARGS["number_points"])
+
+    frame_args = zip(
+        n, png_paths, repeat(None), repeat(cmap), repeat(cache), repeat(fast)
+    )
+
+    manifest = FrameManifest(
+        png_dir.joinpath("manifest.json"), save_plot, reset=not resume
+    )
+
+    if keyframes:
+        # Only the frames not saved are resampled
+        frame_args = resample_pending(
+            list(frame_args),
+            manifest,
+            lambda frames: keyframe_zoom(
+                compute_julia, zooming_rate**n, frames=frames, **JULIA_ARGS
+            ),
+        )
+
+    save_frames(
+        save_plot,
+        frame_args,
+        multiprocess,
+        processes,
+        threads,
+        chunksize=4,
+        manifest=manifest,
+        key=keyframe_key if keyframes else None,
+        queue=None if farm is None else farm.joinpath(name),
+        force=force,
+        stats=stats,
+    )
 
     output_file = png_dir.with_suffix(".gif")
 
@@ -60,5 +177,6 @@ def main(multiprocess: bool = ARGS["multiprocess"]):
         input_dir=png_dir,
         output_file=output_file,
         pause=25,
+        palette=cmap_lut(linear_cmap(cmap, N=GIF_COLORS)) if fast else None,
         subrectangles=True,
     )
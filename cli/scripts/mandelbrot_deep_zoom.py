@@ -1,48 +1,166 @@
-from multiprocessing import Pool
+from itertools import repeat
 from pathlib import Path
+from typing import Optional, Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from cli._utils import ANIMATED_IMG_DIR, ARGS
-from src import plot_mandelbrot
-from src.utils import animate, linear_cmap
+from cli._utils import (
+    ANIMATED_IMG_DIR,
+    ARGS,
+    FrameManifest,
+    keyframe_key,
+    resample_pending,
+    save_frames,
+    size_cache,
+)
+
+zooming_rate = 1.04
+
+MANDELBROT_ARGS = {
+    "center": (
+        "-0.743643887037158704752191506114774"
+        "+0.131825904205311970493132056385139j"
+    ),
+    "number_points": 1200,
+    "smoothing": True,
+    "engine": "perturbation",
+}
+
+PLOT_ARGS = {
+    "interpolation": "antialiased",
+}
+
+
+def max_iter(zoom: float) -> float:
+    return np.sqrt(zoom) + 200
+
+
+def frame_cost(i: int, *args) -> float:
+    return max_iter(zooming_rate**i)
+
+
+def compute_field(
+    zoom: float, cache: bool, supersampling: int = 1
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Number of iterations without smoothing and norm of the last iterate of
+    each point, smoothed while colored. Supersampled fields average smoothed
+    samples, so they are returned smoothed, without norms.
+    """
+    from src import compute_mandelbrot
+    from src.cache import cached_escape, cached_field
+
+    params = {
+        **MANDELBROT_ARGS,
+        "zoom": zoom,
+        "max_iter": max_iter(zoom),
+    }
 
-mandelbrot_cmap = linear_cmap("ultra", N=4096)
+    if supersampling > 1:
+        params["supersampling"] = supersampling
 
+        if cache:
+            return cached_field("mandelbrot", **params), None
 
-def save_plot(i: int, image_path: Path):
-    zooming_rate = 1.04
+        return compute_mandelbrot(**params), None
 
-    mandelbrot_args = {
-        "center": (
-            -0.743643887037158704752191506114774
-            + 0.131825904205311970493132056385139j
-        ),
-        "zoom": zooming_rate**i,
-        "max_iter": np.sqrt(zooming_rate**i) + 200,
-        "number_points": 1200,
-        "smoothing": True,
-        "cmap": mandelbrot_cmap,
-        "interpolation": "antialiased",
-    }
+    del params["smoothing"]
+
+    if cache:
+        return cached_escape("mandelbrot", **params)
+
+    number_points = MANDELBROT_ARGS["number_points"]
+    norm = np.empty((number_points, number_points))
+
+    return compute_mandelbrot(norm=norm, **params), norm
+
+
+def save_plot(
+    i: int,
+    image_path: Path,
+    count: np.ndarray = None,
+    cmap: str = "ultra",
+    cache: bool = False,
+    fast: bool = False,
+    supersampling: int = 1,
+):
+    import imageio
+    import matplotlib.pyplot as plt
+
+    from src import plot_field, plot_mandelbrot
+    from src.colorize import colorize
+    from src.stats import stage
+    from src.utils import cmap_lut, linear_cmap
+
+    zoom = zooming_rate**i
+    plot_args = {**PLOT_ARGS, "cmap": linear_cmap(cmap, N=4096)}
+
+    if fast:
+        norm = None
+
+        if count is None:
+            count, norm = compute_field(zoom, cache, supersampling)
+
+        with stage("colorize"):
+            image = colorize(
+                count,
+                cmap_lut(plot_args["cmap"]),
+                norm=norm,
+                max_iter=max_iter(zoom),
+            )
 
-    fig = plot_mandelbrot(**mandelbrot_args)
+        with stage("write"):
+            imageio.imwrite(image_path, image)
+
+        return
+
+    if count is None:
+        fig = plot_mandelbrot(
+            zoom=zoom,
+            max_iter=max_iter(zoom),
+            cache=cache,
+            supersampling=supersampling,
+            **MANDELBROT_ARGS,
+            **plot_args,
+        )
+    else:
+        # Perturbation engine plots are centered at 0, see `plot_mandelbrot`
+        fig = plot_field(count, 0, zoom, **plot_args)
 
     # DPI ratio for `number of pixels = number_points`
-    dpi = mandelbrot_args["number_points"] / 3.695
-    fig.savefig(
-        image_path,
-        dpi=dpi,
-        bbox_inches="tight",
-        pad_inches=0,
-        transparent=True,
-    )
+    dpi = MANDELBROT_ARGS["number_points"] / 3.695
+
+    with stage("savefig"):
+        fig.savefig(
+            image_path,
+            dpi=dpi,
+            bbox_inches="tight",
+            pad_inches=0,
+            transparent=True,
+        )
 
     plt.close(fig)
 
 
-def main(multiprocess: bool = ARGS["multiprocess"]):
+def main(
+    multiprocess: bool = ARGS["multiprocess"],
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+    resume: bool = ARGS["resume"],
+    farm: Path = ARGS["farm"],
+    force: bool = ARGS["force"],
+    stats: Path = ARGS["stats"],
+    keyframes: bool = ARGS["keyframes"],
+    cmap: str = ARGS["cmap"],
+    cache: bool = ARGS["cache"],
+    cache_size: float = ARGS["cache_size"],
+    fast: bool = ARGS["fast"],
+    supersampling: int = ARGS["supersampling"],
+):
+    from src import compute_mandelbrot
+    from src.keyframes import keyframe_zoom
+    from src.utils import animate
+
     name = "mandelbrot-deep-zoom"
     png_dir = ANIMATED_IMG_DIR.joinpath(name)
 
@@ -52,12 +170,52 @@ def main(multiprocess: bool = ARGS["multiprocess"]):
     n = np.arange(718)
     png_paths = [png_dir.joinpath(f"{i:03}.png") for i in n]
 
-    if multiprocess:
-        pool = Pool()
-        pool.starmap(save_plot, zip(n, png_paths))
-    else:
-        for i, png_path in zip(n, png_paths):
-            save_plot(i, png_path)
+    if cache:
+        size_cache(cache_size, n.size, MANDELBROT_ARGS["number_points"])
+
+    frame_args = zip(
+        n,
+        png_paths,
+        repeat(None),
+        repeat(cmap),
+        repeat(cache),
+        repeat(fast),
+        repeat(supersampling),
+    )
+
+    manifest = FrameManifest(
+        png_dir.joinpath("manifest.json"), save_plot, reset=not resume
+    )
+
+    if keyframes:
+        # Frames are resampled by decreasing cost, and only those not saved
+        frame_args = resample_pending(
+            list(frame_args),
+            manifest,
+            lambda frames: keyframe_zoom(
+                compute_mandelbrot,
+                zooming_rate**n,
+                max_iter=max_iter,
+                supersampling=supersampling,
+                frames=frames,
+                **MANDELBROT_ARGS,
+            ),
+            cost=frame_cost,
+        )
+
+    save_frames(
+        save_plot,
+        frame_args,
+        multiprocess,
+        processes,
+        threads,
+        cost=None if keyframes else frame_cost,
+        manifest=manifest,
+        key=keyframe_key if keyframes else None,
+        queue=None if farm is None else farm.joinpath(name),
+        force=force,
+        stats=stats,
+    )
 
     output_file = png_dir.with_suffix(".mkv")
 
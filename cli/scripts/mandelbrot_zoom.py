@@ -1,39 +1,143 @@
-from multiprocessing import Pool
+from itertools import repeat
 from pathlib import Path
+from typing import Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from cli._utils import ANIMATED_IMG_DIR, ARGS
-from src import plot_mandelbrot
-from src.utils import animate, linear_cmap, set_plot_style
+from cli._utils import (
+    ANIMATED_IMG_DIR,
+    ARGS,
+    FrameManifest,
+    keyframe_key,
+    resample_pending,
+    save_frames,
+    setup_plot_style,
+    size_cache,
+)
 
-set_plot_style(font="Merriweather")
-
-mandelbrot_cmap = linear_cmap("ultra", N=4096)
 zooming_rate = 1.025
 
+MANDELBROT_ARGS = {
+    "number_points": 400,
+    "center": -1.4177,
+    "smoothing": True,
+}
+
+PLOT_ARGS = {
+    "axis_labels": True,
+}
+
+
+def max_iter(zoom: float) -> int:
+    return round(200 + 10 * np.log(zoom) / np.log(zooming_rate))
+
+
+def frame_cost(i: int, *args) -> float:
+    return max_iter(zooming_rate**i)
+
+
+def compute_field(zoom: float, cache: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Number of iterations without smoothing and norm of the last iterate of
+    each point, smoothed while colored.
+    """
+    from src import compute_mandelbrot
+    from src.cache import cached_escape
 
-def save_plot(i: int, image_path: Path):
-    mandelbrot_args = {
-        "number_points": 400,
-        "center": -1.4177,
-        "zoom": zooming_rate**i,
-        "max_iter": 200 + 10 * i,
-        "axis_labels": True,
-        "smoothing": True,
-        "cmap": mandelbrot_cmap,
+    params = {
+        **MANDELBROT_ARGS,
+        "zoom": zoom,
+        "max_iter": max_iter(zoom),
     }
+    del params["smoothing"]
+
+    if cache:
+        return cached_escape("mandelbrot", **params)
+
+    number_points = MANDELBROT_ARGS["number_points"]
+    norm = np.empty((number_points, number_points))
+
+    return compute_mandelbrot(norm=norm, **params), norm
+
+
+def save_plot(
+    i: int,
+    image_path: Path,
+    count: np.ndarray = None,
+    cmap: str = "ultra",
+    cache: bool = False,
+    fast: bool = False,
+):
+    import matplotlib.pyplot as plt
+
+    from src import plot_field, plot_mandelbrot
+    from src.colorize import palette_index
+    from src.gif import GIF_COLORS
+    from src.png import write_png
+    from src.stats import stage
+    from src.utils import cmap_lut, linear_cmap
+
+    zoom = zooming_rate**i
+    plot_args = {**PLOT_ARGS, "cmap": linear_cmap(cmap, N=4096)}
+
+    if fast:
+        norm = None
 
-    fig = plot_mandelbrot(**mandelbrot_args)
+        if count is None:
+            count, norm = compute_field(zoom, cache)
 
-    dpi = mandelbrot_args["number_points"] / 3.695
-    fig.savefig(image_path, dpi=dpi, pad_inches=0)
+        # Frames are indices of the palette of the GIF, see `main`
+        with stage("colorize"):
+            index = palette_index(
+                count, GIF_COLORS, norm=norm, max_iter=max_iter(zoom)
+            )
+
+        with stage("write"):
+            lut = cmap_lut(linear_cmap(cmap, N=GIF_COLORS))
+            write_png(image_path, [index], *index.shape[::-1], palette=lut)
+
+        return
+
+    setup_plot_style()
+
+    if count is None:
+        fig = plot_mandelbrot(
+            zoom=zoom,
+            max_iter=max_iter(zoom),
+            cache=cache,
+            **MANDELBROT_ARGS,
+            **plot_args,
+        )
+    else:
+        fig = plot_field(count, MANDELBROT_ARGS["center"], zoom, **plot_args)
+
+    dpi = MANDELBROT_ARGS["number_points"] / 3.695
+
+    with stage("savefig"):
+        fig.savefig(image_path, dpi=dpi, pad_inches=0)
 
     plt.close(fig)
 
 
-def main(multiprocess: bool = ARGS["multiprocess"]):
+def main(
+    multiprocess: bool = ARGS["multiprocess"],
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+    resume: bool = ARGS["resume"],
+    farm: Path = ARGS["farm"],
+    force: bool = ARGS["force"],
+    stats: Path = ARGS["stats"],
+    keyframes: bool = ARGS["keyframes"],
+    cmap: str = ARGS["cmap"],
+    cache: bool = ARGS["cache"],
+    cache_size: float = ARGS["cache_size"],
+    fast: bool = ARGS["fast"],
+):
+    from src import compute_mandelbrot
+    from src.gif import GIF_COLORS
+    from src.keyframes import keyframe_zoom
+    from src.utils import animate, cmap_lut, linear_cmap
+
     name = "mandelbrot-zoom"
     png_dir = ANIMATED_IMG_DIR.joinpath(name)
 
@@ -43,12 +147,45 @@ def main(multiprocess: bool = ARGS["multiprocess"]):
     n = np.arange(-10, 280)
     png_paths = [png_dir.joinpath(f"{i+10:03}.png") for i in n]
 
-    if multiprocess:
-        pool = Pool()
-        pool.starmap(save_plot, zip(n, png_paths))
-    else:
-        for i, png_path in zip(n, png_paths):
-            save_plot(i, png_path)
+    if cache:
+        size_cache(cache_size, n.size, MANDELBROT_ARGS["number_points"])
+
+    frame_args = zip(
+        n, png_paths, repeat(None), repeat(cmap), repeat(cache), repeat(fast)
+    )
+
+    manifest = FrameManifest(
+        png_dir.joinpath("manifest.json"), save_plot, reset=not resume
+    )
+
+    if keyframes:
+        # Frames are resampled by decreasing cost, and only those not saved
+        frame_args = resample_pending(
+            list(frame_args),
+            manifest,
+            lambda frames: keyframe_zoom(
+                compute_mandelbrot,
+                zooming_rate**n,
+                max_iter=max_iter,
+                frames=frames,
+                **MANDELBROT_ARGS,
+            ),
+            cost=frame_cost,
+        )
+
+    save_frames(
+        save_plot,
+        frame_args,
+        multiprocess,
+        processes,
+        threads,
+        cost=None if keyframes else frame_cost,
+        manifest=manifest,
+        key=keyframe_key if keyframes else None,
+        queue=None if farm is None else farm.joinpath(name),
+        force=force,
+        stats=stats,
+    )
 
     output_file = png_dir.with_suffix(".gif")
 
@@ -57,5 +194,6 @@ def main(multiprocess: bool = ARGS["multiprocess"]):
         output_file=output_file,
         fps=60,
         pause=20,
+        palette=cmap_lut(linear_cmap(cmap, N=GIF_COLORS)) if fast else None,
         subrectangles=True,
     )
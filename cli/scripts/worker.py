@@ -0,0 +1,32 @@
+from functools import partial
+from pathlib import Path
+
+import typer
+
+from cli import farm
+from cli._utils import ARGS, get_pool, plan_workers, set_num_threads
+
+
+def main(
+    farm_dir: Path = typer.Argument(
+        ..., help="Farm directory given as `--farm` to animation commands"
+    ),
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+    wait: bool = typer.Option(
+        True, help="Keep polling for new frames when the queue is empty"
+    ),
+):
+    """Render frames queued in a farm directory, e.g. from another node."""
+    processes, threads = plan_workers(True, processes, threads)
+    work = partial(farm.work, wait=wait)
+
+    if processes == 1:
+        set_num_threads(threads)
+        n_frames = work(farm_dir)
+    else:
+        n_frames = sum(
+            get_pool(processes, threads).map(work, [farm_dir] * processes)
+        )
+
+    typer.echo(f"{n_frames} frames rendered")
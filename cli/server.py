@@ -0,0 +1,345 @@
+"""
+Local map tile server, to explore the sets in a pan and zoom viewer.
+
+Tiles are rendered by a pool of processes, and a tile requested again while
+it renders waits for the same render. Rendered tiles are kept in memory and
+on disk, see `src.tilemap.TileCache`. Open ``http://localhost:8000`` for the
+viewer, which shows the center and zoom ratio of the view to pass to
+`plot_mandelbrot` or to the animation scripts.
+
+Tiles are served at ``/tiles/<kind>/<z>/<x>/<y>.png`` or
+``/tiles/<kind>/<quadkey>.png``, where kind is "mandelbrot" or "julia",
+with the query parameters ``max_iter``, ``cmap``, ``formula`` and, for
+Julia sets, ``c``.
+"""
+
+import json
+import re
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from threading import Lock
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import typer
+
+from cli._utils import ARGS, plan_workers, set_num_threads
+
+TILE_PATHS = [
+    re.compile(
+        r"^/tiles/(?P<kind>\w+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$"
+    ),
+    re.compile(r"^/tiles/(?P<kind>\w+)/(?P<quadkey>[0-3]*)\.png$"),
+]
+
+VIEWER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>fractal-sets</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  #map { position: absolute; top: 3em; bottom: 0; width: 100%; }
+  #bar { height: 3em; display: flex; align-items: center; gap: 1em;
+         padding: 0 1em; }
+  #view { font-family: monospace; }
+</style>
+</head>
+<body>
+<form id="bar">
+  <select name="kind">
+    <option>mandelbrot</option>
+    <option>julia</option>
+  </select>
+  <label>max_iter <input name="max_iter" value="200" size="6"></label>
+  <label>cmap <select name="cmap">CMAP_OPTIONS</select></label>
+  <label>formula <select name="formula">FORMULA_OPTIONS</select></label>
+  <label>c <input name="c" value="-0.8+0.156j" size="16"></label>
+  <button>Render</button>
+  <span id="view"></span>
+</form>
+<div id="map"></div>
+<script>
+const SIDE = 3, TILE = 256, LIMITS = LIMITS_JSON;
+const map = L.map("map", {crs: L.CRS.Simple, maxZoom: MAX_LEVEL});
+const form = document.getElementById("bar");
+let layer = null;
+
+function render() {
+  const params = new URLSearchParams(new FormData(form));
+  const kind = params.get("kind");
+  params.delete("kind");
+
+  if (kind !== "julia") params.delete("c");
+  if (layer) map.removeLayer(layer);
+
+  layer = L.tileLayer(`/tiles/${kind}/{z}/{x}/{y}.png?${params}`, {
+    noWrap: true,
+    maxZoom: MAX_LEVEL,
+    bounds: [[-TILE, 0], [0, TILE]],
+  }).addTo(map);
+  layer.kind = kind;
+  describe();
+}
+
+function describe() {
+  // Leaflet coordinates are pixels at level 0, with latitudes downwards
+  const [re0, im1] = LIMITS[layer.kind];
+  const center = map.getCenter(), bounds = map.getBounds();
+  const re = re0 + center.lng * SIDE / TILE;
+  const im = im1 + center.lat * SIDE / TILE;
+  const width = (bounds.getEast() - bounds.getWest()) * SIDE / TILE;
+  const sign = im < 0 ? "-" : "+";
+
+  document.getElementById("view").textContent =
+    `center=${re.toPrecision(17)}${sign}${Math.abs(im).toPrecision(17)}j ` +
+    `zoom=${(SIDE / width).toPrecision(6)}`;
+}
+
+form.addEventListener("submit", (event) => {
+  event.preventDefault();
+  render();
+});
+map.on("moveend", describe);
+map.fitBounds([[-TILE, 0], [0, TILE]]);
+render();
+</script>
+</body>
+</html>
+"""
+
+
+class TileRenderer:
+    """
+    Render tiles on a pool of processes, through a `TileCache`.
+
+    Parameters
+    ----------
+    cache : TileCache
+        Cache of the rendered tiles.
+    processes, threads : int
+        Number of processes and numba threads per process.
+    """
+
+    def __init__(self, cache, processes: int, threads: int):
+        self.cache = cache
+        self._pending: Dict[str, Future] = {}
+        self._lock = Lock()
+
+        # Workers are spawned, as numba threads are not safe to fork, and
+        # compile the kernels once, on their first tiles
+        self._executor = ProcessPoolExecutor(
+            processes,
+            mp_context=get_context("spawn"),
+            initializer=set_num_threads,
+            initargs=(threads,),
+        )
+
+    def tile(self, **params) -> bytes:
+        """PNG tile of `params`, see `src.tilemap.render_tile`."""
+        from src.tilemap import render_tile
+
+        key = self.cache.key(**params)
+        data = self.cache.get(key)
+
+        if data is not None:
+            return data
+
+        with self._lock:
+            future = self._pending.get(key)
+            submitted = future is None
+
+            if submitted:
+                future = self._executor.submit(render_tile, **params)
+                self._pending[key] = future
+
+        # A finished future runs its callback right away, which takes the lock
+        if submitted:
+            future.add_done_callback(lambda future: self._done(key, future))
+
+        return future.result()
+
+    def _done(self, key, future):
+        # Tiles are cached before they stop pending, so that none is missed
+        try:
+            if future.exception() is None:
+                self.cache.put(key, future.result())
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _tile_params(match, query) -> Optional[dict]:
+    """Parameters of the tile of a path and query, None if out of range."""
+    from src.formulas import FORMULAS
+    from src.tilemap import CENTERS, MAX_LEVEL, quadkey_to_tile
+    from src.utils import CMAPS
+
+    kind = match["kind"]
+
+    if "quadkey" in match.groupdict():
+        z, x, y = quadkey_to_tile(match["quadkey"])
+    else:
+        z, x, y = int(match["z"]), int(match["x"]), int(match["y"])
+
+    if kind not in CENTERS or z > MAX_LEVEL:
+        return None
+    if not (0 <= x < 2**z and 0 <= y < 2**z):
+        return None
+
+    query = {name: values[-1] for name, values in query.items()}
+    params = {
+        "kind": kind,
+        "z": z,
+        "x": x,
+        "y": y,
+        "max_iter": int(query.get("max_iter", 200)),
+        "cmap": query.get("cmap", "ultra"),
+        "formula": query.get("formula", "mandelbrot"),
+    }
+
+    if not 1 <= params["max_iter"] <= 100000:
+        raise ValueError("max_iter must be between 1 and 100000")
+    if params["cmap"] not in CMAPS:
+        raise ValueError(f"cmap must be one of {sorted(CMAPS)}")
+    if params["formula"] not in FORMULAS:
+        raise ValueError(f"formula must be one of {sorted(FORMULAS)}")
+
+    if kind == "julia":
+        params["c"] = complex(query.get("c", "-0.8+0.156j").replace(" ", ""))
+
+    return params
+
+
+def _viewer() -> bytes:
+    from src.compute import _set_limits
+    from src.formulas import FORMULAS
+    from src.tilemap import CENTERS, MAX_LEVEL
+    from src.utils import CMAPS
+
+    limits = {}
+
+    for kind, center in CENTERS.items():
+        xlim, ylim = _set_limits(center, 1)
+        limits[kind] = [float(xlim[0]), float(ylim[1])]
+
+    options = {
+        "CMAP_OPTIONS": "".join(
+            f"<option{' selected' * (name == 'ultra')}>{name}</option>"
+            for name in CMAPS
+        ),
+        "FORMULA_OPTIONS": "".join(
+            f"<option>{name}</option>" for name in FORMULAS
+        ),
+        "LIMITS_JSON": json.dumps(limits),
+        "MAX_LEVEL": str(MAX_LEVEL),
+    }
+    html = VIEWER
+
+    for name, value in options.items():
+        html = html.replace(name, value)
+
+    return html.encode()
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    """Serve the viewer and the tiles of `server.renderer`."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path == "/":
+            self._send(200, "text/html; charset=utf-8", _viewer())
+            return
+
+        matches = [pattern.match(url.path) for pattern in TILE_PATHS]
+        match = next(filter(None, matches), None)
+
+        if match is None:
+            self.send_error(404)
+            return
+
+        try:
+            params = _tile_params(match, parse_qs(url.query))
+        except ValueError as error:
+            self.send_error(400, explain=str(error))
+            return
+
+        if params is None:
+            self.send_error(404, explain="Tile out of range")
+            return
+
+        try:
+            data = self.server.renderer.tile(**params)
+        except Exception as error:
+            self.send_error(500, explain=f"Tile render failed: {error!r}")
+            return
+
+        self._send(200, "image/png", data, cache=True)
+
+    def _send(self, code, content_type, data, cache=False):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+
+        if cache:
+            self.send_header("Cache-Control", "max-age=86400")
+
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(
+    host: str = typer.Option("localhost", help="Address to listen on"),
+    port: int = typer.Option(8000, help="Port to listen on"),
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+    cache: bool = typer.Option(
+        True, help="Keep rendered tiles on disk, in the field cache directory"
+    ),
+    cache_size: float = typer.Option(
+        1, help="Maximum size of the tiles on disk, in GiB"
+    ),
+):
+    """Serve map tiles of the sets, and a viewer to explore them."""
+    from src.cache import CACHE_DIR
+    from src.tilemap import TileCache
+
+    processes, threads = plan_workers(True, processes, threads)
+    tile_cache = TileCache(
+        CACHE_DIR.joinpath("tiles") if cache else None,
+        max_bytes=int(cache_size * 2**30),
+    )
+
+    server = ThreadingHTTPServer((host, port), TileHandler)
+    server.renderer = TileRenderer(tile_cache, processes, threads)
+
+    typer.echo(
+        f"Serving on http://{host}:{port} with {processes} processes x "
+        f"{threads} threads, press Ctrl+C to stop"
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.renderer.shutdown()
+
+
+app = typer.Typer()
+app.command("serve")(serve)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,18 +1,44 @@
-import matplotlib.pyplot as plt
+"""
+Documentation images, rebuilt only when their inputs change.
+
+Each image of `FIGURES` is keyed by a hash of its inputs: the source of its
+function, the parameters of its panels and their colormaps, and the version
+of the code rendering it (see `_render_version`), which includes the plot
+style and the source of the `src` package. Keys are recorded in a manifest
+in `STATIC_IMG_DIR`.
+
+Images whose key changed are rebuilt in two parallel steps: the fields of
+all their panels are computed into a field cache in a temporary directory,
+one per process, then the images are drawn from the cache, one per process.
+The user's field cache, see `src.cache.CACHE_DIR`, is not written. Images with several
+panels, such as the three views of ``mandelbrot-zoom.png``, do not bound
+``all`` by computing their panels one after the other.
+"""
+
+import hashlib
+import inspect
+import json
+from multiprocessing import cpu_count
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
 import typer
-from matplotlib.patches import Rectangle
 
-from cli._utils import STATIC_IMG_DIR
-from src.plotting import plot_julia, plot_mandelbrot
-from src.utils import linear_cmap, set_plot_style
+from cli._utils import (
+    ARGS,
+    STATIC_IMG_DIR,
+    FrameManifest,
+    save_frames,
+    setup_plot_style,
+)
 
-if not STATIC_IMG_DIR.exists():
-    STATIC_IMG_DIR.mkdir()
+STATIC_IMG_DIR.mkdir(parents=True, exist_ok=True)
 
 JULIA_ARGS = {
     "max_iter": 100,
     "number_points": 600,
-    "cmap": linear_cmap("ultra", N=4096),
+    "cmap": "ultra",
     "smoothing": True,
 }
 
@@ -21,68 +47,137 @@ MANDELBROT_ARGS = {
     "number_points": 600,
     "axis_labels": True,
     "smoothing": True,
-    "cmap": linear_cmap("ultra", N=4096),
+    "cmap": "ultra",
+}
+
+# Panels of the images, as the set plotted and the arguments of its plot
+# function, see `_plot`. Colormaps of `src.utils.CMAPS` are given by name,
+# so that matplotlib is only imported to draw.
+JULIA_PANELS = [
+    ("julia", {"c": -1, **JULIA_ARGS}),
+    ("julia", {"c": 1j, **JULIA_ARGS}),
+]
+
+BW_PANELS = [
+    (
+        "mandelbrot",
+        {
+            "number_points": MANDELBROT_ARGS["number_points"],
+            "axis_labels": MANDELBROT_ARGS["axis_labels"],
+            "cmap": "gray_r",
+        },
+    )
+]
+
+COLORED_PANELS = [("mandelbrot", MANDELBROT_ARGS)]
+
+ZOOM_PANELS = [
+    ("mandelbrot", MANDELBROT_ARGS),
+    ("mandelbrot", {"center": -0.12 + 0.85j, "zoom": 6, **MANDELBROT_ARGS}),
+    (
+        "mandelbrot",
+        {"center": -0.16 + 1.035j, "zoom": 100, **MANDELBROT_ARGS},
+    ),
+]
+
+SMOOTHING_ARGS = {
+    "max_iter": 100,
+    "center": 0.3,
+    "zoom": 20,
+    "cmap": "ultra",
+}
+
+SMOOTHING_PANELS = [
+    ("mandelbrot", SMOOTHING_ARGS),
+    ("mandelbrot", {"smoothing": True, **SMOOTHING_ARGS}),
+]
+
+BUILD_ARGS = {
+    "force": typer.Option(
+        False, help="Rebuild the images even if their inputs are unchanged"
+    ),
 }
 
 
-set_plot_style(font="Merriweather")
 app = typer.Typer(help="Save static plot images as PNG at images/ directory.")
 
 mandelbrot_app = typer.Typer()
 app.add_typer(mandelbrot_app, name="mandelbrot")
 
 
-def _save_fig(file_name: str, dpi: float, **kwargs):
-    plt.savefig(
-        STATIC_IMG_DIR.joinpath(file_name),
-        dpi=dpi,
-        bbox_inches="tight",
-    )
+def _save_fig(path: Path, dpi: float, **kwargs):
+    import matplotlib.pyplot as plt
 
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+
+
+def _plot(kind: str, cache_dir: Path, ax=None, **kwargs):
+    """Plot a panel with the fields of the field cache in `cache_dir`."""
+    from src.cache import FieldCache
+    from src.plotting import plot_julia, plot_mandelbrot
+    from src.utils import CMAPS, linear_cmap
+
+    if kwargs.get("cmap") in CMAPS:
+        kwargs["cmap"] = linear_cmap(kwargs["cmap"], N=4096)
+
+    plot = {"julia": plot_julia, "mandelbrot": plot_mandelbrot}[kind]
+    plot(ax=ax, cache=FieldCache(cache_dir), **kwargs)
+
+
+def _plot_panels(axes, panels, cache_dir: Path):
+    """Plot each of `panels` on `axes`."""
+    for ax, (kind, kwargs) in zip(axes, panels):
+        _plot(kind, cache_dir, ax, **kwargs)
+
+
+def compute_panel(kind: str, kwargs: dict, cache_dir: Path):
+    """Compute the field of a panel into the field cache in `cache_dir`."""
+    import matplotlib.pyplot as plt
+
+    _plot(kind, cache_dir, **kwargs)
+    plt.close("all")
+
+
+def save_julia(path: Path, cache_dir: Path):
+    import matplotlib.pyplot as plt
 
-@app.command()
-def julia():
     fig, ax = plt.subplots(1, 2, sharey=True)
 
-    plot_julia(c=-1, ax=ax[0], **JULIA_ARGS)
+    _plot_panels(ax, JULIA_PANELS, cache_dir)
     ax[0].set(title="c = -1", xlabel="Re(z)", ylabel="Im(z)")
-
-    plot_julia(c=1j, ax=ax[1], **JULIA_ARGS)
     ax[1].set(title="c = i", xlabel="Re(z)")
 
     dpi = JULIA_ARGS["number_points"] / 3.625
-    _save_fig("julia-set.png", dpi)
+    _save_fig(path, dpi)
 
 
-@mandelbrot_app.command("bw")
-def mandelbrot_bw():
-    plot_mandelbrot(
-        number_points=MANDELBROT_ARGS["number_points"],
-        axis_labels=MANDELBROT_ARGS["axis_labels"],
-        cmap="gray_r",
-    )
+def save_mandelbrot_bw(path: Path, cache_dir: Path):
+    import matplotlib.pyplot as plt
+
+    _plot_panels([None], BW_PANELS, cache_dir)
 
     plt.xlabel("Re(c)")
     plt.ylabel("Im(c)")
 
-    _save_fig("mandelbrot-bw.png", dpi=200)
+    _save_fig(path, dpi=200)
 
 
-@mandelbrot_app.command("colored")
-def mandelbrot_colored():
-    fig = plot_mandelbrot(**MANDELBROT_ARGS)
+def save_mandelbrot_colored(path: Path, cache_dir: Path):
+    import matplotlib.pyplot as plt
+
+    _plot_panels([None], COLORED_PANELS, cache_dir)
 
     plt.colorbar()
     plt.xlabel("Re(c)")
     plt.ylabel("Im(c)")
 
     dpi = MANDELBROT_ARGS["number_points"] / 3
-    _save_fig("mandelbrot-colored.png", dpi)
-
-    plt.close(fig)
+    _save_fig(path, dpi)
 
 
 def _draw_box(ax, center, zoom, color=None, **kwargs):
+    from matplotlib.patches import Rectangle
+
     a = 3 / zoom
 
     ax.add_patch(
@@ -92,20 +187,17 @@ def _draw_box(ax, center, zoom, color=None, **kwargs):
             height=a,
             edgecolor=color,
             fill=False,
-            **kwargs
+            **kwargs,
         )
     )
 
 
-@mandelbrot_app.command("zoom")
-def mandelbrot_zoom():
+def save_mandelbrot_zoom(path: Path, cache_dir: Path):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(1, 3)
 
-    plot_mandelbrot(ax=ax[0], **MANDELBROT_ARGS)
-    plot_mandelbrot(center=-0.12 + 0.85j, zoom=6, ax=ax[1], **MANDELBROT_ARGS)
-    plot_mandelbrot(
-        center=-0.16 + 1.035j, zoom=100, ax=ax[2], **MANDELBROT_ARGS
-    )
+    _plot_panels(ax, ZOOM_PANELS, cache_dir)
 
     ax[0].set_title("(a)")
     ax[0].axis("off")
@@ -119,22 +211,15 @@ def mandelbrot_zoom():
     _draw_box(ax[0], center=-0.12 + 0.85j, zoom=6, color="#C12D1A")
     _draw_box(ax[1], center=-0.16 + 1.035j, zoom=100, color="#C12D1A")
 
-    _save_fig("mandelbrot-zoom.png", dpi=300, pad_inches=0, transparent=True)
+    _save_fig(path, dpi=300, pad_inches=0, transparent=True)
 
 
-@mandelbrot_app.command("smoothing")
-def mandelbrot_smoothing():
-    fig, ax = plt.subplots(1, 2)
+def save_mandelbrot_smoothing(path: Path, cache_dir: Path):
+    import matplotlib.pyplot as plt
 
-    zoom_args = {
-        "max_iter": 100,
-        "center": 0.3,
-        "zoom": 20,
-        "cmap": linear_cmap("ultra", N=4096),
-    }
+    fig, ax = plt.subplots(1, 2)
 
-    plot_mandelbrot(ax=ax[0], **zoom_args)
-    plot_mandelbrot(ax=ax[1], smoothing=True, **zoom_args)
+    _plot_panels(ax, SMOOTHING_PANELS, cache_dir)
 
     ax[0].set_title("(a)")
     ax[0].axis("off")
@@ -145,7 +230,230 @@ def mandelbrot_smoothing():
     plt.tight_layout()
 
     dpi = MANDELBROT_ARGS["number_points"] / 3.625
-    _save_fig("mandelbrot-smoothing.png", dpi)
+    _save_fig(path, dpi)
+
+
+# Images of `all`, with their save function and their panels
+FIGURES = {
+    "julia-set.png": (save_julia, JULIA_PANELS),
+    "mandelbrot-bw.png": (save_mandelbrot_bw, BW_PANELS),
+    "mandelbrot-colored.png": (save_mandelbrot_colored, COLORED_PANELS),
+    "mandelbrot-zoom.png": (save_mandelbrot_zoom, ZOOM_PANELS),
+    "mandelbrot-smoothing.png": (save_mandelbrot_smoothing, SMOOTHING_PANELS),
+}
+
+
+def _encode(value):
+    """
+    JSON encoding of the inputs that have none, such as complex centers.
+    Colormaps are given by name, and their colors are part of
+    `_render_version`.
+    """
+    return repr(value)
+
+
+def _render_version() -> str:
+    """Hash of the code shared by the images, and of the plot style."""
+    import matplotlib
+
+    import src
+
+    digest = hashlib.sha1(matplotlib.__version__.encode())
+
+    # The whole package, as the images depend on most of it through the
+    # plot functions, e.g. the formulas and the kernels of `src.compute`
+    for path in sorted(Path(src.__file__).parent.glob("*.py")):
+        digest.update(path.read_bytes())
+
+    for code in (setup_plot_style, _save_fig, _draw_box, _plot):
+        digest.update(inspect.getsource(code).encode())
+
+    return digest.hexdigest()
+
+
+def _figure_key(name: str) -> str:
+    """Hash of the source of the save function of `name`, and of its inputs."""
+    save, panels = FIGURES[name]
+    text = inspect.getsource(save) + json.dumps(
+        panels, sort_keys=True, default=_encode
+    )
+
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def save_figure(name: str, path: Path, key: str, cache_dir: Path):
+    """
+    Save the image `name` of `FIGURES` to `path`, keyed by `key`, with the
+    fields of the field cache in `cache_dir`.
+    """
+    import matplotlib.pyplot as plt
+
+    setup_plot_style()
+
+    FIGURES[name][0](path, cache_dir)
+    plt.close("all")
+
+
+def build(
+    names: List[str],
+    force: bool = False,
+    processes: int = None,
+    threads: int = None,
+):
+    """
+    Save the images `names` of `FIGURES` whose inputs changed since they
+    were last saved.
+
+    The fields of their panels are computed first, one per process by
+    default, then the images are drawn from the field cache, one per process
+    by default. The cache is removed afterwards.
+    """
+    manifest = FrameManifest(
+        STATIC_IMG_DIR.joinpath("manifest.json"),
+        save_figure,
+        version=_render_version(),
+    )
+
+    figure_args = [
+        (name, STATIC_IMG_DIR.joinpath(name), _figure_key(name))
+        for name in names
+    ]
+
+    if force:
+        for name in names:
+            manifest.frames.pop(name, None)
+
+    changed = [
+        args
+        for args in figure_args
+        if not manifest.is_saved(args[1], manifest.key(args))
+    ]
+    # Panels shared by images, e.g. the full view of the Mandelbrot set, are
+    # computed once
+    panels = {
+        json.dumps(panel, sort_keys=True, default=_encode): panel
+        for name, *_ in changed
+        for panel in FIGURES[name][1]
+    }
+
+    def n_processes(n_tasks):
+        return processes or max(1, min(n_tasks, cpu_count()))
+
+    with TemporaryDirectory(prefix="fractal-static-") as cache_dir:
+        cache_dir = Path(cache_dir)
+
+        if panels:
+            save_frames(
+                compute_panel,
+                [(*panel, cache_dir) for panel in panels.values()],
+                processes=n_processes(len(panels)),
+                threads=threads,
+            )
+
+        # Images are keyed without the cache directory, which changes
+        save_frames(
+            save_figure,
+            [(*args, cache_dir) for args in figure_args],
+            processes=n_processes(len(changed)),
+            threads=threads,
+            manifest=manifest,
+            key=lambda args: args[:3],
+        )
+
+
+@app.command("all")
+def build_all(
+    force: bool = BUILD_ARGS["force"],
+    processes: int = ARGS["processes"],
+    threads: int = ARGS["threads"],
+):
+    """Save the images whose inputs changed, in parallel."""
+    build(list(FIGURES), force, processes, threads)
+
+
+@app.command()
+def julia(force: bool = BUILD_ARGS["force"]):
+    build(["julia-set.png"], force)
+
+
+@mandelbrot_app.command("bw")
+def mandelbrot_bw(force: bool = BUILD_ARGS["force"]):
+    build(["mandelbrot-bw.png"], force)
+
+
+@mandelbrot_app.command("colored")
+def mandelbrot_colored(force: bool = BUILD_ARGS["force"]):
+    build(["mandelbrot-colored.png"], force)
+
+
+@mandelbrot_app.command("zoom")
+def mandelbrot_zoom(force: bool = BUILD_ARGS["force"]):
+    build(["mandelbrot-zoom.png"], force)
+
+
+@mandelbrot_app.command("smoothing")
+def mandelbrot_smoothing(force: bool = BUILD_ARGS["force"]):
+    build(["mandelbrot-smoothing.png"], force)
+
+
+@mandelbrot_app.command("poster")
+def mandelbrot_poster(
+    number_points: int = typer.Option(50000, help="Pixels along each side"),
+    center: str = typer.Option("-0.5", help="Center point, e.g. -0.75+0.1j"),
+    zoom: float = typer.Option(1, help="Zoom ratio"),
+    max_iter: int = typer.Option(500, help="Maximum number of iterations"),
+    tile_size: int = typer.Option(
+        None, help="Side of rendered tiles, by default `src.tiles.TILE_SIZE`"
+    ),
+    cmap: str = typer.Option(
+        "ultra", help="Colormap name in `src.utils.CMAPS`"
+    ),
+):
+    """
+    Save a poster-sized Mandelbrot set, rendered out of core by tiles.
+
+    The field is kept in the ``poster`` directory of the field cache, so
+    that interrupted renders resume and colormaps change without rendering
+    again. It is not part of ``all``.
+    """
+    import imageio
+
+    from src.cache import CACHE_DIR
+    from src.colorize import colorize
+    from src.tiles import TILE_SIZE, field_limits, render_tiles, save_png
+    from src.utils import cmap_lut, linear_cmap
+
+    # Poster fields, in their own directory so that the field cache, which
+    # evicts the ``.npy`` files of `CACHE_DIR`, does not delete them
+    poster_dir = CACHE_DIR.joinpath("poster")
+    poster_dir.mkdir(parents=True, exist_ok=True)
+    field_path = poster_dir.joinpath("mandelbrot-poster.npy")
+
+    field, overview = render_tiles(
+        field_path,
+        number_points,
+        max_iter,
+        complex(center.replace(" ", "")),
+        zoom,
+        # Posters are wide views, whose large interior areas are skipped
+        interior_check=True,
+        tile_size=tile_size or TILE_SIZE,
+    )
+
+    lut = cmap_lut(linear_cmap(cmap, N=4096))
+    vmin, vmax = field_limits(field_path)
+
+    imageio.imwrite(
+        STATIC_IMG_DIR.joinpath("mandelbrot-poster-overview.png"),
+        colorize(overview, lut, vmin, vmax),
+    )
+    save_png(
+        field,
+        STATIC_IMG_DIR.joinpath("mandelbrot-poster.png"),
+        lut,
+        vmin,
+        vmax,
+    )
 
 
 if __name__ == "__main__":
@@ -1 +1,18 @@
-from src.plotting import plot_julia, plot_mandelbrot  # noqa F401
+from src.compute import (  # noqa F401
+    compute_julia,
+    compute_julia_batch,
+    compute_mandelbrot,
+    progressive_julia,
+    progressive_mandelbrot,
+)
+from src.state import RenderState  # noqa F401
+
+
+def __getattr__(name):
+    # Plotting functions are imported on demand to avoid importing matplotlib
+    if name in {"plot_field", "plot_julia", "plot_mandelbrot"}:
+        from src import plotting
+
+        return getattr(plotting, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,343 @@
+"""
+Cache of computed escape fields.
+
+Fields are stored without smoothing, together with the norm of the last
+iterate of each point, so that smoothing, colormaps and color limits can
+change without iterating again. Entries are kept in a memory LRU, bounded
+in bytes, and in memory-mapped ``.npy`` files on disk, evicted by least
+recent use when the directory exceeds its size limit, `CACHE_SIZE_ENV` GiB
+or 4 GiB by default.
+"""
+
+import hashlib
+import inspect
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.compute import _apply_smoothing, compute_julia, compute_mandelbrot
+from src.formulas import MANDELBROT, get_formula
+from src.perturbation import _parse_center
+from src.stats import stage
+
+CACHE_DIR = Path(
+    os.environ.get("FRACTAL_CACHE_DIR", "~/.cache/fractal-sets")
+).expanduser()
+
+# Environment variable of the default size limit of the cache, in GiB, read
+# by the processes of a pool too
+CACHE_SIZE_ENV = "FRACTAL_CACHE_SIZE"
+
+COMPUTE = {"mandelbrot": compute_mandelbrot, "julia": compute_julia}
+
+# Parameters of the compute functions that change the fields. The others,
+# e.g. `engine`, `adaptive` and `interior_check`, only change how they are
+# computed, so that fields computed either way share their entries
+FIELD_PARAMS = {
+    "center": lambda center: [
+        str(x.normalize()) for x in _parse_center(center)
+    ],
+    "zoom": float,
+    "c": complex,
+    "max_iter": int,
+    "number_points": int,
+    "dtype": lambda dtype: np.dtype(dtype).name,
+    "formula": lambda formula: tuple(get_formula(formula)),
+}
+
+
+def _evict_files(directory: Path, pattern: str, max_bytes: int):
+    """Delete the least recently used `pattern` files beyond `max_bytes`."""
+    files = []
+
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # Evicted by another process
+            continue
+
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+
+        total -= size
+
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FieldCache:
+    """
+    Least recently used cache of escape fields.
+
+    Parameters
+    ----------
+    directory : Path, optional
+        Directory of the ``.npy`` files. If None, only the memory cache is
+        used.
+    max_memory : int, default 64 MiB
+        Maximum size of the fields kept in memory, in bytes. Fields read
+        from `directory` are memory-mapped and not counted, as the page
+        cache holds them.
+    max_bytes : int, optional
+        Maximum size of the files in `directory`, checked every
+        `evict_every` new fields. By default, `CACHE_SIZE_ENV` GiB if set,
+        and 4 GiB otherwise.
+    evict_every : int, default 16
+        Number of fields stored between evictions of the files, by each
+        process using the directory.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = CACHE_DIR,
+        max_memory: int = 64 * 2**20,
+        max_bytes: int = None,
+        evict_every: int = 16,
+    ):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(CACHE_SIZE_ENV, 4)) * 2**30)
+
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._n_puts = 0
+
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(**params) -> str:
+        """Hash of the parameters of a field."""
+        text = repr(
+            sorted((name, str(value)) for name, value in params.items())
+        )
+
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory.joinpath(f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the stacked count and norm arrays of `key`, if cached."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+
+            return self._memory[key]
+
+        if self.directory is None:
+            return None
+
+        path = self._path(key)
+
+        try:
+            os.utime(path)
+            entry = np.load(path, mmap_mode="r")
+        except FileNotFoundError:  # Not cached, or evicted by another process
+            return None
+
+        self._remember(key, entry)
+
+        return entry
+
+    def put(
+        self, key: str, count: np.ndarray, norm: np.ndarray = None
+    ) -> np.ndarray:
+        """Store the count and, if given, norm arrays of `key`."""
+        entry = np.stack([count] if norm is None else [count, norm])
+        self._remember(key, entry)
+
+        if self.directory is not None:
+            # Write to a temporary file first, as other processes may read it
+            tmp_path = self.directory.joinpath(f"{key}.{os.getpid()}.tmp")
+
+            with open(tmp_path, "wb") as file:
+                np.save(file, entry)
+
+            os.replace(tmp_path, self._path(key))
+            self._n_puts += 1
+
+            if self._n_puts % self.evict_every == 0:
+                _evict_files(self.directory, "*.npy", self.max_bytes)
+
+        return entry
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory_bytes += self._nbytes(entry)
+
+        while self._memory_bytes > self.max_memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= self._nbytes(evicted)
+
+    @staticmethod
+    def _nbytes(entry) -> int:
+        return 0 if isinstance(entry, np.memmap) else entry.nbytes
+
+
+_default_cache = None
+
+
+def default_cache() -> FieldCache:
+    """Cache at `CACHE_DIR`, shared by the calls of a process."""
+    global _default_cache
+
+    if _default_cache is None:
+        _default_cache = FieldCache()
+
+    return _default_cache
+
+
+def set_cache_size(max_bytes: int):
+    """
+    Set the size limit of `default_cache()`, for this process and for the
+    processes it starts afterwards, e.g. of `cli._utils.get_pool`.
+    """
+    os.environ[CACHE_SIZE_ENV] = str(max_bytes / 2**30)
+
+    if _default_cache is not None:
+        _default_cache.max_bytes = int(max_bytes)
+
+
+def _field_key(cache: FieldCache, kind: str, **params) -> str:
+    """
+    Key of a field, from the `FIELD_PARAMS` of the compute function with
+    their defaults, normalized so that e.g. ``center=-0.5`` and
+    ``center="-0.5+0j"`` share the key. Supersampled fields are also keyed by
+    `supersampling` and `smoothing`, as they are stored smoothed.
+    """
+    signature = inspect.signature(COMPUTE[kind]).parameters
+    params = {
+        **{
+            name: parameter.default
+            for name, parameter in signature.items()
+            if parameter.default is not inspect.Parameter.empty
+        },
+        **params,
+    }
+    key = {
+        name: normalize(params[name])
+        for name, normalize in FIELD_PARAMS.items()
+        if name in params
+    }
+
+    if params.get("supersampling", 1) > 1:
+        key["supersampling"] = int(params["supersampling"])
+        key["smoothing"] = bool(params.get("smoothing"))
+
+    return cache.key(kind=kind, **key)
+
+
+def cached_field(
+    kind: str,
+    smoothing: bool = False,
+    cache: FieldCache = None,
+    **params,
+) -> np.ndarray:
+    """
+    Compute a field with `compute_mandelbrot` or `compute_julia`, memoized.
+
+    Parameters
+    ----------
+    kind : {"mandelbrot", "julia"}
+        Set to compute.
+    smoothing : bool, default False
+        If True, apply continuous color smoothing. It is not part of the key.
+    cache : FieldCache, optional
+        Cache to use. If None, use `default_cache()`.
+    **params
+        Keyword arguments of the compute function, such as `center`, `zoom`,
+        `c`, `max_iter` and `number_points`. Fields with `supersampling` are
+        stored smoothed, as they average smoothed samples.
+
+    Returns
+    -------
+    numpy.ndarray
+        Number of iterations of each point.
+    """
+    assert kind in COMPUTE, f"`kind` must be one of {set(COMPUTE)}"
+
+    if params.get("supersampling", 1) > 1:
+        # Supersampled fields average smoothed samples, so their number of
+        # iterations and norms cannot be stored, only the fields themselves
+        if "max_iter" in params:
+            params["max_iter"] = int(params["max_iter"])
+
+        cache = cache or default_cache()
+        key = _field_key(cache, kind, smoothing=smoothing, **params)
+        entry = cache.get(key)
+
+        if entry is None:
+            field = COMPUTE[kind](smoothing=smoothing, **params)
+            entry = cache.put(key, field)
+
+        return np.array(entry[0])
+
+    count, norm = cached_escape(kind, cache, **params)
+
+    if smoothing:
+        with stage("smoothing"):
+            max_iter = int(params.get("max_iter", 200))
+            degree = get_formula(params.get("formula", MANDELBROT)).degree
+
+            return _apply_smoothing(count, norm, max_iter, degree)
+
+    return np.array(count)
+
+
+def cached_escape(
+    kind: str, cache: FieldCache = None, **params
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the number of iterations of a field and the norms of the last
+    iterates, memoized.
+
+    Smoothing can then be applied while coloring, with
+    ``colorize(count, lut, norm=norm, max_iter=max_iter)``.
+
+    Parameters
+    ----------
+    kind, cache, **params
+        See `cached_field`. `supersampling` is not available.
+
+    Returns
+    -------
+    count, norm : numpy.ndarray
+        Read-only arrays of the cache.
+    """
+    assert kind in COMPUTE, f"`kind` must be one of {set(COMPUTE)}"
+    assert (
+        params.pop("supersampling", 1) == 1
+    ), "`norm` is not written with `supersampling`"
+
+    if "max_iter" in params:
+        params["max_iter"] = int(params["max_iter"])
+
+    cache = cache or default_cache()
+    key = _field_key(cache, kind, **params)
+    entry = cache.get(key)
+
+    if entry is None:
+        number_points = int(params.get("number_points", 300))
+        dtype = params.get("dtype", np.float64)
+
+        norm = np.empty((number_points, number_points), dtype=dtype)
+        count = COMPUTE[kind](**params, norm=norm)
+
+        entry = cache.put(key, count, norm)
+
+    count, norm = entry
+
+    return count, norm
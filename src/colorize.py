@@ -0,0 +1,183 @@
+"""
+Escape fields colored to RGB images without matplotlib figures.
+
+Colors match ``imshow(count, origin="lower", cmap=cmap)`` with a linear
+norm, pixel by pixel: the image has exactly one pixel per point, with rows
+from the top of the imaginary axis. `palette_index` maps fields to the
+indices of the colors instead, for palette images such as GIF frames.
+"""
+
+import numpy as np
+from numba import jit, prange
+
+from src.compute import _smooth
+
+
+@jit(nopython=True, cache=True)
+def _value(count, norm, max_iter, degree, smoothing, i, j):
+    if smoothing:
+        return _smooth(count[i, j], norm[i, j], max_iter, degree)
+
+    return count[i, j]
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _color_limits(count, norm, max_iter, degree, smoothing):
+    rows = count.shape[0]
+    lower = np.full(rows, np.inf)
+    upper = np.full(rows, -np.inf)
+
+    for i in prange(rows):
+        for j in range(count.shape[1]):
+            value = _value(count, norm, max_iter, degree, smoothing, i, j)
+
+            if value < lower[i]:
+                lower[i] = value
+            if value > upper[i]:
+                upper[i] = value
+
+    return lower.min(), upper.max()
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _colorize(count, norm, max_iter, degree, smoothing, vmin, vmax, lut, out):
+    rows = count.shape[0]
+    n_colors = lut.shape[0]
+    scale = n_colors / (vmax - vmin) if vmax > vmin else 0.0
+
+    for i in prange(rows):
+        for j in range(count.shape[1]):
+            value = _value(count, norm, max_iter, degree, smoothing, i, j)
+
+            if np.isnan(value):  # "bad" color of matplotlib colormaps
+                out[rows - 1 - i, j, :] = 0
+                continue
+
+            index = min(max((value - vmin) * scale, 0.0), n_colors - 1.0)
+            out[rows - 1 - i, j, :] = lut[int(index)]
+
+
+def colorize(
+    count: np.ndarray,
+    lut: np.ndarray,
+    vmin: float = None,
+    vmax: float = None,
+    norm: np.ndarray = None,
+    max_iter: int = None,
+    out: np.ndarray = None,
+    degree: int = 2,
+) -> np.ndarray:
+    """
+    Color an escape field with a lookup table.
+
+    Parameters
+    ----------
+    count : numpy.ndarray
+        Number of iterations of each point, with rows along the imaginary
+        axis, as from `compute_mandelbrot`.
+    lut : numpy.ndarray
+        ``(N, 3)`` uint8 array of colors, such as from `src.utils.cmap_lut`.
+    vmin, vmax : float, optional
+        Values mapped to the first and last colors. If None, the minimum and
+        maximum of the field.
+    norm : numpy.ndarray, optional
+        Norm of the last iterate of each point, as written by
+        ``compute_mandelbrot(norm=...)``. If given, continuous color
+        smoothing is applied to `count` while coloring.
+    max_iter : int, optional
+        Maximum number of iterations of `count`. Required with `norm`.
+    out : numpy.ndarray, optional
+        ``(rows, columns, 3)`` uint8 array to write the image to.
+    degree : int, default 2
+        Degree of the formula of `count`, for smoothing, see
+        `src.formulas.Formula`.
+
+    Returns
+    -------
+    numpy.ndarray
+        RGB image, with the first row at the top of the imaginary axis.
+    """
+    shape = (*np.shape(count), 3)
+
+    if out is None:
+        out = np.empty(shape, dtype=np.uint8)
+
+    assert out.shape == shape, f"`out` must have shape {shape}"
+    assert out.dtype == np.uint8, "`out` must have dtype uint8"
+
+    lut = np.ascontiguousarray(lut[:, :3], dtype=np.uint8)
+
+    return _map_field(count, lut, vmin, vmax, norm, max_iter, out, degree)
+
+
+def _map_field(count, lut, vmin, vmax, norm, max_iter, out, degree):
+    """Write the rows of `lut` of the values of `count` to `out`."""
+    smoothing = norm is not None
+
+    if smoothing:
+        assert max_iter is not None, "`max_iter` is required with `norm`"
+        assert norm.shape == count.shape, "`norm` must have the same shape"
+    else:
+        norm = np.empty((0, 0), dtype=np.float64)
+        max_iter = 0
+
+    count, norm = np.asarray(count), np.asarray(norm)
+
+    if vmin is None or vmax is None:
+        lower, upper = _color_limits(
+            count, norm, int(max_iter), int(degree), smoothing
+        )
+        vmin = lower if vmin is None else vmin
+        vmax = upper if vmax is None else vmax
+
+    _colorize(
+        count,
+        norm,
+        int(max_iter),
+        int(degree),
+        smoothing,
+        float(vmin),
+        float(vmax),
+        lut,
+        out,
+    )
+
+    return out
+
+
+def palette_index(
+    count: np.ndarray,
+    n_colors: int = 256,
+    vmin: float = None,
+    vmax: float = None,
+    norm: np.ndarray = None,
+    max_iter: int = None,
+    degree: int = 2,
+) -> np.ndarray:
+    """
+    Map an escape field to the indices of a palette of `n_colors` colors.
+
+    Indices are those of the colors of `colorize` with a lookup table of
+    `n_colors` colors, such as ``cmap_lut(linear_cmap(name, N=n_colors))``.
+
+    Parameters
+    ----------
+    count, vmin, vmax, norm, max_iter, degree
+        See `colorize`.
+    n_colors : int, default 256
+        Number of colors of the palette, at most 256.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 array of palette indices, with the first row at the top of the
+        imaginary axis.
+    """
+    assert 1 <= n_colors <= 256, "`n_colors` must be between 1 and 256"
+
+    lut = np.arange(n_colors, dtype=np.uint8)[:, None]
+    out = np.empty((*np.shape(count), 1), dtype=np.uint8)
+
+    _map_field(count, lut, vmin, vmax, norm, max_iter, out, degree)
+
+    return out[..., 0]
@@ -0,0 +1,1480 @@
+from decimal import Decimal
+from functools import lru_cache
+from threading import Event
+from typing import Iterator, Sequence, Tuple, Union
+
+import numpy as np
+from numba import jit, literally, prange
+
+from src.formulas import (
+    MANDELBROT,
+    Formula,
+    _has_main_bulbs,
+    _is_symmetric,
+    _step,
+    get_formula,
+)
+from src.perturbation import perturbation_map, perturbation_points
+from src.stats import instrumented, record_field, record_iterated, stage
+
+ENGINES = {"standard", "perturbation"}
+
+BAILOUT = 1e8
+
+# Distance below which an orbit is considered to have returned to a point
+PERIOD_TOL = 1e-12
+
+# Number of points iterated together by the escape time kernel
+LANES = 8
+
+# Number of rows rendered between cancellation checks of progressive renders
+BAND = 64
+
+# Side of the tiles rendered in parallel by the adaptive kernel, and side
+# below which its rectangles are iterated point by point
+TILE = 64
+MIN_RECT = 4
+
+# Difference of iterations with a neighbor above which a pixel is at an edge
+# and supersampled
+EDGE_TOL = 1.0
+
+# Fraction of a pixel within which the opposite of a point of an axis is
+# taken to be on the axis, see `_mirror`
+MIRROR_TOL = 1e-3
+
+
+def _set_limits(center, zoom):
+    delta = (1.5 + 1.5j) / zoom
+    lims = [center - delta, center + delta]
+
+    return np.real(lims), np.imag(lims)
+
+
+def _create_grid(xlim, ylim, number_points):
+    x, y = np.ogrid[
+        xlim[0] : xlim[1] : int(number_points) * 1j,  # noqa: E203
+        ylim[0] : ylim[1] : int(number_points) * 1j,  # noqa: E203
+    ]
+
+    return (x + y * 1j).T
+
+
+def _create_axes(xlim, ylim, number_points, dtype):
+    """
+    Real and imaginary grid axes, such that ``c[i, j] = x[j] + y[i]j``.
+
+    Points whose opposite is on the same axis are set to its exact opposite,
+    and a point at 0 up to rounding to 0, so that symmetric sets are mirrored
+    pixel for pixel, see `_render`.
+    """
+    axes = []
+
+    for lim in (xlim, ylim):
+        axis = np.linspace(*lim, int(number_points))
+        mirror = _mirror(axis)
+        axis = axis.astype(dtype)
+
+        if mirror is not None:
+            m, _, mirrored = mirror
+            axis[mirrored] = -axis[m - np.arange(axis.size)[mirrored]]
+
+            if m % 2 == 0:
+                axis[m // 2] = 0
+
+        axes.append(axis)
+
+    return tuple(axes)
+
+
+def _mirror(axis):
+    """
+    Split of the evenly spaced `axis` about 0.
+
+    Returns ``(m, unique, mirrored)``, where `unique` and `mirrored` are
+    contiguous slices of `axis`, such that the points ``axis[i]`` of
+    `mirrored` are the opposites of the points ``axis[m - i]`` of `unique`,
+    up to rounding. Returns None if no point has its opposite on `axis`.
+    """
+    n = axis.size
+
+    if n < 2 or axis[0] == axis[-1]:
+        return None
+
+    position = -2 * float(axis[0]) * (n - 1) / float(axis[-1] - axis[0])
+    m = round(position)
+
+    if abs(position - m) > MIRROR_TOL or not 1 <= m <= 2 * n - 3:
+        return None
+
+    # Points without opposite are in `unique`, on the side of the larger part
+    if m >= n - 1:
+        return m, slice(0, m // 2 + 1), slice(m // 2 + 1, n)
+
+    return m, slice((m + 1) // 2, n), slice(0, (m + 1) // 2)
+
+
+def _create_out(out, number_points, dtype, batch=None):
+    shape = (int(number_points), int(number_points))
+
+    if batch is not None:
+        shape = (int(batch), *shape)
+
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+
+    assert out.shape == shape, f"`out` must have shape {shape}"
+    assert out.dtype == dtype, f"`out` must have dtype {np.dtype(dtype)}"
+
+    return out
+
+
+@jit(nopython=True, cache=True)
+def _smooth(count, r, max_iter, degree=2):
+    """Continuous iteration count of a point whose last iterate has norm `r`."""
+    if count < max_iter:
+        if degree == 2:
+            return count + 1 - np.log2(np.log2(r))
+
+        return count + 1 - np.log(np.log2(r)) / np.log(degree)
+
+    return count
+
+
+@jit(nopython=True, cache=True)
+def _in_main_bulbs(re, im):
+    """Whether `re + im*j` is in the main cardioid or in the period-2 bulb."""
+    x = re - 0.25
+    q = x**2 + im**2
+
+    in_cardioid = q * (q + x) <= 0.25 * im**2
+    in_bulb = (re + 1) ** 2 + im**2 <= 0.0625
+
+    return in_cardioid or in_bulb
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _logistic_map(z, c, count, max_iter, bulb_check=False, periodicity=False):
+    px, py = z.shape
+
+    for i in prange(px):
+        for j in prange(py):
+            if bulb_check and _in_main_bulbs(c[i, j].real, c[i, j].imag):
+                count[i, j] = max_iter
+                continue
+
+            # Brent's cycle detection: compare against a saved point that is
+            # moved forward every power-of-two number of iterations
+            saved = z[i, j]
+            period = 1
+            steps = 0
+
+            while (np.abs(z[i, j]) <= 1e8) and (count[i, j] < max_iter):
+                z[i, j] = z[i, j] ** 2 + c[i, j]
+                count[i, j] += 1
+
+                if periodicity:
+                    dz = z[i, j] - saved
+
+                    if dz.real**2 + dz.imag**2 < PERIOD_TOL**2:
+                        count[i, j] = max_iter
+                        break
+
+                    steps += 1
+
+                    if steps == period:
+                        saved = z[i, j]
+                        steps = 0
+                        period *= 2
+
+
+def _escape_rows(
+    x,
+    y,
+    c_re,
+    c_im,
+    julia,
+    degree,
+    conjugate,
+    absolute,
+    max_iter,
+    interior_check,
+    smoothing,
+    out,
+    norm,
+):
+    """
+    Escape time kernel over the grid ``x[j] + y[i]j``.
+
+    Each row is processed in groups of `LANES` points, whose orbits are kept
+    in real and imaginary scratch arrays. The group is iterated until all of
+    its points escape, with finished points masked out instead of branched
+    on, so that LLVM can vectorize the inner loop. Points past the end of a
+    row duplicate its last point. If `norm` is not empty, the norm of the
+    last iterate of each point is written to it.
+
+    `c_re` and `c_im` are arrays of Julia constants, one per image of the
+    batch, whose rows are stacked in `out`. The rows of all images are
+    processed in parallel.
+
+    The formula ``(degree, conjugate, absolute)``, see `src.formulas`, is
+    compiled as a constant, so that each formula has its own kernel.
+    """
+    literally(degree)
+    literally(conjugate)
+    literally(absolute)
+
+    formula = (degree, conjugate, absolute)
+    bailout = BAILOUT**2
+    tol = PERIOD_TOL**2
+    bulb_check = interior_check and not julia and _has_main_bulbs(formula)
+
+    for t in prange(c_re.size * y.size):
+        image, i = t // y.size, t % y.size
+
+        zr = np.empty(LANES, dtype=x.dtype)
+        zi = np.empty(LANES, dtype=x.dtype)
+        cr = np.empty(LANES, dtype=x.dtype)
+        ci = np.empty(LANES, dtype=x.dtype)
+        saved_r = np.empty(LANES, dtype=x.dtype)
+        saved_i = np.empty(LANES, dtype=x.dtype)
+        count = np.empty(LANES, dtype=np.int64)
+        alive = np.empty(LANES, dtype=np.bool_)
+
+        for j0 in range(0, x.size, LANES):
+            for k in range(LANES):
+                j = min(j0 + k, x.size - 1)
+
+                if julia:
+                    zr[k], zi[k] = x[j], y[i]
+                    cr[k], ci[k] = c_re[image], c_im[image]
+                else:
+                    zr[k], zi[k] = 0, 0
+                    cr[k], ci[k] = x[j], y[i]
+
+                count[k] = 0
+                alive[k] = True
+
+                if bulb_check:
+                    if _in_main_bulbs(x[j], y[i]):
+                        count[k] = max_iter
+                        alive[k] = False
+
+            saved_r[:] = zr
+            saved_i[:] = zi
+            period = 1
+            steps = 0
+
+            for _ in range(max_iter):
+                n_alive = 0
+
+                for k in range(LANES):
+                    a, b = zr[k], zi[k]
+                    re, im = _step(a, b, cr[k], ci[k], formula)
+
+                    live = alive[k] and a * a + b * b <= bailout
+                    zr[k] = re if live else a
+                    zi[k] = im if live else b
+
+                    count[k] += live
+                    alive[k] = live
+                    n_alive += live
+
+                if n_alive == 0:
+                    break
+
+                if interior_check:
+                    # Brent's cycle detection with a schedule shared by the
+                    # group, as all alive points have the same iteration count
+                    for k in range(LANES):
+                        dr = zr[k] - saved_r[k]
+                        di = zi[k] - saved_i[k]
+
+                        if alive[k] and dr * dr + di * di < tol:
+                            count[k] = max_iter
+                            alive[k] = False
+
+                    steps += 1
+
+                    if steps == period:
+                        saved_r[:] = zr
+                        saved_i[:] = zi
+                        steps = 0
+                        period *= 2
+
+            for k in range(min(LANES, x.size - j0)):
+                r = np.sqrt(zr[k] ** 2 + zi[k] ** 2)
+
+                if smoothing:
+                    out[t, j0 + k] = _smooth(count[k], r, max_iter, degree)
+                else:
+                    out[t, j0 + k] = count[k]
+
+                if norm.size:
+                    norm[t, j0 + k] = r
+
+
+# Compiled functions are cached on disk, next to the module, so that new
+# processes load them instead of compiling again. The fastmath variant is
+# not cached, as the cache of `_escape_rows` is not keyed by its flags.
+_escape_map = jit(nopython=True, parallel=True, cache=True)(_escape_rows)
+_escape_map_fastmath = jit(nopython=True, parallel=True, fastmath=True)(
+    _escape_rows
+)
+
+
+@lru_cache(maxsize=None)
+def _escape_kernel(fastmath, adaptive, formula):
+    """
+    Escape time kernel with the arguments of `formula` bound as constants.
+
+    Numba only selects the kernel compiled for a formula, see `_escape_rows`,
+    when the formula arguments are literals, as in this wrapper. Otherwise,
+    each call would type the kernel again. Wrappers are compiled in each
+    process, while the kernels they call are loaded from the cache.
+    """
+    if adaptive:
+        kernel = _mariani_silver
+    else:
+        kernel = _escape_map_fastmath if fastmath else _escape_map
+
+    degree, conjugate, absolute = formula
+
+    @jit(nopython=True)
+    def escape_kernel(
+        x, y, c_re, c_im, julia, max_iter, interior_check, smoothing, out, norm
+    ):
+        return kernel(
+            x,
+            y,
+            c_re,
+            c_im,
+            julia,
+            degree,
+            conjugate,
+            absolute,
+            max_iter,
+            interior_check,
+            smoothing,
+            out,
+            norm,
+        )
+
+    return escape_kernel
+
+
+@jit(nopython=True, cache=True)
+def _escape_point(zr, zi, cr, ci, formula, max_iter, periodicity):
+    """Number of iterations and last squared norm of the orbit of `z`."""
+    bailout = BAILOUT**2
+    tol = PERIOD_TOL**2
+
+    saved_r, saved_i = zr, zi
+    period = 1
+    steps = 0
+    n = 0
+
+    while n < max_iter and zr * zr + zi * zi <= bailout:
+        zr, zi = _step(zr, zi, cr, ci, formula)
+        n += 1
+
+        if periodicity:
+            dr, di = zr - saved_r, zi - saved_i
+
+            if dr * dr + di * di < tol:
+                return max_iter, 0.0
+
+            steps += 1
+
+            if steps == period:
+                saved_r, saved_i = zr, zi
+                steps = 0
+                period *= 2
+
+    return n, zr * zr + zi * zi
+
+
+@jit(nopython=True, cache=True)
+def _escape_value(
+    re, im, c_re, c_im, julia, formula, max_iter, interior_check
+):
+    """Number of iterations and last squared norm of the point ``re + im*j``."""
+    if julia:
+        zr, zi, cr, ci = re, im, c_re, c_im
+    else:
+        zr, zi, cr, ci = re * 0, im * 0, re, im
+
+    if (
+        interior_check
+        and not julia
+        and _has_main_bulbs(formula)
+        and _in_main_bulbs(re, im)
+    ):
+        return max_iter, 0.0
+
+    return _escape_point(zr, zi, cr, ci, formula, max_iter, interior_check)
+
+
+@jit(nopython=True, cache=True)
+def _adaptive_point(
+    i,
+    j,
+    x,
+    y,
+    c_re,
+    c_im,
+    julia,
+    formula,
+    max_iter,
+    interior_check,
+    smoothing,
+    out,
+    norm,
+):
+    n, r2 = _escape_value(
+        x[j], y[i], c_re, c_im, julia, formula, max_iter, interior_check
+    )
+
+    if smoothing:
+        out[i, j] = _smooth(n, np.sqrt(r2), max_iter, formula[0])
+    else:
+        out[i, j] = n
+
+    if norm.size:
+        norm[i, j] = np.sqrt(r2)
+
+    return n
+
+
+@jit(nopython=True, cache=True)
+def _push(stack, top, i0, i1, j0, j1):
+    stack[top, 0] = i0
+    stack[top, 1] = i1
+    stack[top, 2] = j0
+    stack[top, 3] = j1
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _mariani_silver(
+    x,
+    y,
+    c_re,
+    c_im,
+    julia,
+    degree,
+    conjugate,
+    absolute,
+    max_iter,
+    interior_check,
+    smoothing,
+    out,
+    norm,
+):
+    """
+    Adaptive escape time kernel by recursive subdivision (Mariani-Silver).
+
+    As the Mandelbrot set and connected Julia sets are connected, a rectangle
+    whose border points all have the same number of iterations is filled
+    with it. Otherwise, the rectangle is split in two along its longer side.
+    With `smoothing`, only rectangles of non-escaping points are filled, as
+    smoothed values vary inside iteration bands, and likewise when `norm` is
+    written, with the norm of a border point. Tiles of side `TILE` are
+    subdivided in parallel. The formula is compiled as a constant, as in
+    `_escape_rows`. See `_is_connected` for the sets it applies to.
+
+    Returns the number of points filled and the sum of their values, see
+    `src.stats.record_iterated`.
+    """
+    literally(degree)
+    literally(conjugate)
+    literally(absolute)
+
+    formula = (degree, conjugate, absolute)
+    ny, nx = y.size, x.size
+    tiles_x = (nx + TILE - 1) // TILE
+    tiles_y = (ny + TILE - 1) // TILE
+
+    count = np.full((ny, nx), -1, dtype=np.int64)
+    exact = smoothing or norm.size > 0
+
+    # Number and sum of the values of the points filled, by tile
+    filled = np.zeros(tiles_x * tiles_y, dtype=np.int64)
+    filled_sum = np.zeros(tiles_x * tiles_y)
+
+    for t in prange(tiles_x * tiles_y):
+        # Depth-first stack of (i0, i1, j0, j1) rectangles, bounds included
+        stack = np.empty((4 * TILE, 4), dtype=np.int64)
+        i0, j0 = (t // tiles_x) * TILE, (t % tiles_x) * TILE
+        _push(stack, 0, i0, min(ny, i0 + TILE) - 1, j0, min(nx, j0 + TILE) - 1)
+        top = 1
+
+        while top > 0:
+            top -= 1
+            i0, i1, j0, j1 = stack[top]
+
+            value = -1
+            uniform = True
+
+            for i in range(i0, i1 + 1):
+                step = 1 if i == i0 or i == i1 else max(j1 - j0, 1)
+
+                for j in range(j0, j1 + 1, step):
+                    if count[i, j] < 0:
+                        count[i, j] = _adaptive_point(
+                            i,
+                            j,
+                            x,
+                            y,
+                            c_re,
+                            c_im,
+                            julia,
+                            formula,
+                            max_iter,
+                            interior_check,
+                            smoothing,
+                            out,
+                            norm,
+                        )
+
+                    if value < 0:
+                        value = count[i, j]
+                    elif count[i, j] != value:
+                        uniform = False
+
+            if uniform and (value == max_iter or not exact):
+                for i in range(i0 + 1, i1):
+                    for j in range(j0 + 1, j1):
+                        if count[i, j] < 0:
+                            filled[t] += 1
+                            filled_sum[t] += value
+
+                        count[i, j] = value
+                        out[i, j] = value
+
+                        if norm.size:
+                            norm[i, j] = norm[i0, j0]
+            elif i1 - i0 <= MIN_RECT or j1 - j0 <= MIN_RECT:
+                for i in range(i0 + 1, i1):
+                    for j in range(j0 + 1, j1):
+                        if count[i, j] < 0:
+                            count[i, j] = _adaptive_point(
+                                i,
+                                j,
+                                x,
+                                y,
+                                c_re,
+                                c_im,
+                                julia,
+                                formula,
+                                max_iter,
+                                interior_check,
+                                smoothing,
+                                out,
+                                norm,
+                            )
+            elif j1 - j0 >= i1 - i0:
+                jm = (j0 + j1) // 2
+                _push(stack, top, i0, i1, j0, jm)
+                _push(stack, top + 1, i0, i1, jm, j1)
+                top += 2
+            else:
+                im = (i0 + i1) // 2
+                _push(stack, top, i0, im, j0, j1)
+                _push(stack, top + 1, im, i1, j0, j1)
+                top += 2
+
+    return filled.sum(), filled_sum.sum()
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _escape_samples(
+    re,
+    im,
+    c_re,
+    c_im,
+    julia,
+    degree,
+    conjugate,
+    absolute,
+    max_iter,
+    interior_check,
+    smoothing,
+    out,
+):
+    """
+    Escape time kernel over the points ``re[k] + im[k]j``, such as the
+    subsamples of `_supersample`. The formula is compiled as a constant, as
+    in `_escape_rows`.
+    """
+    literally(degree)
+    literally(conjugate)
+    literally(absolute)
+
+    formula = (degree, conjugate, absolute)
+
+    for k in prange(re.size):
+        n, r2 = _escape_value(
+            re[k], im[k], c_re, c_im, julia, formula, max_iter, interior_check
+        )
+
+        if smoothing:
+            out[k] = _smooth(n, np.sqrt(r2), max_iter, degree)
+        else:
+            out[k] = n
+
+
+@lru_cache(maxsize=None)
+def _samples_kernel(formula):
+    """`_escape_samples` with `formula` bound, see `_escape_kernel`."""
+    degree, conjugate, absolute = formula
+
+    @jit(nopython=True)
+    def samples_kernel(
+        re, im, c_re, c_im, julia, max_iter, interior_check, smoothing, out
+    ):
+        _escape_samples(
+            re,
+            im,
+            c_re,
+            c_im,
+            julia,
+            degree,
+            conjugate,
+            absolute,
+            max_iter,
+            interior_check,
+            smoothing,
+            out,
+        )
+
+    return samples_kernel
+
+
+def _is_connected(formula, julia, c_re, c_im, max_iter):
+    """
+    Whether the set is connected, so that `_mariani_silver` can fill it: the
+    Mandelbrot set, and its Julia sets whose `c` does not escape within
+    `max_iter` iterations. The sets of other formulas, e.g. the burning
+    ship, are not.
+    """
+    if formula != MANDELBROT:
+        return False
+
+    if not julia:
+        return True
+
+    n, _ = _escape_value(
+        c_re, c_im, c_re, c_im, False, formula, max_iter, True
+    )
+
+    return n == max_iter
+
+
+def _render(
+    x,
+    y,
+    c_re,
+    c_im,
+    julia,
+    max_iter,
+    interior_check,
+    smoothing,
+    out,
+    fastmath=False,
+    adaptive=False,
+    norm=None,
+    formula=MANDELBROT,
+):
+    """
+    Dispatch the grid ``x[j] + y[i]j`` to an escape time kernel.
+
+    Without `adaptive`, `c_re` and `c_im` may be arrays of Julia constants,
+    with the rows of their images stacked in `out` and `norm`. Sets that are
+    not connected, see `_is_connected`, are rendered in full even with
+    `adaptive`.
+
+    Mandelbrot sets symmetric about the real axis, and Julia sets symmetric
+    about the origin, see `src.formulas._is_symmetric`, are only iterated on
+    one side when the grid is exactly symmetric about it, see `_create_axes`.
+    The other side is a mirrored copy, so that views centered on the axis or
+    the origin take half the time.
+    """
+    if adaptive:
+        adaptive = _is_connected(formula, julia, c_re, c_im, max_iter)
+
+    kernel = _escape_kernel(fastmath, adaptive, formula)
+
+    if not adaptive:
+        c_re, c_im = np.atleast_1d(c_re), np.atleast_1d(c_im)
+
+    rows = _exact_mirror(y) if _is_symmetric(formula, julia) else None
+    cols = _exact_mirror(x) if julia and rows is not None else None
+
+    if rows is None or (julia and cols is None):
+        if norm is None:
+            norm = np.empty((0, 0), dtype=out.dtype)
+
+        filled = kernel(
+            x,
+            y,
+            c_re,
+            c_im,
+            julia,
+            max_iter,
+            interior_check,
+            smoothing,
+            out,
+            norm,
+        )
+        record_iterated(out, filled)
+
+        return out
+
+    # Images of the batch, as views of `out` and `norm`
+    if adaptive or c_re.size == 1:
+        arrays = [
+            array[np.newaxis] for array in (out, norm) if array is not None
+        ]
+    else:
+        shape = (c_re.size, y.size, x.size)
+        arrays = [
+            array.reshape(shape) for array in (out, norm) if array is not None
+        ]
+
+    args = (c_re, c_im, julia, max_iter, interior_check, smoothing)
+    m, unique, mirrored = rows
+    source = m - np.arange(y.size)[mirrored]
+
+    _render_part(kernel, x, y, args, arrays, unique, slice(None))
+
+    if julia:
+        # ``x[j] + y[i]j`` is the opposite of ``x[k - j] + y[m - i]j``, for
+        # the columns `inside` whose opposite is in the grid
+        k = cols[0]
+        inside = slice(max(k - x.size + 1, 0), min(k + 1, x.size))
+        outside = (
+            slice(k + 1, x.size) if k < x.size else slice(0, inside.start)
+        )
+        opposite = k - np.arange(x.size)[inside]
+
+        for array in arrays:
+            array[:, mirrored, inside] = array[:, source][:, :, opposite]
+
+        _render_part(kernel, x, y, args, arrays, mirrored, outside)
+    else:
+        for array in arrays:
+            array[:, mirrored] = array[:, source]
+
+    return out
+
+
+def _exact_mirror(axis):
+    """`_mirror` of `axis`, if its points are the exact opposites."""
+    mirror = _mirror(axis)
+
+    if mirror is None:
+        return None
+
+    m, _, mirrored = mirror
+    opposite = -axis[m - np.arange(axis.size)[mirrored]]
+
+    if m % 2 == 0 and axis[m // 2] != 0:
+        return None
+
+    return mirror if np.array_equal(axis[mirrored], opposite) else None
+
+
+def _render_part(kernel, x, y, args, arrays, rows, cols):
+    """
+    Iterate the `rows` and `cols` slices of the grid of `_render` into the
+    same slices of `arrays`, the images of its `out` and `norm`.
+    """
+    parts = [array[:, rows, cols] for array in arrays]
+
+    if not parts[0].size:
+        return
+
+    # Kernels write to C-contiguous arrays of rows, which slices may not be
+    buffers = [
+        part if part.flags.c_contiguous else np.empty_like(part)
+        for part in parts
+    ]
+    out, *norm = [buffer.reshape(-1, buffer.shape[-1]) for buffer in buffers]
+
+    if not norm:
+        norm = [np.empty((0, 0), dtype=out.dtype)]
+
+    filled = kernel(x[cols], y[rows], *args, out, *norm)
+    record_iterated(out, filled)
+
+    for part, buffer in zip(parts, buffers):
+        if buffer is not part:
+            part[:] = buffer
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _smoothing_map(count, r, max_iter, degree, out):
+    for i in prange(count.shape[0]):
+        for j in range(count.shape[1]):
+            out[i, j] = _smooth(count[i, j], r[i, j], max_iter, degree)
+
+
+def _apply_smoothing(count, z, max_iter, degree=2):
+    """Smoothed `count`, from the last iterates or their norms `z`."""
+    r = np.abs(z) if np.iscomplexobj(z) else np.asarray(z)
+    out = np.empty(count.shape, dtype=np.result_type(count, r))
+
+    _smoothing_map(np.asarray(count), r, max_iter, int(degree), out)
+
+    return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _edge_map(values, tol, out):
+    """Whether each value differs from one of its 4 neighbors by over `tol`."""
+    ny, nx = values.shape
+
+    for i in prange(ny):
+        for j in range(nx):
+            v = values[i, j]
+            edge = False
+
+            if i > 0 and abs(values[i - 1, j] - v) > tol:
+                edge = True
+            elif i < ny - 1 and abs(values[i + 1, j] - v) > tol:
+                edge = True
+            elif j > 0 and abs(values[i, j - 1] - v) > tol:
+                edge = True
+            elif j < nx - 1 and abs(values[i, j + 1] - v) > tol:
+                edge = True
+
+            out[i, j] = edge
+
+
+def _supersample(out, samples, sample):
+    """
+    Average jittered samples of the pixels of `out` at edges, in place.
+
+    Pixels differing from a neighbor by more than `EDGE_TOL` iterations get
+    ``samples - 1`` more samples inside their area, whose values are
+    averaged with theirs. Offsets follow the additive recurrence of the
+    plastic number, which covers the pixel evenly for any number of samples,
+    rotated by a random shift for each pixel. ``sample(i, j)`` returns the
+    values at the fractional pixel indices `i` and `j`.
+    """
+    edges = np.empty(out.shape, dtype=np.bool_)
+    _edge_map(out, EDGE_TOL, edges)
+    rows, cols = np.nonzero(edges)
+
+    if not rows.size:
+        return out
+
+    total = out[rows, cols].astype(np.float64)
+
+    plastic = 1.32471795724474602596
+    shift = np.random.default_rng(0).random((2, rows.size))
+
+    for k in range(1, samples):
+        di = (shift[0] + k / plastic) % 1 - 0.5
+        dj = (shift[1] + k / plastic**2) % 1 - 0.5
+
+        total += sample(
+            np.clip(rows + di, 0, out.shape[0] - 1),
+            np.clip(cols + dj, 0, out.shape[1] - 1),
+        )
+
+    out[rows, cols] = total / samples
+
+    return out
+
+
+def _escape_sampler(
+    x, y, c_re, c_im, julia, max_iter, interior_check, smoothing, formula
+):
+    """Sample function of `_supersample` for the grid ``x[j] + y[i]j``."""
+    kernel = _samples_kernel(formula)
+    dx = (x[-1] - x[0]) / max(x.size - 1, 1)
+    dy = (y[-1] - y[0]) / max(y.size - 1, 1)
+
+    def sample(i, j):
+        re = (x[0] + j * dx).astype(x.dtype)
+        im = (y[0] + i * dy).astype(x.dtype)
+        out = np.empty(re.size, dtype=x.dtype)
+
+        kernel(
+            re, im, c_re, c_im, julia, max_iter, interior_check, smoothing, out
+        )
+        record_iterated(out)
+
+        return out
+
+    return sample
+
+
+def _perturbation_sampler(center, zoom, number_points, max_iter, smoothing):
+    """Sample function of `_supersample` for `perturbation_map` views."""
+    delta = 1.5 / float(zoom)
+    step = 2 * delta / max(int(number_points) - 1, 1)
+
+    def sample(i, j):
+        z, count = perturbation_points(
+            center, zoom, max_iter, j * step - delta, i * step - delta
+        )
+        record_iterated(count)
+
+        if smoothing:
+            return _apply_smoothing(count[None], z[None], max_iter)[0]
+
+        return count
+
+    return sample
+
+
+@instrumented
+def compute_mandelbrot(
+    max_iter: int = 200,
+    center: Union[complex, str, Decimal] = -0.5,
+    zoom: float = 1,
+    number_points: int = 300,
+    smoothing: bool = False,
+    engine: str = "standard",
+    interior_check: bool = False,
+    dtype: type = np.float64,
+    out: np.ndarray = None,
+    fastmath: bool = False,
+    adaptive: bool = False,
+    norm: np.ndarray = None,
+    formula: Union[str, Formula] = "mandelbrot",
+    supersampling: int = 1,
+) -> np.ndarray:
+    """
+    Compute the number of iterations of each point of a Mandelbrot view.
+
+    Grid points are generated inside the kernel, so memory is allocated only
+    for the returned array. `_logistic_map` is the reference kernel over a
+    materialized grid. See `plot_mandelbrot` for the plotting front end.
+
+    Parameters
+    ----------
+    max_iter : int, default 200
+        Maximum number of iterations.
+    center : complex, str or Decimal, default -0.5
+        Center point of the view.
+    zoom : float, default 1
+        Zoom ratio.
+    number_points : int, default 300
+        Number of `c` points between the axis limits.
+    smoothing : bool, default False
+        If True, apply continuous color smoothing.
+    engine : {"standard", "perturbation"}, default "standard"
+        Iteration engine, see `plot_mandelbrot`.
+    interior_check : bool, default False
+        If True, skip points in the main cardioid and in the period-2 bulb,
+        and stop iterating points attracted to a cycle. Faster on views with
+        large interior areas, such as the whole set, but slower on views of
+        the boundary, whose points mostly escape after paying for the checks.
+    dtype : {numpy.float64, numpy.float32}, default numpy.float64
+        Floating point type of the result. With float32, points are
+        iterated in complex64.
+    out : numpy.ndarray, optional
+        Array of shape ``(number_points, number_points)`` and type `dtype`
+        to write the result to.
+    fastmath : bool, default False
+        If True, compile the kernel with LLVM fast-math flags, allowing
+        floating point reassociation. Results may differ in the last bits.
+    adaptive : bool, default False
+        If True, fill rectangles whose border points have the same number of
+        iterations instead of iterating their inside (Mariani-Silver).
+        Only applied with the "mandelbrot" formula, whose set is connected,
+        and ignored otherwise. `fastmath` is not applied.
+    norm : numpy.ndarray, optional
+        Array like `out` to write the norm of the last iterate of each point
+        to, so that smoothing can be applied later by `_apply_smoothing`.
+    formula : str or Formula, default "mandelbrot"
+        Iterated formula, by name in `src.formulas.FORMULAS` (e.g.
+        "multibrot3", "tricorn" or "burning_ship") or as a `Formula`.
+    supersampling : int, default 1
+        Number of samples of the points at edges, i.e. whose number of
+        iterations differs from a neighbor by more than `EDGE_TOL`. Their
+        results are the mean of jittered samples around them, which reduces
+        aliasing at the boundary of the set for a fraction of the cost of
+        more `number_points`. `norm` is not written with supersampling.
+
+    Returns
+    -------
+    numpy.ndarray
+        Number of iterations of each point, with rows along the imaginary
+        axis.
+    """
+    assert engine in ENGINES, f"`engine` must be one of {ENGINES}"
+    assert supersampling >= 1, "`supersampling` must be at least 1"
+    assert (
+        norm is None or supersampling == 1
+    ), "`norm` is not written with `supersampling`"
+
+    formula = get_formula(formula)
+    max_iter = int(max_iter)
+    out = _create_out(out, number_points, dtype)
+
+    if norm is not None:
+        norm = _create_out(norm, number_points, dtype)
+
+    if engine == "perturbation":
+        assert formula == MANDELBROT, "`engine` needs the Mandelbrot formula"
+
+        with stage("iterate"):
+            z, count = perturbation_map(center, zoom, number_points, max_iter)
+
+        record_iterated(count)
+
+        if norm is not None:
+            norm[:] = np.abs(z)
+
+        if smoothing:
+            with stage("smoothing"):
+                count = _apply_smoothing(count, z, max_iter)
+
+        out[:] = count
+        record_field(out, max_iter)
+
+        if supersampling > 1:
+            with stage("supersampling"):
+                sample = _perturbation_sampler(
+                    center, zoom, number_points, max_iter, smoothing
+                )
+                _supersample(out, supersampling, sample)
+
+        return out
+
+    with stage("grid"):
+        xlim, ylim = _set_limits(center, zoom)
+        x, y = _create_axes(xlim, ylim, number_points, dtype)
+
+    with stage("iterate"):
+        _render(
+            x,
+            y,
+            x[0],
+            y[0],
+            False,
+            max_iter,
+            interior_check,
+            smoothing,
+            out,
+            fastmath,
+            adaptive,
+            norm,
+            formula,
+        )
+
+    record_field(out, max_iter)
+
+    if supersampling > 1:
+        with stage("supersampling"):
+            sample = _escape_sampler(
+                x,
+                y,
+                x[0],
+                y[0],
+                False,
+                max_iter,
+                interior_check,
+                smoothing,
+                formula,
+            )
+            _supersample(out, supersampling, sample)
+
+    return out
+
+
+@instrumented
+def compute_julia(
+    c: complex,
+    center: complex = 0,
+    max_iter: int = 200,
+    zoom: float = 1,
+    number_points: int = 300,
+    smoothing: bool = False,
+    interior_check: bool = False,
+    dtype: type = np.float64,
+    out: np.ndarray = None,
+    fastmath: bool = False,
+    adaptive: bool = False,
+    norm: np.ndarray = None,
+    formula: Union[str, Formula] = "mandelbrot",
+    supersampling: int = 1,
+) -> np.ndarray:
+    """
+    Compute the number of iterations of each point of a Julia set view.
+
+    Grid points are generated inside the kernel, so memory is allocated only
+    for the returned array. `_logistic_map` is the reference kernel over a
+    materialized grid. See `plot_julia` for the plotting front end.
+
+    Parameters
+    ----------
+    c : complex
+        Constant complex number of the logistic map.
+    center : complex, default 0
+        Center point of the view.
+    max_iter : int, default 200
+        Maximum number of iterations.
+    zoom : float, default 1
+        Zoom ratio.
+    number_points : int, default 300
+        Number of `z` points between the axis limits.
+    smoothing : bool, default False
+        If True, apply continuous color smoothing.
+    interior_check : bool, default False
+        If True, stop iterating points attracted to a cycle. Faster on views
+        with large interior areas, but slower on views of the boundary.
+    dtype : {numpy.float64, numpy.float32}, default numpy.float64
+        Floating point type of the result. With float32, points are
+        iterated in complex64.
+    out : numpy.ndarray, optional
+        Array of shape ``(number_points, number_points)`` and type `dtype`
+        to write the result to.
+    fastmath : bool, default False
+        If True, compile the kernel with LLVM fast-math flags, allowing
+        floating point reassociation. Results may differ in the last bits.
+    adaptive : bool, default False
+        If True, fill rectangles whose border points have the same number of
+        iterations instead of iterating their inside (Mariani-Silver).
+        Only applied to connected Julia sets, i.e. with the "mandelbrot"
+        formula and `c` in the Mandelbrot set, and ignored otherwise.
+        `fastmath` is not applied.
+    norm : numpy.ndarray, optional
+        Array like `out` to write the norm of the last iterate of each point
+        to, so that smoothing can be applied later by `_apply_smoothing`.
+    formula : str or Formula, default "mandelbrot"
+        Iterated formula, by name in `src.formulas.FORMULAS` (e.g.
+        "multibrot3", "tricorn" or "burning_ship") or as a `Formula`.
+    supersampling : int, default 1
+        Number of samples of the points at edges, i.e. whose number of
+        iterations differs from a neighbor by more than `EDGE_TOL`. Their
+        results are the mean of jittered samples around them, which reduces
+        aliasing at the boundary of the set for a fraction of the cost of
+        more `number_points`. `norm` is not written with supersampling.
+
+    Returns
+    -------
+    numpy.ndarray
+        Number of iterations of each point, with rows along the imaginary
+        axis.
+    """
+    assert supersampling >= 1, "`supersampling` must be at least 1"
+    assert (
+        norm is None or supersampling == 1
+    ), "`norm` is not written with `supersampling`"
+
+    formula = get_formula(formula)
+    max_iter = int(max_iter)
+    out = _create_out(out, number_points, dtype)
+
+    if norm is not None:
+        norm = _create_out(norm, number_points, dtype)
+
+    with stage("grid"):
+        xlim, ylim = _set_limits(center, zoom)
+        x, y = _create_axes(xlim, ylim, number_points, dtype)
+        c_re, c_im = x.dtype.type(np.real(c)), x.dtype.type(np.imag(c))
+
+    with stage("iterate"):
+        _render(
+            x,
+            y,
+            c_re,
+            c_im,
+            True,
+            max_iter,
+            interior_check,
+            smoothing,
+            out,
+            fastmath,
+            adaptive,
+            norm,
+            formula,
+        )
+
+    record_field(out, max_iter)
+
+    if supersampling > 1:
+        with stage("supersampling"):
+            sample = _escape_sampler(
+                x,
+                y,
+                c_re,
+                c_im,
+                True,
+                max_iter,
+                interior_check,
+                smoothing,
+                formula,
+            )
+            _supersample(out, supersampling, sample)
+
+    return out
+
+
+@instrumented
+def compute_julia_batch(
+    c: Sequence[complex],
+    center: complex = 0,
+    max_iter: int = 200,
+    zoom: float = 1,
+    number_points: int = 300,
+    smoothing: bool = False,
+    interior_check: bool = False,
+    dtype: type = np.float64,
+    out: np.ndarray = None,
+    fastmath: bool = False,
+    norm: np.ndarray = None,
+    formula: Union[str, Formula] = "mandelbrot",
+) -> np.ndarray:
+    """
+    Compute the same Julia set view for each constant of `c` at once.
+
+    All views are rendered by a single call of the escape time kernel, whose
+    threads share the rows of every view, so that small views still use all
+    cores. Results are the same as those of `compute_julia`.
+
+    Parameters
+    ----------
+    c : sequence of complex
+        Constant complex numbers of the logistic map, one per view.
+    center, max_iter, zoom, number_points, smoothing, interior_check, dtype,
+    fastmath, formula
+        See `compute_julia`.
+    out : numpy.ndarray, optional
+        C-contiguous array of shape ``(len(c), number_points,
+        number_points)`` and type `dtype` to write the result to.
+    norm : numpy.ndarray, optional
+        Array like `out` to write the norm of the last iterate of each point
+        to, so that smoothing can be applied later by `_apply_smoothing`.
+
+    Returns
+    -------
+    numpy.ndarray
+        Number of iterations of each point of each view, with rows along the
+        imaginary axis.
+    """
+    formula = get_formula(formula)
+    max_iter = int(max_iter)
+    c = np.atleast_1d(c)
+    out = _create_out(out, number_points, dtype, batch=c.size)
+
+    assert out.flags.c_contiguous, "`out` must be C-contiguous"
+
+    if norm is not None:
+        norm = _create_out(norm, number_points, dtype, batch=c.size)
+
+        assert norm.flags.c_contiguous, "`norm` must be C-contiguous"
+
+        norm = norm.reshape(-1, out.shape[-1])
+
+    with stage("grid"):
+        xlim, ylim = _set_limits(center, zoom)
+        x, y = _create_axes(xlim, ylim, number_points, dtype)
+        c_re, c_im = np.real(c).astype(dtype), np.imag(c).astype(dtype)
+
+    with stage("iterate"):
+        _render(
+            x,
+            y,
+            c_re,
+            c_im,
+            True,
+            max_iter,
+            interior_check,
+            smoothing,
+            out.reshape(-1, out.shape[-1]),
+            fastmath,
+            False,
+            norm,
+            formula,
+        )
+
+    record_field(out, max_iter)
+
+    return out
+
+
+def _progressive(
+    x,
+    y,
+    c_re,
+    c_im,
+    julia,
+    max_iter,
+    interior_check,
+    smoothing,
+    levels,
+    cancel,
+    fastmath,
+    formula,
+):
+    """
+    Render the grid ``x[j] + y[i]j`` on successively finer sublattices.
+
+    Level `stride` adds the points whose indices are multiples of `stride`,
+    so points of coarser levels are not iterated again. Previews fill each
+    point with the nearest point computed so far.
+    """
+    assert all(
+        a % b == 0 for a, b in zip(levels, levels[1:])
+    ), "each of `levels` must be a multiple of the next one"
+    assert levels[-1] == 1, "last of `levels` must be 1"
+
+    out = np.empty((y.size, x.size), dtype=x.dtype)
+    previous = None
+
+    for stride in levels:
+        # Sublattices of the previous level's spacing not yet computed
+        spacing = previous or stride
+        offsets = [
+            (oi, oj)
+            for oi in range(0, spacing, stride)
+            for oj in range(0, spacing, stride)
+            if previous is None or (oi, oj) != (0, 0)
+        ]
+
+        for oi, oj in offsets:
+            x_sub = np.ascontiguousarray(x[oj::spacing])
+            out_rows = out[oi::spacing, oj::spacing]
+
+            for i0 in range(0, out_rows.shape[0], BAND):
+                if cancel is not None and cancel.is_set():
+                    return
+
+                rows = slice(i0, i0 + BAND)
+                _render(
+                    x_sub,
+                    np.ascontiguousarray(y[oi::spacing][rows]),
+                    c_re,
+                    c_im,
+                    julia,
+                    max_iter,
+                    interior_check,
+                    smoothing,
+                    out_rows[rows],
+                    fastmath,
+                    formula=formula,
+                )
+
+        previous = stride
+
+        if stride == 1:
+            yield stride, out
+        else:
+            preview = out[::stride, ::stride]
+            preview = preview.repeat(stride, axis=0).repeat(stride, axis=1)
+
+            yield stride, preview[: y.size, : x.size]
+
+
+def progressive_mandelbrot(
+    max_iter: int = 200,
+    center: complex = -0.5,
+    zoom: float = 1,
+    number_points: int = 300,
+    smoothing: bool = False,
+    interior_check: bool = False,
+    dtype: type = np.float64,
+    fastmath: bool = False,
+    levels: Sequence[int] = (4, 2, 1),
+    cancel: Event = None,
+    formula: Union[str, Formula] = "mandelbrot",
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Compute a Mandelbrot view with successively finer resolutions.
+
+    Parameters
+    ----------
+    max_iter, center, zoom, number_points, smoothing, interior_check, dtype,
+    fastmath, formula
+        See `compute_mandelbrot`.
+    levels : sequence of int, default (4, 2, 1)
+        Decreasing pixel strides of each preview, each a multiple of the next.
+        The default computes 1/16, 1/4 and then all of the points.
+    cancel : threading.Event, optional
+        If set, stop rendering within `BAND` rows. Closing the generator
+        also stops it.
+
+    Yields
+    ------
+    stride : int
+        Pixel stride of the preview.
+    numpy.ndarray
+        Number of iterations of each point of the full resolution grid, with
+        points not yet computed filled from a computed neighbor.
+    """
+    xlim, ylim = _set_limits(center, zoom)
+    x, y = _create_axes(xlim, ylim, number_points, dtype)
+
+    yield from _progressive(
+        x,
+        y,
+        x[0],
+        y[0],
+        False,
+        int(max_iter),
+        interior_check,
+        smoothing,
+        tuple(levels),
+        cancel,
+        fastmath,
+        get_formula(formula),
+    )
+
+
+def progressive_julia(
+    c: complex,
+    center: complex = 0,
+    max_iter: int = 200,
+    zoom: float = 1,
+    number_points: int = 300,
+    smoothing: bool = False,
+    interior_check: bool = False,
+    dtype: type = np.float64,
+    fastmath: bool = False,
+    levels: Sequence[int] = (4, 2, 1),
+    cancel: Event = None,
+    formula: Union[str, Formula] = "mandelbrot",
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Compute a Julia set view with successively finer resolutions.
+
+    Parameters
+    ----------
+    c, center, max_iter, zoom, number_points, smoothing, interior_check,
+    dtype, fastmath, formula
+        See `compute_julia`.
+    levels, cancel
+        See `progressive_mandelbrot`.
+
+    Yields
+    ------
+    stride : int
+        Pixel stride of the preview.
+    numpy.ndarray
+        Number of iterations of each point of the full resolution grid, with
+        points not yet computed filled from a computed neighbor.
+    """
+    xlim, ylim = _set_limits(center, zoom)
+    x, y = _create_axes(xlim, ylim, number_points, dtype)
+    c_re, c_im = x.dtype.type(np.real(c)), x.dtype.type(np.imag(c))
+
+    yield from _progressive(
+        x,
+        y,
+        c_re,
+        c_im,
+        True,
+        int(max_iter),
+        interior_check,
+        smoothing,
+        tuple(levels),
+        cancel,
+        fastmath,
+        get_formula(formula),
+    )
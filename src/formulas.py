@@ -0,0 +1,135 @@
+"""
+Registry of the escape time formulas iterated by the compute kernels.
+
+Formulas are of the form ``z -> f(z)**degree + c``, where `f` conjugates `z`
+(Tricorn) or takes the absolute values of its real and imaginary parts
+(Burning Ship), or is the identity (Mandelbrot and Multibrot sets).
+
+The escape time kernels are compiled for each formula used, with the formula
+as a constant, so that its branches are compiled away and its power is
+unrolled in real arithmetic. Compiled kernels are cached on disk.
+"""
+
+from typing import NamedTuple, Union
+
+from numba import jit
+
+
+class Formula(NamedTuple):
+    """
+    Escape time formula ``z -> f(z)**degree + c``.
+
+    Parameters
+    ----------
+    degree : int, default 2
+        Integer power of the formula, at least 2.
+    conjugate : bool, default False
+        If True, iterate the complex conjugate of `z`.
+    absolute : bool, default False
+        If True, iterate the absolute values of the real and imaginary parts
+        of `z`.
+    """
+
+    degree: int = 2
+    conjugate: bool = False
+    absolute: bool = False
+
+
+MANDELBROT = Formula()
+
+FORMULAS = {
+    "mandelbrot": MANDELBROT,
+    "multibrot3": Formula(degree=3),
+    "multibrot4": Formula(degree=4),
+    "multibrot5": Formula(degree=5),
+    "tricorn": Formula(conjugate=True),
+    "burning_ship": Formula(absolute=True),
+}
+
+
+def register_formula(name: str, formula: Formula):
+    """Make `formula` selectable by `name` in the compute and plot functions."""
+    assert formula.degree >= 2, "`degree` must be at least 2"
+
+    FORMULAS[name] = formula
+
+
+def get_formula(formula: Union[str, Formula]) -> Formula:
+    """Formula registered as `formula`, or `formula` itself."""
+    if isinstance(formula, Formula):
+        assert formula.degree >= 2, "`degree` must be at least 2"
+
+        return formula
+
+    assert formula in FORMULAS, f"`formula` must be one of {set(FORMULAS)}"
+
+    return FORMULAS[formula]
+
+
+@jit(nopython=True, cache=True)
+def _has_main_bulbs(formula):
+    """Whether the set of `formula` has the bulbs of the Mandelbrot set."""
+    degree, conjugate, absolute = formula
+
+    return degree == 2 and not conjugate and not absolute
+
+
+def _is_symmetric(formula, julia):
+    """
+    Whether the Mandelbrot set of `formula` is symmetric about the real axis,
+    or its Julia sets about the origin, as ``f(-z) == f(z)``.
+    """
+    degree, conjugate, absolute = formula
+
+    if julia:
+        return absolute or degree % 2 == 0
+
+    return not absolute
+
+
+@jit(nopython=True, cache=True, inline="always")
+def _power(a, b, degree):
+    """Real and imaginary parts of ``(a + bj)**degree``."""
+    if degree == 2:
+        ab = a * b
+        return a * a - b * b, ab + ab
+
+    a2, b2 = a * a, b * b
+
+    if degree == 3:
+        return a * (a2 - 3 * b2), b * (3 * a2 - b2)
+
+    if degree == 4:
+        re, im = a2 - b2, 2 * a * b
+        return re * re - im * im, 2 * re * im
+
+    # Exponentiation by squaring
+    re, im = a * 0 + 1, b * 0
+    n = degree
+
+    while n > 0:
+        if n & 1:
+            re, im = re * a - im * b, re * b + im * a
+
+        n >>= 1
+
+        if n > 0:
+            ab = a * b
+            a, b = a * a - b * b, ab + ab
+
+    return re, im
+
+
+@jit(nopython=True, cache=True, inline="always")
+def _step(a, b, cr, ci, formula):
+    """Next iterate of ``a + bj`` with the constant ``cr + ci*j``."""
+    degree, conjugate, absolute = formula
+
+    if absolute:
+        a, b = abs(a), abs(b)
+    if conjugate:
+        b = -b
+
+    re, im = _power(a, b, degree)
+
+    return re + cr, im + ci
@@ -0,0 +1,212 @@
+"""
+Animated GIF writer for frames of palette indices.
+
+Frames colored from a colormap, such as by `src.colorize.palette_index`,
+already are indices of a palette of at most 256 colors, so they are written
+with one global palette instead of being quantized frame by frame. Each
+frame only stores the rectangle that changed since the previous frame, in
+which unchanged pixels are transparent, so that long runs of them compress
+well. Repeated frames extend the delay of the previous frame.
+
+Frames are compressed by a numba LZW encoder, in the layout of the encoder
+of gif.h (public domain, Charlie Tangora).
+"""
+
+import struct
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+from numba import jit
+
+# Colors of the palettes of `write_gif`, the last index being transparent
+GIF_COLORS = 255
+
+MAX_CODE = 4095
+
+
+@jit(nopython=True, cache=True)
+def _put_code(out, n, buffer, n_bits, code, size):
+    """Append `code` on `size` bits, least significant bits first."""
+    buffer |= code << n_bits
+    n_bits += size
+
+    while n_bits >= 8:
+        out[n] = buffer & 0xFF
+        buffer >>= 8
+        n_bits -= 8
+        n += 1
+
+    return n, buffer, n_bits
+
+
+@jit(nopython=True, cache=True)
+def _lzw_encode(indices, min_code_size, out):
+    """
+    Compress the flat array `indices` with the variable length LZW codes of
+    GIF, into `out`. Returns the number of bytes written.
+    """
+    clear = 1 << min_code_size
+    table = np.zeros((MAX_CODE + 1, clear), dtype=np.int16)
+
+    size = min_code_size + 1
+    last = clear + 1
+    n, buffer, n_bits = _put_code(out, 0, 0, 0, clear, size)
+    code = np.int64(indices[0])
+
+    for k in range(1, indices.size):
+        index = np.int64(indices[k])
+
+        if table[code, index]:
+            code = table[code, index]
+            continue
+
+        n, buffer, n_bits = _put_code(out, n, buffer, n_bits, code, size)
+
+        last += 1
+        table[code, index] = last
+
+        if last >= 1 << size:
+            size += 1
+
+        if last == MAX_CODE:
+            n, buffer, n_bits = _put_code(out, n, buffer, n_bits, clear, size)
+            table[:] = 0
+            size = min_code_size + 1
+            last = clear + 1
+
+        code = index
+
+    n, buffer, n_bits = _put_code(out, n, buffer, n_bits, code, size)
+    n, buffer, n_bits = _put_code(out, n, buffer, n_bits, clear, size)
+    n, buffer, n_bits = _put_code(
+        out, n, buffer, n_bits, clear + 1, min_code_size + 1
+    )
+
+    if n_bits:
+        out[n] = buffer
+        n += 1
+
+    return n
+
+
+def _image_data(indices, min_code_size):
+    """LZW compressed `indices`, in sub-blocks of up to 255 bytes."""
+    out = np.empty(2 * indices.size + 16, dtype=np.uint8)
+    n = _lzw_encode(np.ascontiguousarray(indices).ravel(), min_code_size, out)
+    data = out[:n].tobytes()
+
+    blocks = [bytes([min_code_size])]
+
+    for start in range(0, n, 255):
+        block = data[start : start + 255]  # noqa: E203
+        blocks.append(bytes([len(block)]) + block)
+
+    blocks.append(b"\x00")
+
+    return b"".join(blocks)
+
+
+def write_gif(
+    path: Path,
+    frames: Iterable[np.ndarray],
+    palette: np.ndarray,
+    fps: float = 30,
+    loop: int = 0,
+):
+    """
+    Write an animated GIF from frames of palette indices.
+
+    Parameters
+    ----------
+    path : Path
+        GIF file to write.
+    frames : iterable of numpy.ndarray
+        ``(height, width)`` uint8 arrays of indices of `palette`, consumed
+        one at a time.
+    palette : numpy.ndarray
+        ``(N, 3)`` uint8 array of at most `GIF_COLORS` colors, such as
+        ``cmap_lut(linear_cmap(name, N=GIF_COLORS))``.
+    fps : float, default 30
+        Frames per second. Delays are whole hundredths of a second, and at
+        least 2, as browsers slow down shorter ones.
+    loop : int, default 0
+        Number of times to play the animation, 0 for forever.
+
+    Raises
+    ------
+    ValueError
+        If `frames` is empty.
+    """
+    palette = np.asarray(palette, dtype=np.uint8)
+
+    assert len(palette) <= GIF_COLORS, f"`palette` must have <= {GIF_COLORS}"
+
+    transparent = len(palette)
+    bits = max(1, int(np.ceil(np.log2(transparent + 1))))
+    min_code_size = max(2, bits)
+    delay = max(2, round(100 / fps))
+
+    table = np.zeros((2**bits, 3), dtype=np.uint8)
+    table[: len(palette)] = palette
+
+    previous, pending = None, None
+
+    with open(path, "wb") as file:
+        for frame in frames:
+            frame = np.asarray(frame, dtype=np.uint8)
+
+            assert frame.max() < transparent, "indices must be in `palette`"
+
+            if previous is None:
+                height, width = frame.shape
+                file.write(b"GIF89a")
+                file.write(
+                    struct.pack("<HHBBB", width, height, 0xF0 | bits - 1, 0, 0)
+                )
+                file.write(table.tobytes())
+                file.write(b"\x21\xff\x0bNETSCAPE2.0")
+                file.write(struct.pack("<BBHB", 3, 1, loop, 0))
+
+                top, left, image = 0, 0, frame
+            else:
+                assert frame.shape == previous.shape, "frames must match"
+
+                changed = frame != previous
+
+                if not changed.any():
+                    pending[0] += delay
+                    continue
+
+                rows = np.flatnonzero(changed.any(axis=1))
+                cols = np.flatnonzero(changed.any(axis=0))
+                area = slice(rows[0], rows[-1] + 1), slice(
+                    cols[0], cols[-1] + 1
+                )
+
+                top, left = rows[0], cols[0]
+                image = np.where(changed[area], frame[area], transparent)
+
+            if pending is not None:
+                _write_frame(file, *pending, transparent)
+
+            pending = [delay, top, left, image, min_code_size]
+            previous = frame
+
+        if pending is None:
+            raise ValueError("No frames to write")
+
+        _write_frame(file, *pending, transparent)
+        file.write(b"\x3b")
+
+
+def _write_frame(file, delay, top, left, image, min_code_size, transparent):
+    height, width = image.shape
+
+    # Graphic control: pixels are kept for the next frame, with transparency
+    file.write(b"\x21\xf9\x04")
+    file.write(struct.pack("<BHBB", 0x05, delay, transparent, 0))
+
+    file.write(b"\x2c")
+    file.write(struct.pack("<HHHHB", left, top, width, height, 0))
+    file.write(_image_data(image.astype(np.uint8), min_code_size))
@@ -0,0 +1,115 @@
+"""
+Zoom animations rendered from keyframes.
+
+Consecutive frames of a zoom animation mostly show the same region. Instead
+of computing every frame, a keyframe is computed every time the zoom grows by
+`factor`, with `oversample` times more points, and the frames in between are
+resampled from it. With ``oversample >= factor``, every frame has at least as
+many keyframe points as pixels.
+"""
+
+from typing import Callable, Iterator, Sequence, Union
+
+import numpy as np
+from numba import jit, prange
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _resample(src, offset, scale, out):
+    """Bilinear sample of `src` at points ``offset + scale * index``."""
+    n = src.shape[0] - 1
+
+    for i in prange(out.shape[0]):
+        y = min(max(offset + scale * i, 0.0), n)
+        i0 = min(int(y), n - 1)
+        ty = y - i0
+
+        for j in range(out.shape[1]):
+            x = min(max(offset + scale * j, 0.0), n)
+            j0 = min(int(x), n - 1)
+            tx = x - j0
+
+            top = (1 - tx) * src[i0, j0] + tx * src[i0, j0 + 1]
+            bottom = (1 - tx) * src[i0 + 1, j0] + tx * src[i0 + 1, j0 + 1]
+            out[i, j] = (1 - ty) * top + ty * bottom
+
+
+def keyframe_zoom(
+    compute: Callable[..., np.ndarray],
+    zooms: Sequence[float],
+    number_points: int,
+    max_iter: Union[int, Callable[[float], int]],
+    factor: float = 2,
+    oversample: float = 2,
+    frames: Sequence[int] = None,
+    **kwargs,
+) -> Iterator[np.ndarray]:
+    """
+    Yield the frames of a zoom animation resampled from keyframes.
+
+    Parameters
+    ----------
+    compute : callable
+        Function computing a view, such as `compute_mandelbrot` or
+        `compute_julia`. It is called with `zoom`, `number_points`,
+        `max_iter` and `kwargs` as keyword arguments.
+    zooms : sequence of float
+        Zoom ratio of each frame, all around the same center.
+    number_points : int
+        Number of points along each axis of the frames.
+    max_iter : int or callable
+        Maximum number of iterations, or a function of the zoom ratio. A
+        keyframe uses the largest `max_iter` of its frames, and frames are
+        clipped to their own `max_iter`.
+    factor : float, default 2
+        Zoom ratio between keyframes.
+    oversample : float, default 2
+        Ratio between the number of points of keyframes and frames.
+    frames : sequence of int, optional
+        Indices of the frames to yield, in this order, e.g. only the frames
+        not saved yet, by decreasing cost. By default, all of them. A
+        keyframe is computed when a frame of its level is yielded after a
+        frame of another level, so frames should be grouped by level, as
+        when sorted by zoom.
+    **kwargs
+        Keyword arguments passed to `compute`, such as `center`.
+
+    Yields
+    ------
+    numpy.ndarray
+        Number of iterations of each point of the frame.
+    """
+    iterations = max_iter if callable(max_iter) else lambda zoom: max_iter
+
+    zooms = np.asarray(zooms, dtype=float)
+    levels = np.floor(np.log(zooms / zooms.min()) / np.log(factor))
+    key_points = int(np.ceil(oversample * (number_points - 1))) + 1
+
+    level, keyframe = None, None
+
+    if frames is None:
+        frames = range(zooms.size)
+
+    for k in frames:
+        zoom, frame_level = zooms[k], levels[k]
+
+        if frame_level != level:
+            level = frame_level
+            key_zoom = zooms.min() * factor**level
+            key_iter = max(iterations(z) for z in zooms[levels == level])
+
+            keyframe = compute(
+                zoom=key_zoom,
+                number_points=key_points,
+                max_iter=int(key_iter),
+                **kwargs,
+            )
+
+        # Frame points mapped to keyframe indices, both centered
+        scale = (key_zoom / zoom) * (key_points - 1) / (number_points - 1)
+        offset = (key_points - 1) * (1 - key_zoom / zoom) / 2
+
+        frame = np.empty((number_points, number_points), keyframe.dtype)
+        _resample(keyframe, offset, scale, frame)
+
+        yield np.minimum(frame, int(iterations(zoom)), out=frame)
@@ -0,0 +1,285 @@
+"""
+Perturbation theory for Mandelbrot zooms beyond double precision.
+
+A single reference orbit :math:`Z_n` is iterated at the center point with
+arbitrary precision (``decimal``). Every pixel :math:`c = C + \\delta_0` is
+then iterated as a small float64 difference from the reference,
+
+.. math:: \\delta_{n+1} = 2 Z_n \\delta_n + \\delta_n^2 + \\delta_0,
+
+so that :math:`z_n = Z_n + \\delta_n` never needs more than double precision.
+
+Glitches (pixels whose orbit drifts away from the reference) are detected
+when :math:`|z_n| < |\\delta_n|` and fixed by rebasing the pixel to the start
+of the reference orbit, which also handles pixels outliving the reference.
+The first iterations are skipped with a cubic series approximation of
+:math:`\\delta_n` in terms of :math:`\\delta_0`.
+"""
+
+from decimal import Decimal, localcontext
+from functools import lru_cache
+from typing import Tuple, Union
+
+import numpy as np
+from numba import jit, prange
+
+BAILOUT = 1e8
+
+# Truncation tolerance of the series approximation relative to its first term
+SERIES_TOL = 1e-12
+
+
+def _parse_center(
+    center: Union[complex, str, Decimal, tuple],
+) -> Tuple[Decimal, Decimal]:
+    """
+    Convert `center` to real and imaginary `Decimal` parts.
+
+    Strings may be written as ``"-0.75+0.1j"``, ``"0.1j"`` or ``"-0.75"``.
+    Tuples are ``(real, imag)`` pairs of strings, decimals or floats.
+    """
+    if isinstance(center, tuple):
+        real, imag = center
+        return Decimal(real), Decimal(imag)
+
+    if isinstance(center, Decimal):
+        return center, Decimal(0)
+
+    if not isinstance(center, str):
+        center = complex(center)
+        return Decimal(center.real), Decimal(center.imag)
+
+    text = center.replace(" ", "").strip("()")
+
+    if not text.endswith("j"):
+        return Decimal(text), Decimal(0)
+
+    text = text[:-1]
+    split = 0
+
+    for k in range(len(text) - 1, 0, -1):
+        if text[k] in "+-" and text[k - 1] not in "eE":
+            split = k
+            break
+
+    real, imag = text[:split] or "0", text[split:]
+
+    if imag in ("", "+", "-"):
+        imag += "1"
+
+    return Decimal(real), Decimal(imag)
+
+
+def _precision(zoom: float) -> int:
+    """Number of significant digits needed to resolve pixels at `zoom`."""
+    return max(30, int(np.log10(float(zoom))) + 20)
+
+
+def reference_orbit(
+    center: Union[complex, str, Decimal, tuple], max_iter: int, prec: int
+) -> np.ndarray:
+    """
+    Iterate :math:`z^2 + c` at `center` with `prec` significant digits.
+
+    Parameters
+    ----------
+    center : complex, str, Decimal or tuple
+        Reference point :math:`C`.
+    max_iter : int
+        Maximum number of iterations.
+    prec : int
+        Number of significant digits of the `decimal` context.
+
+    Returns
+    -------
+    numpy.ndarray
+        Orbit :math:`Z_0, ..., Z_N` rounded to complex128, where `N` is the
+        escape iteration or `max_iter`.
+    """
+    orbit = np.zeros(max_iter + 1, dtype=complex)
+
+    with localcontext() as ctx:
+        ctx.prec = prec
+
+        cr, ci = _parse_center(center)
+        cr, ci = +cr, +ci
+        zr, zi = Decimal(0), Decimal(0)
+        bailout = Decimal(BAILOUT) ** 2
+
+        for n in range(max_iter + 1):
+            orbit[n] = complex(float(zr), float(zi))
+
+            zr2, zi2 = zr * zr, zi * zi
+
+            if n == max_iter or zr2 + zi2 > bailout:
+                break
+
+            zr, zi = zr2 - zi2 + cr, 2 * zr * zi + ci
+
+    return orbit[: n + 1]
+
+
+@jit(nopython=True, cache=True)
+def _series_coefficients(orbit, delta_max, max_skip):
+    a = 0j
+    b = 0j
+    c = 0j
+
+    for n in range(min(max_skip, orbit.size - 1)):
+        z2 = 2 * orbit[n]
+        a_next = z2 * a + 1
+        b_next = z2 * b + a * a
+        c_next = z2 * c + 2 * a * b
+
+        valid = np.abs(c_next) * delta_max**2 < SERIES_TOL * np.abs(a_next)
+
+        if not (valid and np.isfinite(c_next)):
+            return n, a, b, c
+
+        a, b, c = a_next, b_next, c_next
+
+    return min(max_skip, orbit.size - 1), a, b, c
+
+
+@jit(nopython=True, cache=True)
+def _perturbation_point(orbit, n_skip, a, b, c, dc, max_iter):
+    """Last iterated value and number of iterations of ``C + dc``."""
+    bailout = BAILOUT**2
+    last = orbit.size - 1
+
+    d = ((c * dc + b) * dc + a) * dc
+    m = n_skip
+    n = n_skip
+    zn = orbit[m] + d
+
+    while n < max_iter and zn.real**2 + zn.imag**2 <= bailout:
+        if m == last or (
+            zn.real**2 + zn.imag**2 < d.real**2 + d.imag**2
+        ):
+            d = zn
+            m = 0
+
+        d = (2 * orbit[m] + d) * d + dc
+        m += 1
+        n += 1
+        zn = orbit[m] + d
+
+    return zn, n
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _perturbation_map(orbit, n_skip, a, b, c, dx, dy, z, count, max_iter):
+    for i in prange(dy.size):
+        for j in range(dx.size):
+            z[i, j], count[i, j] = _perturbation_point(
+                orbit, n_skip, a, b, c, complex(dx[j], dy[i]), max_iter
+            )
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _perturbation_points(orbit, n_skip, a, b, c, dx, dy, z, count, max_iter):
+    for k in prange(dx.size):
+        z[k], count[k] = _perturbation_point(
+            orbit, n_skip, a, b, c, complex(dx[k], dy[k]), max_iter
+        )
+
+
+@lru_cache(maxsize=4)
+def _reference(center, zoom, max_iter, series_approximation):
+    """
+    Reference orbit and series coefficients of a view.
+
+    The last views are kept, so that the supersampling of a view does not
+    iterate its reference orbit again.
+    """
+    orbit = reference_orbit(center, max_iter, _precision(zoom))
+    n_skip, a, b, c = 0, 0j, 0j, 0j
+
+    if series_approximation:
+        delta = 1.5 / float(zoom)
+        n_skip, a, b, c = _series_coefficients(
+            orbit, np.sqrt(2) * delta, max_iter
+        )
+
+    return orbit, n_skip, a, b, c
+
+
+def perturbation_map(
+    center: Union[complex, str, Decimal, tuple],
+    zoom: float,
+    number_points: int,
+    max_iter: int,
+    series_approximation: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Iterate a Mandelbrot view with perturbation theory.
+
+    Parameters
+    ----------
+    center : complex, str, Decimal or tuple
+        Center point of the view, see `_parse_center`.
+    zoom : float
+        Zoom ratio.
+    number_points : int
+        Number of points along each axis.
+    max_iter : int
+        Maximum number of iterations.
+    series_approximation : bool, default True
+        If True, skip the first iterations with a series approximation.
+
+    Returns
+    -------
+    z : numpy.ndarray
+        Last iterated value of each point.
+    count : numpy.ndarray
+        Number of iterations of each point.
+    """
+    reference = _reference(center, zoom, int(max_iter), series_approximation)
+
+    # Offsets from `center`, matching `_set_limits` and `_create_grid`
+    delta = 1.5 / float(zoom)
+    offsets = np.linspace(-delta, delta, int(number_points))
+
+    z = np.zeros((offsets.size, offsets.size), dtype=complex)
+    count = np.zeros(z.shape, dtype=float)
+
+    _perturbation_map(*reference, offsets, offsets, z, count, int(max_iter))
+
+    return z, count
+
+
+def perturbation_points(
+    center: Union[complex, str, Decimal, tuple],
+    zoom: float,
+    max_iter: int,
+    dx: np.ndarray,
+    dy: np.ndarray,
+    series_approximation: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Iterate the points ``center + dx + dy*j`` of a view with perturbation.
+
+    Parameters
+    ----------
+    center, zoom, max_iter, series_approximation
+        See `perturbation_map`. Offsets must lie inside the view of `zoom`,
+        for which the series approximation is valid.
+    dx, dy : numpy.ndarray
+        Real and imaginary offsets of the points from `center`.
+
+    Returns
+    -------
+    z : numpy.ndarray
+        Last iterated value of each point.
+    count : numpy.ndarray
+        Number of iterations of each point.
+    """
+    reference = _reference(center, zoom, int(max_iter), series_approximation)
+    dx, dy = np.asarray(dx, dtype=float), np.asarray(dy, dtype=float)
+
+    z = np.zeros(dx.size, dtype=complex)
+    count = np.zeros(dx.size, dtype=float)
+
+    _perturbation_points(*reference, dx, dy, z, count, int(max_iter))
+
+    return z, count
@@ -1,71 +1,76 @@
-import warnings
-from typing import Union
+from decimal import Decimal
+from typing import Callable, Union
 
 import matplotlib.pyplot as plt
 import numpy as np
-from numba import jit, prange
 
+from src.cache import FieldCache, cached_field
+from src.compute import (
+    _set_limits,
+    compute_julia,
+    compute_mandelbrot,
+    progressive_julia,
+    progressive_mandelbrot,
+)
+from src.formulas import Formula
+from src.stats import instrumented, stage
 
-def _set_limits(center, zoom):
-    delta = (1.5 + 1.5j) / zoom
-    lims = [center - delta, center + delta]
 
-    return np.real(lims), np.imag(lims)
-
-
-def _create_grid(xlim, ylim, number_points):
-    x, y = np.ogrid[
-        xlim[0] : xlim[1] : int(number_points) * 1j,  # noqa: E203
-        ylim[0] : ylim[1] : int(number_points) * 1j,  # noqa: E203
-    ]
-
-    return (x + y * 1j).T
-
-
-@jit(nopython=True, parallel=True)
-def _logistic_map(z, c, count, max_iter):
-    px, py = z.shape
+def _plot_set(count, xlim, ylim, ax, axis_labels, **kwargs):
+    with stage("imshow"):
+        if ax:
+            ax.imshow(count, extent=[*xlim, *ylim], origin="lower", **kwargs)
 
-    for i in prange(px):
-        for j in prange(py):
-            while (np.abs(z[i, j]) <= 1e8) and (count[i, j] < max_iter):
-                z[i, j] = z[i, j] ** 2 + c[i, j]
-                count[i, j] += 1
+            return ax
 
+        fig = plt.figure()
+        plt.imshow(count, extent=[*xlim, *ylim], origin="lower", **kwargs)
 
-def _apply_smoothing(count, z, max_iter):
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
+        plt.axis(axis_labels)
 
-        count = np.where(
-            count < max_iter, count + 1 - np.log2(np.log2(np.abs(z))), count
-        )
+    return fig
 
-    return count
 
+def _plot_progressive(fields, xlim, ylim, ax, axis_labels, callback, **kwargs):
+    plot = None
 
-def _plot_set(count, xlim, ylim, ax, axis_labels, **kwargs):
-    if ax:
-        ax.imshow(count, extent=[*xlim, *ylim], origin="lower", **kwargs)
+    for stride, count in fields:
+        if plot is None:
+            plot = _plot_set(count, xlim, ylim, ax, axis_labels, **kwargs)
+            image = (ax or plot.axes[0]).images[-1]
+        else:
+            image.set_data(count)
 
-        return ax
+            if not {"norm", "vmin", "vmax"} & kwargs.keys():
+                image.autoscale()
 
-    fig = plt.figure()
-    plt.imshow(count, extent=[*xlim, *ylim], origin="lower", **kwargs)
+        image.figure.canvas.draw_idle()
+        image.figure.canvas.flush_events()
 
-    plt.axis(axis_labels)
+        if callback is not None and callback(stride, count) is False:
+            fields.close()
+            break
 
-    return fig
+    return plot
 
 
+@instrumented
 def plot_mandelbrot(
     max_iter: int = 200,
-    center: complex = -0.5,
+    center: Union[complex, str, Decimal] = -0.5,
     zoom: int = 1,
     number_points: int = 300,
     ax: plt.axis = None,
     axis_labels: bool = False,
     smoothing: bool = False,
+    engine: str = "standard",
+    interior_check: bool = False,
+    adaptive: bool = False,
+    progressive: bool = False,
+    callback: Callable = None,
+    cache: Union[bool, FieldCache] = False,
+    formula: Union[str, Formula] = "mandelbrot",
+    supersampling: int = 1,
     **kwargs
 ) -> Union[plt.Figure, plt.Axes]:
     """
@@ -78,8 +83,10 @@ def plot_mandelbrot(
     ----------
     max_iter : int, default 200
         Maximum number of iterations.
-    center : complex, default -0.5
-        Center point of the plot.
+    center : complex, str or Decimal, default -0.5
+        Center point of the plot. With ``engine="perturbation"``, a string
+        such as ``"-0.743643887037158704752191506114774+0.13182590420531197j"``
+        or a Decimal keeps the digits beyond double precision.
     zoom : int, default 1
         Zoom ratio.
     number_points : int, default 300
@@ -90,6 +97,39 @@ def plot_mandelbrot(
         If True, display axis lines and labels.
     smoothing : bool, default False
         If True, apply continuous color smoothing.
+    engine : {"standard", "perturbation"}, default "standard"
+        Iteration engine. "perturbation" iterates each point as a float64
+        difference from a high precision reference orbit at `center`, which
+        renders zooms beyond ``1e12``. Its axis limits are offsets from
+        `center`.
+    interior_check : bool, default False
+        If True, skip points in the main cardioid and in the period-2 bulb,
+        and stop iterating points attracted to a cycle. These points are
+        still reported with `max_iter` iterations. See `compute_mandelbrot`
+        for the trade-off.
+    adaptive : bool, default False
+        If True, fill rectangles whose border points have the same number of
+        iterations instead of iterating their inside (Mariani-Silver).
+        Only applied with the "mandelbrot" formula, see `compute_mandelbrot`.
+    progressive : bool, default False
+        If True, draw previews at 1/16 and 1/4 of the points before the full
+        resolution plot, reusing the points already computed. Only available
+        with the "standard" engine.
+    callback : callable, optional
+        With `progressive`, called as ``callback(stride, count)`` after each
+        preview is drawn. Returning False cancels the remaining previews.
+    cache : bool or src.cache.FieldCache, default False
+        If True, reuse the iterations of a previous call with the same view
+        from `src.cache.default_cache()`, whatever the smoothing and colors,
+        or from the given cache.
+    formula : str or src.formulas.Formula, default "mandelbrot"
+        Iterated formula, such as "multibrot3", "tricorn" or "burning_ship",
+        see `src.formulas.FORMULAS`. Only "mandelbrot" is available with
+        the "perturbation" engine.
+    supersampling : int, default 1
+        Number of jittered samples averaged for the points at the edges of
+        the set, see `src.compute.compute_mandelbrot`. Not applied with
+        `progressive`.
     **kwargs
         Keyword arguments passed to ``matplotlib.pyplot.imgshow()``.
 
@@ -98,22 +138,54 @@ def plot_mandelbrot(
     matplotlib.figure.Figure or matplotlib.axes._axes.Axes
         Mandelbrot set plot
     """
-    max_iter = int(max_iter)
-
-    xlim, ylim = _set_limits(center, zoom)
-    c = _create_grid(xlim, ylim, number_points)
-
-    z = np.zeros(c.shape, dtype=complex)
-    count = np.zeros(c.shape, dtype=float)
+    if engine == "perturbation":
+        xlim, ylim = _set_limits(0, zoom)
+    else:
+        xlim, ylim = _set_limits(center, zoom)
+
+    if progressive:
+        assert engine == "standard", "`progressive` needs the standard engine"
+
+        fields = progressive_mandelbrot(
+            max_iter=max_iter,
+            center=center,
+            zoom=zoom,
+            number_points=number_points,
+            smoothing=smoothing,
+            interior_check=interior_check,
+            formula=formula,
+        )
 
-    _logistic_map(z, c, count, max_iter)
+        return _plot_progressive(
+            fields, xlim, ylim, ax, axis_labels, callback, **kwargs
+        )
 
-    if smoothing:
-        count = _apply_smoothing(count, z, max_iter)
+    params = {
+        "max_iter": max_iter,
+        "center": center,
+        "zoom": zoom,
+        "number_points": number_points,
+        "engine": engine,
+        "interior_check": interior_check,
+        "adaptive": adaptive,
+        "formula": formula,
+        "supersampling": supersampling,
+    }
+
+    if cache:
+        count = cached_field(
+            "mandelbrot",
+            smoothing,
+            cache=None if cache is True else cache,
+            **params,
+        )
+    else:
+        count = compute_mandelbrot(smoothing=smoothing, **params)
 
     return _plot_set(count, xlim, ylim, ax, axis_labels, **kwargs)
 
 
+@instrumented
 def plot_julia(
     c: complex,
     center: complex = 0,
@@ -123,6 +195,13 @@ def plot_julia(
     ax=None,
     axis_labels: bool = "off",
     smoothing: bool = False,
+    interior_check: bool = False,
+    adaptive: bool = False,
+    progressive: bool = False,
+    callback: Callable = None,
+    cache: Union[bool, FieldCache] = False,
+    formula: Union[str, Formula] = "mandelbrot",
+    supersampling: int = 1,
     **kwargs
 ) -> Union[plt.Figure, plt.Axes]:
     """
@@ -149,6 +228,30 @@ def plot_julia(
         If True, display axis lines and labels.
     smoothing : bool, default False
         If True, apply continuous color smoothing.
+    interior_check : bool, default False
+        If True, stop iterating points attracted to a cycle. These points are
+        still reported with `max_iter` iterations.
+    adaptive : bool, default False
+        If True, fill rectangles whose border points have the same number of
+        iterations instead of iterating their inside (Mariani-Silver).
+        Only applied to connected Julia sets, see `compute_julia`.
+    progressive : bool, default False
+        If True, draw previews at 1/16 and 1/4 of the points before the full
+        resolution plot, reusing the points already computed.
+    callback : callable, optional
+        With `progressive`, called as ``callback(stride, count)`` after each
+        preview is drawn. Returning False cancels the remaining previews.
+    cache : bool or src.cache.FieldCache, default False
+        If True, reuse the iterations of a previous call with the same view
+        from `src.cache.default_cache()`, whatever the smoothing and colors,
+        or from the given cache.
+    formula : str or src.formulas.Formula, default "mandelbrot"
+        Iterated formula, such as "multibrot3", "tricorn" or "burning_ship",
+        see `src.formulas.FORMULAS`.
+    supersampling : int, default 1
+        Number of jittered samples averaged for the points at the edges of
+        the set, see `src.compute.compute_mandelbrot`. Not applied with
+        `progressive`.
     **kwargs
         Keyword arguments passed to ``matplotlib.pyplot.imgshow()``.
 
@@ -158,14 +261,81 @@ def plot_julia(
         Julia set plot
     """
     xlim, ylim = _set_limits(center=center, zoom=zoom)
-    z = _create_grid(xlim, ylim, number_points)
 
-    c = np.full(z.shape, c, dtype=complex)
-    count = np.zeros(z.shape, dtype=float)
+    if progressive:
+        fields = progressive_julia(
+            c,
+            center=center,
+            max_iter=max_iter,
+            zoom=zoom,
+            number_points=number_points,
+            smoothing=smoothing,
+            interior_check=interior_check,
+            formula=formula,
+        )
+
+        return _plot_progressive(
+            fields, xlim, ylim, ax, axis_labels, callback, **kwargs
+        )
+
+    params = {
+        "c": c,
+        "center": center,
+        "max_iter": max_iter,
+        "zoom": zoom,
+        "number_points": number_points,
+        "interior_check": interior_check,
+        "adaptive": adaptive,
+        "formula": formula,
+        "supersampling": supersampling,
+    }
+
+    if cache:
+        count = cached_field(
+            "julia",
+            smoothing,
+            cache=None if cache is True else cache,
+            **params,
+        )
+    else:
+        count = compute_julia(smoothing=smoothing, **params)
+
+    return _plot_set(count, xlim, ylim, ax, axis_labels, **kwargs)
 
-    _logistic_map(z, c, count, int(max_iter))
 
-    if smoothing:
-        count = _apply_smoothing(count, z, max_iter)
+@instrumented
+def plot_field(
+    count: np.ndarray,
+    center: complex = 0,
+    zoom: float = 1,
+    ax: plt.axis = None,
+    axis_labels: bool = False,
+    **kwargs
+) -> Union[plt.Figure, plt.Axes]:
+    """
+    Plot a precomputed number of iterations, such as from `compute_julia`.
+
+    Parameters
+    ----------
+    count : numpy.ndarray
+        Number of iterations of each point, with rows along the imaginary
+        axis.
+    center : complex, default 0
+        Center point of the plot.
+    zoom : float, default 1
+        Zoom ratio.
+    ax : matplotlib.axes._axes.Axes, optional
+        If not None, draw plot to `ax`. Otherwise, return a new figure.
+    axis_labels : bool, default False
+        If True, display axis lines and labels.
+    **kwargs
+        Keyword arguments passed to ``matplotlib.pyplot.imgshow()``.
+
+    Returns
+    -------
+    matplotlib.figure.Figure or matplotlib.axes._axes.Axes
+        Set plot
+    """
+    xlim, ylim = _set_limits(center, zoom)
 
     return _plot_set(count, xlim, ylim, ax, axis_labels, **kwargs)
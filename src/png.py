@@ -0,0 +1,135 @@
+"""
+PNG files written and read without an imaging library.
+
+`write_png` compresses images as they come, band by band, so that images
+larger than memory, such as posters, can be written. Indexed images keep
+the palette indices of frames, which `read_indexed_png` reads back for
+`src.gif.write_gif`. Only numpy and the standard library are imported.
+"""
+
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, Tuple, Union
+
+import numpy as np
+
+
+def _png_chunk(file, kind, data):
+    file.write(struct.pack(">I", len(data)))
+    file.write(kind + data)
+    file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def write_png(
+    file: Union[Path, BinaryIO],
+    bands: Iterator[np.ndarray],
+    width: int,
+    height: int,
+    palette: np.ndarray = None,
+):
+    """
+    Write an RGB PNG image from bands of rows, compressed as they come.
+
+    Parameters
+    ----------
+    file : Path or binary file object
+        PNG file to write.
+    bands : iterator of numpy.ndarray
+        ``(rows, width, 3)`` uint8 arrays, from the top of the image, with
+        `height` rows in total. With `palette`, ``(rows, width)`` arrays of
+        palette indices.
+    width, height : int
+        Size of the image in pixels.
+    palette : numpy.ndarray, optional
+        ``(N, 3)`` uint8 array of at most 256 colors. If given, write an
+        indexed image, see `read_indexed_png`.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "wb") as opened:
+            return write_png(opened, bands, width, height, palette)
+
+    indexed = palette is not None
+    channels = 1 if indexed else 3
+    color_type = 3 if indexed else 2
+    compressor = zlib.compressobj(6)
+    n_rows = 0
+
+    file.write(b"\x89PNG\r\n\x1a\n")
+    _png_chunk(
+        file,
+        b"IHDR",
+        struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0),
+    )
+
+    if indexed:
+        assert len(palette) <= 256, "`palette` must have at most 256 colors"
+
+        _png_chunk(file, b"PLTE", np.asarray(palette, np.uint8).tobytes())
+
+    for band in bands:
+        assert band.shape[1] == width, "bands must be `width` wide"
+
+        # "Sub" filter: difference with the pixel on the left
+        band = band.reshape(len(band), -1)
+        first, rest = slice(1, 1 + channels), slice(1 + channels, None)
+        lines = np.empty((band.shape[0], 1 + channels * width), np.uint8)
+        lines[:, 0] = 1
+        lines[:, first] = band[:, :channels]
+        lines[:, rest] = band[:, channels:] - band[:, :-channels]
+
+        data = compressor.compress(lines.tobytes())
+
+        if data:
+            _png_chunk(file, b"IDAT", data)
+
+        n_rows += band.shape[0]
+
+    _png_chunk(file, b"IDAT", compressor.flush())
+    _png_chunk(file, b"IEND", b"")
+
+    assert n_rows == height, f"bands must have {height} rows in total"
+
+
+def read_indexed_png(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the palette indices and the palette of an 8-bit indexed PNG file,
+    such as written by `write_png`.
+
+    Raises
+    ------
+    ValueError
+        If the file is not an 8-bit indexed PNG image with rows filtered by
+        "None" or "Sub", as are those of `write_png`.
+    """
+    data = Path(path).read_bytes()
+    offset, chunks = 8, {}
+
+    while offset < len(data):
+        length, kind = struct.unpack_from(">I4s", data, offset)
+        chunk = data[offset + 8 : offset + 8 + length]  # noqa: E203
+        chunks[kind] = chunks.get(kind, b"") + chunk
+        offset += 12 + length
+
+    width, height, depth, color_type = struct.unpack(
+        ">IIBB", chunks[b"IHDR"][:10]
+    )
+
+    if depth != 8 or color_type != 3:
+        raise ValueError(f"{path} is not an 8-bit indexed PNG image")
+
+    lines = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), np.uint8)
+    lines = lines.reshape(height, width + 1)
+
+    if not np.isin(lines[:, 0], (0, 1)).all():
+        raise ValueError(f"{path} has rows filtered by other than None or Sub")
+
+    # Sums wrap around at 256, which undoes the "Sub" filter
+    sub = lines[:, 0] == 1
+    indices = lines[:, 1:].copy()
+    indices[sub] = np.cumsum(indices[sub], axis=1, dtype=np.uint8)
+
+    palette = np.frombuffer(chunks[b"PLTE"], np.uint8).reshape(-1, 3)
+
+    return indices, palette
@@ -0,0 +1,327 @@
+"""
+Iteration state of a view, to raise `max_iter` without iterating again.
+
+`RenderState` keeps the last iterate of the points still bounded, along with
+the state of their cycle detection, in dense arrays. Raising `max_iter` only
+iterates these points, and the arrays are compacted to the points still
+bounded after each call::
+
+    state = RenderState(center=-0.743643887037158 + 0.131825904205312j,
+                        zoom=1000, number_points=600)
+    count = state.iterate(1000).field(smoothing=True)
+    count = state.iterate(10000).field(smoothing=True)  # 9000 more at most
+
+Fields are the same as those of `compute_mandelbrot` and `compute_julia`.
+Points are iterated one by one rather than in vectorized groups, so the first
+call is slower than these functions, about twice on views of the boundary.
+"""
+
+from functools import lru_cache
+from typing import Union
+
+import numpy as np
+from numba import jit, literally, prange
+
+from src.compute import (
+    BAILOUT,
+    PERIOD_TOL,
+    _apply_smoothing,
+    _create_axes,
+    _in_main_bulbs,
+    _set_limits,
+)
+from src.formulas import Formula, _has_main_bulbs, _step, get_formula
+from src.stats import record_field, record_iterated, stage
+
+# Status of the points after `_resume_points`
+ACTIVE, ESCAPED, INTERIOR = 0, 1, 2
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _resume_points(
+    index,
+    x,
+    y,
+    c_re,
+    c_im,
+    julia,
+    degree,
+    conjugate,
+    absolute,
+    max_iter,
+    interior_check,
+    zr,
+    zi,
+    saved_r,
+    saved_i,
+    period,
+    steps,
+    count,
+    norm,
+    status,
+):
+    """
+    Iterate the points ``index`` of the grid ``x[j] + y[i]j`` up to
+    `max_iter` iterations, from their last iterate ``zr[k] + zi[k]j``.
+
+    The iterates and the state of Brent's cycle detection of each point are
+    updated in place, as in `src.compute._escape_point`, so that iterating
+    in several calls gives the same result as in one. `count` and `norm` are
+    flat arrays over the whole grid, `status` is set to `ACTIVE`, `ESCAPED`
+    or `INTERIOR`. The formula is compiled as a constant, as in
+    `src.compute._escape_rows`.
+    """
+    literally(degree)
+    literally(conjugate)
+    literally(absolute)
+
+    formula = (degree, conjugate, absolute)
+    bailout = BAILOUT**2
+    tol = PERIOD_TOL**2
+    bulb_check = interior_check and not julia and _has_main_bulbs(formula)
+
+    for k in prange(index.size):
+        i, j = index[k] // x.size, index[k] % x.size
+
+        if julia:
+            cr, ci = c_re, c_im
+        else:
+            cr, ci = x[j], y[i]
+
+        n = count[index[k]]
+        status[k] = ACTIVE
+
+        if n == 0 and bulb_check and _in_main_bulbs(x[j], y[i]):
+            status[k] = INTERIOR
+            continue
+
+        # Iterates are stored at each step, so that they are rounded to the
+        # type of `zr` as in `src.compute._escape_rows`
+        while n < max_iter and zr[k] * zr[k] + zi[k] * zi[k] <= bailout:
+            zr[k], zi[k] = _step(zr[k], zi[k], cr, ci, formula)
+            n += 1
+
+            if interior_check:
+                dr, di = zr[k] - saved_r[k], zi[k] - saved_i[k]
+
+                if dr * dr + di * di < tol:
+                    status[k] = INTERIOR
+                    break
+
+                steps[k] += 1
+
+                if steps[k] == period[k]:
+                    saved_r[k], saved_i[k] = zr[k], zi[k]
+                    steps[k] = 0
+                    period[k] *= 2
+
+        r2 = zr[k] * zr[k] + zi[k] * zi[k]
+
+        if status[k] == ACTIVE and r2 > bailout:
+            status[k] = ESCAPED
+            norm[index[k]] = np.sqrt(r2)
+
+        count[index[k]] = n
+
+
+@lru_cache(maxsize=None)
+def _resume_kernel(formula):
+    """`_resume_points` with `formula` bound, see `src.compute._escape_kernel`."""
+    degree, conjugate, absolute = formula
+
+    @jit(nopython=True)
+    def resume_kernel(
+        index,
+        x,
+        y,
+        c_re,
+        c_im,
+        julia,
+        max_iter,
+        interior_check,
+        zr,
+        zi,
+        saved_r,
+        saved_i,
+        period,
+        steps,
+        count,
+        norm,
+        status,
+    ):
+        _resume_points(
+            index,
+            x,
+            y,
+            c_re,
+            c_im,
+            julia,
+            degree,
+            conjugate,
+            absolute,
+            max_iter,
+            interior_check,
+            zr,
+            zi,
+            saved_r,
+            saved_i,
+            period,
+            steps,
+            count,
+            norm,
+            status,
+        )
+
+    return resume_kernel
+
+
+class RenderState:
+    """
+    Iteration state of a Mandelbrot or Julia set view.
+
+    Parameters
+    ----------
+    center : complex, optional
+        Center point of the view. By default, -0.5 for the Mandelbrot set
+        and 0 for Julia sets.
+    zoom : float, default 1
+        Zoom ratio.
+    number_points : int, default 300
+        Number of points along each axis.
+    c : complex, optional
+        If given, iterate the Julia set of `c` instead of the Mandelbrot set.
+    interior_check : bool, default False
+        See `compute_mandelbrot`.
+    dtype : {numpy.float64, numpy.float32}, default numpy.float64
+        Floating point type of the iterates and of the fields.
+    formula : str or Formula, default "mandelbrot"
+        Iterated formula, see `src.formulas.FORMULAS`.
+
+    Attributes
+    ----------
+    max_iter : int
+        Number of iterations done so far, initially 0.
+    index : numpy.ndarray
+        Flat indices of the points still bounded after `max_iter`
+        iterations, the only ones iterated by the next `iterate`.
+    """
+
+    def __init__(
+        self,
+        center: complex = None,
+        zoom: float = 1,
+        number_points: int = 300,
+        c: complex = None,
+        interior_check: bool = False,
+        dtype: type = np.float64,
+        formula: Union[str, Formula] = "mandelbrot",
+    ):
+        julia = c is not None
+
+        if center is None:
+            center = 0 if julia else -0.5
+
+        self.center = center
+        self.zoom = zoom
+        self.c = c
+        self.interior_check = interior_check
+        self.formula = get_formula(formula)
+        self.max_iter = 0
+
+        xlim, ylim = _set_limits(center, zoom)
+        self._x, self._y = _create_axes(xlim, ylim, number_points, dtype)
+        self._julia = julia
+        self._c_re = self._x.dtype.type(np.real(c) if julia else 0)
+        self._c_im = self._x.dtype.type(np.imag(c) if julia else 0)
+
+        shape = (self._y.size, self._x.size)
+        self._count = np.zeros(shape, dtype=np.int64)
+        self._norm = np.zeros(shape, dtype=dtype)
+        self._escaped = np.zeros(shape, dtype=np.bool_)
+
+        # Orbits start from the grid points for Julia sets, and 0 otherwise
+        self.index = np.arange(self._count.size)
+        rows, cols = np.divmod(self.index, self._x.size)
+        self._zr = self._x[cols] if julia else np.zeros_like(self._x[cols])
+        self._zi = self._y[rows] if julia else np.zeros_like(self._y[rows])
+        self._saved_r = self._zr.copy()
+        self._saved_i = self._zi.copy()
+        self._period = np.ones(self.index.size, dtype=np.int64)
+        self._steps = np.zeros(self.index.size, dtype=np.int64)
+
+    def iterate(self, max_iter: int) -> "RenderState":
+        """
+        Iterate the points still bounded up to `max_iter` iterations.
+
+        Points that escaped or were found in the interior of the set are not
+        iterated again. Returns the state itself.
+        """
+        max_iter = int(max_iter)
+
+        assert max_iter >= self.max_iter, "`max_iter` cannot be lowered"
+
+        status = np.empty(self.index.size, dtype=np.uint8)
+        kernel = _resume_kernel(self.formula)
+        count = self._count.reshape(-1)
+        previous = count[self.index]
+
+        with stage("iterate"):
+            kernel(
+                self.index,
+                self._x,
+                self._y,
+                self._c_re,
+                self._c_im,
+                self._julia,
+                max_iter,
+                self.interior_check,
+                self._zr,
+                self._zi,
+                self._saved_r,
+                self._saved_i,
+                self._period,
+                self._steps,
+                count,
+                self._norm.reshape(-1),
+                status,
+            )
+
+        # Points resume from their last iterate, so that `count_sum` is the
+        # number of iterations of this call
+        record_iterated(count[self.index] - previous)
+
+        self._escaped.reshape(-1)[self.index[status == ESCAPED]] = True
+        self.max_iter = max_iter
+
+        # Only the points still bounded are kept, as a dense list
+        active = status == ACTIVE
+        self.index = self.index[active]
+        self._zr, self._zi = self._zr[active], self._zi[active]
+        self._saved_r = self._saved_r[active]
+        self._saved_i = self._saved_i[active]
+        self._period, self._steps = self._period[active], self._steps[active]
+
+        return self
+
+    def field(self, smoothing: bool = False) -> np.ndarray:
+        """
+        Number of iterations of each point after `max_iter` iterations,
+        with rows along the imaginary axis.
+
+        Parameters
+        ----------
+        smoothing : bool, default False
+            If True, apply continuous color smoothing.
+        """
+        count = np.where(self._escaped, self._count, self.max_iter)
+
+        if smoothing:
+            with stage("smoothing"):
+                count = _apply_smoothing(
+                    count, self._norm, self.max_iter, self.formula.degree
+                )
+
+        count = count.astype(self._x.dtype)
+        record_field(count, self.max_iter)
+
+        return count
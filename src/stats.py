@@ -0,0 +1,182 @@
+"""
+Opt-in statistics of renders: per-stage timings and iteration counts.
+
+Statistics are only collected inside a `render_stats` context, otherwise
+the hooks of the compute and plot functions do nothing::
+
+    with render_stats() as stats:
+        plot_mandelbrot(zoom=100, max_iter=1000)
+
+    stats.records  # [{"function": "plot_mandelbrot", "time_iterate": ...}]
+
+Each call of an instrumented function makes a record, unless a record is
+already open, e.g. with `RenderStats.frame` for the frames of an animation.
+"""
+
+import csv
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class RenderStats:
+    """
+    Records of statistics, one per frame or instrumented call.
+
+    Records have the labels of the frame and, for each stage of the render
+    (e.g. "grid", "iterate", "smoothing", "imshow", "savefig"), its time in
+    seconds as ``time_<stage>``. For the fields computed, records have:
+
+    - ``points``: number of points of the fields.
+    - ``escaped`` and ``interior``: fractions of points that escaped and
+      that reached `max_iter`.
+    - ``iterated``: number of points passed to the kernels. Points mirrored
+      from the other half of symmetric views, filled by adaptive subdivision
+      or read from a field cache are not iterated, while supersampling adds
+      its samples.
+    - ``count_sum``: sum of the values the kernels returned for the points
+      iterated. It is not the number of iterations performed: points found
+      in the main bulbs or attracted to a cycle count as `max_iter`, and
+      smoothed values add fractions. `RenderState.iterate` records the
+      iterations of its call.
+    - ``count_sum_per_second``: `count_sum` over the "iterate" time.
+    """
+
+    def __init__(self):
+        self.records: List[dict] = []
+        self._record: Optional[dict] = None
+        self._escaped = 0
+
+    @contextmanager
+    def frame(self, **labels) -> Iterator[dict]:
+        """Open a record, or add `labels` to the one already open."""
+        if self._record is not None:
+            for key, value in labels.items():
+                self._record.setdefault(key, value)
+
+            yield self._record
+            return
+
+        self._record = dict(labels, points=0, iterated=0, count_sum=0.0)
+        self._escaped = 0
+        start = time.perf_counter()
+
+        try:
+            yield self._record
+        finally:
+            record, self._record = self._record, None
+            record["time_total"] = time.perf_counter() - start
+
+            if record["points"]:
+                record["escaped"] = self._escaped / record["points"]
+                record["interior"] = 1 - record["escaped"]
+
+            if record.get("time_iterate"):
+                record["count_sum_per_second"] = (
+                    record["count_sum"] / record["time_iterate"]
+                )
+
+            self.records.append(record)
+
+    def add_time(self, stage: str, seconds: float):
+        if self._record is not None:
+            key = f"time_{stage}"
+            self._record[key] = self._record.get(key, 0.0) + seconds
+
+    def add_field(self, count: np.ndarray, max_iter: int):
+        if self._record is not None:
+            self._record["points"] += count.size
+            self._escaped += int(np.count_nonzero(count < max_iter))
+
+    def add_iterated(self, points: int, count_sum: float):
+        if self._record is not None:
+            self._record["iterated"] += int(points)
+            self._record["count_sum"] += float(count_sum)
+
+    def save(self, path: Path):
+        """Save the records, see `save_records`."""
+        save_records(self.records, path)
+
+
+def save_records(records: List[dict], path: Path):
+    """Save records as CSV if `path` ends with ``.csv``, else as JSON."""
+    if path.suffix != ".csv":
+        path.write_text(json.dumps(records, indent=4))
+        return
+
+    fields = []
+
+    for record in records:
+        fields += [key for key in record if key not in fields]
+
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+_active: Optional[RenderStats] = None
+
+
+@contextmanager
+def render_stats() -> Iterator[RenderStats]:
+    """Collect the statistics of the renders run inside the context."""
+    global _active
+
+    previous, _active = _active, RenderStats()
+
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current render, if statistics are collected."""
+    if _active is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        _active.add_time(name, time.perf_counter() - start)
+
+
+def record_field(count: np.ndarray, max_iter: int):
+    """Count the points of a field, if statistics are collected."""
+    if _active is not None:
+        _active.add_field(count, max_iter)
+
+
+def record_iterated(values: np.ndarray, filled: Tuple[int, float] = None):
+    """
+    Count the points a kernel wrote to `values`, if statistics are
+    collected, except the number of points `filled` and the sum of their
+    values, as returned by `src.compute._mariani_silver`.
+    """
+    if _active is not None:
+        points, total = filled or (0, 0.0)
+        _active.add_iterated(values.size - points, np.sum(values) - total)
+
+
+def instrumented(function: Callable) -> Callable:
+    """Record each call of `function`, if statistics are collected."""
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if _active is None:
+            return function(*args, **kwargs)
+
+        with _active.frame(function=function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,240 @@
+"""
+Map tiles of the sets, for slippy map viewers such as Leaflet.
+
+Tiles follow the XYZ scheme of web maps: at level `z`, the default view of
+a set (see `_set_limits`) is split into ``2**z`` by ``2**z`` tiles, indexed
+by `x` from the left and `y` from the top. Quadkeys, as in Bing maps,
+encode the same tiles as strings of base 4 digits, one per level.
+
+The points of a tile are the centers of its pixels, so that neighboring
+tiles join without seams, and its colors map 0 to `max_iter` iterations,
+so that they match between tiles.
+"""
+
+import io
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.cache import CACHE_DIR, FieldCache, _evict_files
+from src.colorize import colorize
+from src.compute import _set_limits, compute_julia, compute_mandelbrot
+from src.png import write_png
+
+TILE_PX = 256
+
+# Deepest level, beyond which pixels are below float64 resolution
+MAX_LEVEL = 36
+
+CENTERS = {"mandelbrot": -0.5, "julia": 0}
+
+# Version of the images of `render_tile`, in the keys of `TileCache`, so that
+# tiles cached by previous versions are rendered again
+TILE_VERSION = 2
+
+
+def quadkey_to_tile(quadkey: str) -> Tuple[int, int, int]:
+    """Level, column and row of the tile of `quadkey`."""
+    assert set(quadkey) <= set("0123"), "`quadkey` must be base 4 digits"
+
+    x, y = 0, 0
+
+    for digit in quadkey:
+        x = 2 * x + (int(digit) & 1)
+        y = 2 * y + (int(digit) >> 1)
+
+    return len(quadkey), x, y
+
+
+def tile_to_quadkey(z: int, x: int, y: int) -> str:
+    """Quadkey of the tile at level `z`, column `x` and row `y`."""
+    return "".join(
+        str(((x >> k) & 1) + 2 * ((y >> k) & 1)) for k in range(z - 1, -1, -1)
+    )
+
+
+def tile_view(
+    kind: str, z: int, x: int, y: int, size: int = TILE_PX
+) -> Tuple[complex, float]:
+    """
+    Center and zoom ratio of a tile, for `compute_mandelbrot` or
+    `compute_julia` with ``number_points=size``.
+    """
+    assert kind in CENTERS, f"`kind` must be one of {set(CENTERS)}"
+    assert 0 <= x < 2**z and 0 <= y < 2**z, "tile is outside of level `z`"
+
+    xlim, ylim = _set_limits(CENTERS[kind], 1)
+    side = (xlim[1] - xlim[0]) / 2**z
+
+    center = complex(xlim[0] + (x + 0.5) * side, ylim[1] - (y + 0.5) * side)
+
+    # Limits of the grid are the centers of the border pixels
+    return center, 2**z * size / (size - 1)
+
+
+@lru_cache(maxsize=None)
+def _lut(cmap: str) -> np.ndarray:
+    from src.utils import cmap_lut, linear_cmap
+
+    return cmap_lut(linear_cmap(cmap, N=4096))
+
+
+def render_tile(
+    kind: str,
+    z: int,
+    x: int,
+    y: int,
+    max_iter: int = 200,
+    cmap: str = "ultra",
+    c: complex = None,
+    formula: str = "mandelbrot",
+    size: int = TILE_PX,
+) -> bytes:
+    """
+    Render a tile of the Mandelbrot set, or of the Julia set of `c`, as PNG.
+
+    Parameters
+    ----------
+    kind : {"mandelbrot", "julia"}
+        Set of the tile.
+    z, x, y : int
+        Level, column and row of the tile.
+    max_iter : int, default 200
+        Maximum number of iterations.
+    cmap : str, default "ultra"
+        Colormap name in `src.utils.CMAPS`.
+    c : complex, optional
+        Constant of the Julia set. Required if `kind` is "julia".
+    formula : str, default "mandelbrot"
+        Iterated formula, see `src.formulas.FORMULAS`.
+    size : int, default `TILE_PX`
+        Side of the tile in pixels.
+
+    Returns
+    -------
+    bytes
+        PNG image of the tile.
+    """
+    center, zoom = tile_view(kind, z, x, y, size)
+    params = {
+        "center": center,
+        "zoom": zoom,
+        "max_iter": max_iter,
+        "number_points": size,
+        "smoothing": True,
+        "formula": formula,
+    }
+
+    if kind == "julia":
+        assert c is not None, "`c` is required for Julia sets"
+
+        count = compute_julia(c, **params)
+    else:
+        count = compute_mandelbrot(**params)
+
+    # Images of `colorize` start from the top of the imaginary axis, as
+    # tiles do
+    file = io.BytesIO()
+    image = colorize(count, _lut(cmap), vmin=0, vmax=max_iter)
+    write_png(file, [image], size, size)
+
+    return file.getvalue()
+
+
+class TileCache:
+    """
+    Least recently used cache of PNG tiles, in memory and on disk.
+
+    Methods may be called from several threads.
+
+    Parameters
+    ----------
+    directory : Path, optional
+        Directory of the ``.png`` files. If None, only the memory cache is
+        used.
+    max_items : int, default 4096
+        Maximum number of tiles kept in memory.
+    max_bytes : int, default 1 GiB
+        Maximum size of the files in `directory`, checked every
+        `evict_every` new tiles.
+    evict_every : int, default 256
+        Number of tiles stored between evictions of the files.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = CACHE_DIR.joinpath("tiles"),
+        max_items: int = 4096,
+        max_bytes: int = 2**30,
+        evict_every: int = 256,
+    ):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self._n_puts = 0
+
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(**params) -> str:
+        """Key of the tile of `params`, see `FieldCache.key`."""
+        return FieldCache.key(version=TILE_VERSION, **params)
+
+    def _path(self, key: str) -> Path:
+        return self.directory.joinpath(f"{key}.png")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the PNG tile of `key`, if cached."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+
+                return self._memory[key]
+
+        if self.directory is None:
+            return None
+
+        try:
+            data = self._path(key).read_bytes()
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return None
+
+        self._remember(key, data)
+
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store the PNG tile of `key`."""
+        self._remember(key, data)
+
+        if self.directory is None:
+            return
+
+        tmp_path = self.directory.joinpath(f"{key}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._n_puts += 1
+            evict = self._n_puts % self.evict_every == 0
+
+        if evict:
+            _evict_files(self.directory, "*.png", self.max_bytes)
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
@@ -0,0 +1,283 @@
+"""
+Out-of-core rendering of views too large for memory, such as posters.
+
+Views are rendered tile by tile into a ``.npy`` file, so that memory is
+bounded by the size of a tile, whose rows are iterated by all numba
+threads. Rendered tiles are recorded in a JSON file next to it, and
+an interrupted render resumes with the remaining tiles. An overview
+downsampled by block means is written along with the tiles, and
+`save_png` colors a field to a PNG file band by band, without loading it.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Tuple, Union
+
+import numpy as np
+
+from src.cache import FieldCache
+from src.colorize import colorize
+from src.compute import _create_axes, _render, _set_limits
+from src.formulas import Formula, get_formula
+from src.png import write_png
+
+# Side of the tiles, and number of rows colored at once by `save_png`
+TILE_SIZE = 2048
+BAND_ROWS = 256
+
+
+def _open_memmap(path, shape, dtype, resume):
+    """Memory map of `path`, and whether it was reopened rather than created."""
+    if resume and path.exists():
+        field = np.load(path, mmap_mode="r+")
+
+        if field.shape == shape and field.dtype == dtype:
+            return field, True
+
+    return np.lib.format.open_memmap(path, "w+", dtype, shape), False
+
+
+def _write_tile(file, field, tile, i0, j0):
+    """Write `tile` at row `i0` and column `j0` of the ``.npy`` `field`."""
+    row_bytes = field.shape[1] * field.itemsize
+
+    for i, row in enumerate(tile.astype(field.dtype), i0):
+        file.seek(field.offset + i * row_bytes + j0 * field.itemsize)
+        file.write(row.tobytes())
+
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def _block_means(tile, factor):
+    """Means of the `factor` x `factor` blocks of `tile`, partial included."""
+    rows = np.arange(0, tile.shape[0], factor)
+    cols = np.arange(0, tile.shape[1], factor)
+
+    sums = np.add.reduceat(np.add.reduceat(tile, rows, axis=0), cols, axis=1)
+    sizes = np.outer(
+        np.diff(np.append(rows, tile.shape[0])),
+        np.diff(np.append(cols, tile.shape[1])),
+    )
+
+    return sums / sizes
+
+
+def overview_path(path: Path) -> Path:
+    """Path of the overview of the field at `path`."""
+    path = Path(path)
+
+    return path.with_name(f"{path.stem}-overview.npy")
+
+
+def render_tiles(
+    path: Path,
+    number_points: int,
+    max_iter: int = 200,
+    center: complex = None,
+    zoom: float = 1,
+    c: complex = None,
+    smoothing: bool = True,
+    interior_check: bool = False,
+    formula: Union[str, Formula] = "mandelbrot",
+    dtype: type = np.float32,
+    tile_size: int = TILE_SIZE,
+    overview: int = 16,
+    resume: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Render a Mandelbrot or Julia set view to a memory-mapped file by tiles.
+
+    Parameters
+    ----------
+    path : Path
+        ``.npy`` file of the field. Its progress is recorded in a ``.json``
+        file and its overview in ``<stem>-overview.npy``, next to it.
+    number_points : int
+        Number of points along each axis, e.g. 50000 for a poster.
+    max_iter : int, default 200
+        Maximum number of iterations.
+    center : complex, optional
+        Center point of the view. By default, -0.5 for the Mandelbrot set
+        and 0 for Julia sets.
+    zoom : float, default 1
+        Zoom ratio.
+    c : complex, optional
+        If given, render the Julia set of `c` instead of the Mandelbrot set.
+    smoothing : bool, default True
+        If True, apply continuous color smoothing.
+    interior_check : bool, default False
+        See `src.compute.compute_mandelbrot`.
+    formula : str or Formula, default "mandelbrot"
+        Iterated formula, see `src.formulas.FORMULAS`.
+    dtype : type, default numpy.float32
+        Floating point type of the files. Points are iterated in float64.
+    tile_size : int, default `TILE_SIZE`
+        Side of the tiles. Memory use is about ``8 * tile_size**2`` bytes.
+    overview : int, default 16
+        Side of the blocks averaged to a point of the overview. Must divide
+        `tile_size`.
+    resume : bool, default True
+        If True, keep the tiles already rendered with the same parameters.
+
+    Returns
+    -------
+    field : numpy.ndarray
+        Read-only memory map of the number of iterations of each point,
+        with rows along the imaginary axis.
+    overview : numpy.ndarray
+        Read-only memory map of the block means of the field.
+    """
+    assert tile_size % overview == 0, "`overview` must divide `tile_size`"
+
+    path = Path(path)
+    julia = c is not None
+    number_points = int(number_points)
+    max_iter = int(max_iter)
+    formula = get_formula(formula)
+    dtype = np.dtype(dtype)
+
+    if center is None:
+        center = 0 if julia else -0.5
+
+    key = FieldCache.key(
+        number_points=number_points,
+        max_iter=max_iter,
+        center=center,
+        zoom=zoom,
+        c=c,
+        smoothing=smoothing,
+        interior_check=interior_check,
+        formula=formula,
+        dtype=dtype,
+        tile_size=tile_size,
+        overview=overview,
+    )
+
+    progress_path = path.with_suffix(".json")
+    progress = {"key": key, "tiles": {}}
+
+    if resume and progress_path.exists():
+        saved = json.loads(progress_path.read_text())
+
+        if saved["key"] == key:
+            progress = saved
+
+    # Tiles are written to the field file rather than to a memory map, so
+    # that pages of the field do not stay in memory
+    n_overview = -(-number_points // overview)
+    field, field_kept = _open_memmap(
+        path, (number_points, number_points), dtype, progress["tiles"]
+    )
+    small, small_kept = _open_memmap(
+        overview_path(path), (n_overview, n_overview), dtype, progress["tiles"]
+    )
+
+    # Tiles recorded as done are lost with a file created again, e.g. after
+    # it was deleted
+    if not (field_kept and small_kept):
+        progress["tiles"] = {}
+
+    xlim, ylim = _set_limits(center, zoom)
+    x, y = _create_axes(xlim, ylim, number_points, np.float64)
+    c_re, c_im = (np.real(c), np.imag(c)) if julia else (x[0], y[0])
+
+    with open(path, "r+b") as file:
+        for i0 in range(0, number_points, tile_size):
+            for j0 in range(0, number_points, tile_size):
+                name = f"{i0},{j0}"
+
+                if name in progress["tiles"]:
+                    continue
+
+                rows = slice(i0, min(i0 + tile_size, number_points))
+                cols = slice(j0, min(j0 + tile_size, number_points))
+                tile = np.empty((rows.stop - i0, cols.stop - j0))
+
+                _render(
+                    np.ascontiguousarray(x[cols]),
+                    np.ascontiguousarray(y[rows]),
+                    c_re,
+                    c_im,
+                    julia,
+                    max_iter,
+                    interior_check,
+                    smoothing,
+                    tile,
+                    formula=formula,
+                )
+
+                _write_tile(file, field, tile, i0, j0)
+                small[
+                    i0 // overview : -(-rows.stop // overview),  # noqa: E203
+                    j0 // overview : -(-cols.stop // overview),  # noqa: E203
+                ] = _block_means(tile, overview)
+
+                # Tiles are recorded once written to disk, to be resumed safely
+                small.flush()
+
+                progress["tiles"][name] = [
+                    float(tile.min()),
+                    float(tile.max()),
+                ]
+                tmp_path = progress_path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(progress))
+                os.replace(tmp_path, progress_path)
+
+    del field, small
+
+    return np.load(path, mmap_mode="r"), np.load(overview_path(path), "r")
+
+
+def field_limits(path: Path) -> Tuple[float, float]:
+    """Minimum and maximum of a field rendered by `render_tiles`."""
+    progress = json.loads(Path(path).with_suffix(".json").read_text())
+    limits = np.array(list(progress["tiles"].values()))
+
+    return float(limits[:, 0].min()), float(limits[:, 1].max())
+
+
+def save_png(
+    field: np.ndarray,
+    path: Path,
+    lut: np.ndarray,
+    vmin: float = None,
+    vmax: float = None,
+):
+    """
+    Color a field, such as a memory map of `render_tiles`, to a PNG file.
+
+    The field is read and colored by bands of `BAND_ROWS` rows, so that it
+    is never loaded in full.
+
+    Parameters
+    ----------
+    field : numpy.ndarray
+        Number of iterations of each point, with rows along the imaginary
+        axis.
+    path : Path
+        PNG file to write.
+    lut : numpy.ndarray
+        ``(N, 3)`` uint8 array of colors, such as from `src.utils.cmap_lut`.
+    vmin, vmax : float, optional
+        Values mapped to the first and last colors. If None, the minimum and
+        maximum of the field, read by bands. For renders of `render_tiles`,
+        `field_limits` gives them without reading the field.
+    """
+    height, width = field.shape
+    bands = [slice(i, i + BAND_ROWS) for i in range(0, height, BAND_ROWS)]
+
+    if vmin is None or vmax is None:
+        lower = min(np.min(field[rows]) for rows in bands)
+        upper = max(np.max(field[rows]) for rows in bands)
+        vmin = lower if vmin is None else vmin
+        vmax = upper if vmax is None else vmax
+
+    # Images start from the top of the imaginary axis, i.e. the last rows
+    images = (
+        colorize(np.asarray(field[rows]), lut, vmin, vmax)
+        for rows in reversed(bands)
+    )
+
+    write_png(path, images, width, height)
@@ -1,11 +1,17 @@
+from contextlib import ExitStack
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterable, Union
 
 import imageio
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib import font_manager
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.colors import Colormap, LinearSegmentedColormap
 from pygifsicle import optimize
 
+from src.png import read_indexed_png
+
 CMAPS = {
     "uwob": ["#265FD9", "white", "#D9A026", "black"],
     "ultra": [
@@ -58,6 +64,18 @@ def linear_cmap(name, N=256):
     return cmap
 
 
+def cmap_lut(cmap: Colormap) -> np.ndarray:
+    """
+    Lookup table of a colormap, e.g. from `linear_cmap`, for `colorize`.
+
+    Returns
+    -------
+    numpy.ndarray
+        ``(cmap.N, 3)`` uint8 array of RGB colors.
+    """
+    return cmap(np.arange(cmap.N), bytes=True)[:, :3]
+
+
 def set_plot_style(axis_lines: bool = False, font: str = None):
     plt.style.use("ggplot")
 
@@ -78,23 +96,89 @@ def set_plot_style(axis_lines: bool = False, font: str = None):
         plt.rcParams["font.family"] = font
 
 
+def _frame_sequence(n_frames: int, pause: int, back_loop: bool):
+    """Indices of the frames to write, in order."""
+    sequence = [0] * pause + list(range(n_frames)) + [n_frames - 1] * pause
+
+    if back_loop:
+        sequence += sequence[-2:0:-1]
+
+    return sequence
+
+
+def _read_frames(image_files, sequence, read=imageio.imread):
+    """Read the images of `sequence`, reusing repeated consecutive frames."""
+    index, image = None, None
+
+    for i in sequence:
+        if i != index:
+            index, image = i, read(image_files[i])
+
+        yield image
+
+
+def _read_indices(path):
+    return read_indexed_png(path)[0]
+
+
+def _stream_frames(frames, pause, back_loop, spool_dir):
+    """
+    Yield `frames` with pauses, keeping only the last frame in memory.
+
+    For `back_loop`, frames are also saved to `spool_dir` and read back.
+    """
+    spool_files = []
+    frame = None
+
+    for i, frame in enumerate(frames):
+        repeat = pause + 1 if i == 0 else 1
+
+        for _ in range(repeat):
+            yield frame
+
+        if back_loop:
+            spool_files.append(spool_dir.joinpath(f"{i}.npy"))
+            np.save(spool_files[-1], frame)
+
+    if frame is None:
+        raise ValueError("No frames to animate")
+
+    for _ in range(pause):
+        yield frame
+
+    if back_loop:
+        sequence = _frame_sequence(len(spool_files), pause, back_loop)
+        forward = len(spool_files) + 2 * pause
+
+        yield from _read_frames(spool_files, sequence[forward:], read=np.load)
+
+
 def animate(
-    input_dir: Path,
+    input_dir: Union[Path, Iterable[np.ndarray]],
     output_file: Path,
     fps: int = 30,
     pause: int = 0,
     back_loop: bool = False,
+    palette: np.ndarray = None,
     **kwargs,
 ) -> None:
     """
     Make an animated image or video from PNG images in a directory.
 
-    `imageio.help()` to see available formats.
+    Frames are appended to the output one at a time, so that memory usage
+    does not grow with the number of frames. `imageio.help()` to see
+    available formats.
+
+    With a `palette`, frames are palette indices, such as from
+    `src.colorize.palette_index`, and the GIF is written by
+    `src.gif.write_gif` without quantizing them nor optimizing it with
+    gifsicle.
 
     Parameters
     ----------
-    intput_dir : Path
-        Directory path containing PNG images.
+    input_dir : Path or iterable of numpy.ndarray
+        Directory path containing PNG images, or the images themselves as
+        ``(height, width, channels)`` uint8 arrays, e.g. from a generator.
     output_file : Path
         Output file path. If no extension is given, default to `.mp4`.
     fps : int, default 30
@@ -102,11 +186,23 @@ def animate(
     pause : int, default 0
         Number of repetitions of first and last frame.
     back_loop : bool, default False
-        If true, also play GIF backwards after finishing.
+        If true, also play GIF backwards after finishing. Frames given as
+        arrays are spooled to a temporary directory to be played again.
+    palette : numpy.ndarray, optional
+        ``(N, 3)`` uint8 array of the colors of the frames, which are then
+        ``(height, width)`` arrays of indices, or indexed PNG images written
+        by ``src.png.write_png(..., palette=palette)``. The output must be
+        a GIF.
+    **kwargs
+        Keyword arguments passed to `imageio.get_writer()`. Unused with a
+        `palette`.
+
     Raises
     ------
     FileNotFoundError
-        If no PNG images are found in `intput_dir`.
+        If no PNG images are found in `input_dir`.
+    ValueError
+        If `input_dir` is an empty iterable.
 
     Returns
     -------
@@ -116,21 +212,41 @@ def animate(
     if not output_file.suffix:
         output_file = output_file.with_suffix(".mp4")
 
-    image_files = [file for file in sorted(input_dir.glob("*.png"))]
+    with ExitStack() as stack:
+        if isinstance(input_dir, Path):
+            image_files = sorted(input_dir.glob("*.png"))
 
-    if not image_files:
-        raise FileNotFoundError("Images not found")
+            if not image_files:
+                raise FileNotFoundError("Images not found")
 
-    if pause:
-        image_files = (
-            image_files[:1] * pause + image_files + image_files[-1:] * pause
-        )
+            sequence = _frame_sequence(len(image_files), pause, back_loop)
+            frames = _read_frames(
+                image_files,
+                sequence,
+                imageio.imread if palette is None else _read_indices,
+            )
+        else:
+            spool_dir = None
 
-    if back_loop:
-        image_files = image_files + list(reversed(image_files[1:-1]))
+            if back_loop:
+                spool_dir = Path(stack.enter_context(TemporaryDirectory()))
+
+            frames = _stream_frames(input_dir, pause, back_loop, spool_dir)
+
+        if palette is not None:
+            from src.gif import write_gif
+
+            assert output_file.suffix == ".gif", "`palette` requires a GIF"
+
+            write_gif(output_file, frames, palette, fps)
+            return
+
+        writer = stack.enter_context(
+            imageio.get_writer(output_file, fps=fps, **kwargs)
+        )
 
-    images = [imageio.imread(file_name) for file_name in image_files]
-    imageio.mimwrite(output_file, images, fps=fps, **kwargs)
+        for frame in frames:
+            writer.append_data(frame)
 
     if output_file.suffix == ".gif":
         optimize(output_file)